@@ -0,0 +1,46 @@
+"""search columns and the listing index
+
+Adds the columns search.py maintains on ``content``, with full-text and
+trigram indexes on PostgreSQL (other backends use the in-process index in
+search.py), and the index behind keyset-paginated listings. Existing content
+is left unindexed for search until the ``backfill_search_columns`` task has
+run once.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 07:00:31.402117
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('content', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('search_document', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('search_vector', sa.Text().with_variant(postgresql.TSVECTOR(), 'postgresql'), nullable=True))
+        batch_op.create_index('ix_content_listing', ['content_type', 'is_published', 'id'], unique=False)
+
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_content_search_vector', 'content', ['search_vector'], postgresql_using='gin')
+        op.create_index(
+            'ix_content_search_document_trgm', 'content', ['search_document'],
+            postgresql_using='gin', postgresql_ops={'search_document': 'gin_trgm_ops'},
+        )
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        op.drop_index('ix_content_search_document_trgm', table_name='content')
+        op.drop_index('ix_content_search_vector', table_name='content')
+    with op.batch_alter_table('content', schema=None) as batch_op:
+        batch_op.drop_index('ix_content_listing')
+        batch_op.drop_column('search_vector')
+        batch_op.drop_column('search_document')
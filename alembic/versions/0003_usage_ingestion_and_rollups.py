@@ -0,0 +1,134 @@
+"""usage idempotency keys, rollup, trending and platform counter tables
+
+Adds the ``event_id`` key that makes buffered usage ingestion idempotent, the
+indexes the rollups read their sources by, and the tables maintained by
+trending.py, rollups.py and platform_metrics.py. The rollups fold existing
+usage and transactions on their first run from checkpoint 0.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 07:00:37.215663
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+CONTENT_TYPES = ('TOOL', 'PIPELINE', 'DATASET')
+
+
+def upgrade():
+    with op.batch_alter_table('usage_records', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('event_id', sa.String(), nullable=True))
+        # Named the way PostgreSQL names the constraint of ``unique=True``
+        batch_op.create_unique_constraint('usage_records_event_id_key', ['event_id'])
+        batch_op.create_index('ix_usage_records_content_created', ['content_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_index('ix_transactions_creator_created', ['creator_id', 'created_at'], unique=False)
+
+    op.create_table('rollup_checkpoints',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('last_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.create_table('content_usage_hourly',
+    sa.Column('content_id', sa.Integer(), nullable=False),
+    sa.Column('hour', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('usage_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['content_id'], ['content.id'], ),
+    sa.PrimaryKeyConstraint('content_id', 'hour')
+    )
+    with op.batch_alter_table('content_usage_hourly', schema=None) as batch_op:
+        batch_op.create_index('ix_content_usage_hourly_hour', ['hour'], unique=False)
+
+    op.create_table('trending_scores',
+    sa.Column('window', sa.String(), nullable=False),
+    sa.Column('content_id', sa.Integer(), nullable=False),
+    # The enum type itself was created with the content table
+    sa.Column('content_type', sa.Enum(*CONTENT_TYPES, name='contenttype').with_variant(
+        postgresql.ENUM(*CONTENT_TYPES, name='contenttype', create_type=False), 'postgresql'
+    ), nullable=False),
+    sa.Column('usage_count', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['content_id'], ['content.id'], ),
+    sa.PrimaryKeyConstraint('window', 'content_id')
+    )
+    with op.batch_alter_table('trending_scores', schema=None) as batch_op:
+        batch_op.create_index('ix_trending_scores_window_score', ['window', 'score', 'content_id'], unique=False)
+        batch_op.create_index('ix_trending_scores_window_type_score', ['window', 'content_type', 'score', 'content_id'], unique=False)
+
+    op.create_table('content_daily_rollups',
+    sa.Column('content_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('usage_count', sa.Integer(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.Column('distinct_users', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['content_id'], ['content.id'], ),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('content_id', 'day')
+    )
+    with op.batch_alter_table('content_daily_rollups', schema=None) as batch_op:
+        batch_op.create_index('ix_content_daily_rollups_creator_day', ['creator_id', 'day'], unique=False)
+
+    op.create_table('creator_daily_rollups',
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('usage_count', sa.Integer(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.Column('distinct_users', sa.Integer(), nullable=False),
+    sa.Column('transaction_count', sa.Integer(), nullable=False),
+    sa.Column('transaction_amount', sa.Float(), nullable=False),
+    sa.Column('creator_earnings', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('creator_id', 'day')
+    )
+    op.create_table('rollup_daily_users',
+    sa.Column('scope', sa.String(), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope', 'scope_id', 'day', 'user_id')
+    )
+    op.create_table('platform_counters',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('platform_counters')
+    op.drop_table('rollup_daily_users')
+    op.drop_table('creator_daily_rollups')
+    with op.batch_alter_table('content_daily_rollups', schema=None) as batch_op:
+        batch_op.drop_index('ix_content_daily_rollups_creator_day')
+
+    op.drop_table('content_daily_rollups')
+    with op.batch_alter_table('trending_scores', schema=None) as batch_op:
+        batch_op.drop_index('ix_trending_scores_window_type_score')
+        batch_op.drop_index('ix_trending_scores_window_score')
+
+    op.drop_table('trending_scores')
+    with op.batch_alter_table('content_usage_hourly', schema=None) as batch_op:
+        batch_op.drop_index('ix_content_usage_hourly_hour')
+
+    op.drop_table('content_usage_hourly')
+    op.drop_table('rollup_checkpoints')
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_index('ix_transactions_creator_created')
+
+    with op.batch_alter_table('usage_records', schema=None) as batch_op:
+        batch_op.drop_index('ix_usage_records_content_created')
+        batch_op.drop_constraint('usage_records_event_id_key', type_='unique')
+        batch_op.drop_column('event_id')
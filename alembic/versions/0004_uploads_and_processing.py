@@ -0,0 +1,103 @@
+"""uploaded file columns, upload sessions, blobs, analyses and reports
+
+Adds the file columns of ``content`` written by uploads and processing.py,
+and the tables behind chunked uploads, content-addressed storage, pipeline
+analysis and creator reports. Files uploaded before this keep their plain
+``file_path`` and have no processing status.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 07:00:42.870519
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('content', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_name', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('file_hash', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('file_size', sa.BigInteger(), nullable=True))
+        batch_op.add_column(sa.Column('file_metadata', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('processing_status', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('processing_error', sa.Text(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_content_file_hash'), ['file_hash'], unique=False)
+
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(), nullable=False),
+    sa.Column('total_size', sa.BigInteger(), nullable=False),
+    sa.Column('chunk_size', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('file_path', sa.String(), nullable=True),
+    sa.Column('sha256', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('upload_parts',
+    sa.Column('upload_id', sa.String(), nullable=False),
+    sa.Column('part_number', sa.Integer(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['upload_id'], ['upload_sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('upload_id', 'part_number')
+    )
+    op.create_table('storage_blobs',
+    sa.Column('sha256', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.create_table('pipeline_analyses',
+    sa.Column('file_hash', sa.String(), nullable=False),
+    sa.Column('version', sa.String(), nullable=False),
+    sa.Column('analysis', sa.JSON(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.PrimaryKeyConstraint('file_hash', 'version')
+    )
+    op.create_table('creator_reports',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('files', sa.JSON(), nullable=True),
+    sa.Column('summary', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['creator_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('creator_id', 'period', name='uq_creator_reports_creator_period')
+    )
+    with op.batch_alter_table('creator_reports', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_creator_reports_id'), ['id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('creator_reports', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_creator_reports_id'))
+
+    op.drop_table('creator_reports')
+    op.drop_table('pipeline_analyses')
+    op.drop_table('storage_blobs')
+    op.drop_table('upload_parts')
+    op.drop_table('upload_sessions')
+    with op.batch_alter_table('content', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_content_file_hash'))
+        batch_op.drop_column('processing_error')
+        batch_op.drop_column('processing_status')
+        batch_op.drop_column('file_metadata')
+        batch_op.drop_column('file_size')
+        batch_op.drop_column('file_hash')
+        batch_op.drop_column('file_name')
@@ -0,0 +1,50 @@
+"""indexes for catalogue and analytics queries
+
+Partial, published-only indexes for the listing filters and orderings, the
+creator lookups behind the dashboard and reports, and reviews per content.
+On PostgreSQL they are built concurrently so that live tables stay writable.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 07:00:48.326556
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def _indexes(true):
+    # Predicates are written the way each backend renders ``Content.is_published == True``;
+    # SQLite only uses a partial index when the query repeats its WHERE terms
+    published = f'is_published = {true}'
+    return [
+        ('content', 'ix_content_published_category', ['content_type', 'category', 'id'], published),
+        ('content', 'ix_content_featured', ['id'], f'{published} AND is_featured = {true}'),
+        ('content', 'ix_content_published_usage', ['usage_count', 'id'], published),
+        ('content', 'ix_content_published_type_usage', ['content_type', 'usage_count', 'id'], published),
+        ('content', 'ix_content_creator', ['creator_id', 'id'], None),
+        ('reviews', 'ix_reviews_content_created', ['content_id', 'created_at'], None),
+    ]
+
+
+def upgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for table, name, columns, where in _indexes('true'):
+                op.create_index(
+                    name, table, columns, postgresql_where=sa.text(where) if where else None,
+                    postgresql_concurrently=True, if_not_exists=True,
+                )
+    else:
+        for table, name, columns, where in _indexes('1'):
+            op.create_index(name, table, columns, sqlite_where=sa.text(where) if where else None)
+
+
+def downgrade():
+    for table, name, _, _ in reversed(_indexes('true')):
+        op.drop_index(name, table_name=table)
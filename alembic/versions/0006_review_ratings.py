@@ -0,0 +1,117 @@
+"""running review totals, Bayesian rating and one review per user
+
+Adds the columns maintained by ratings.py, backfills them from ``reviews``
+with the prior configured there, and indexes the Bayesian score for
+rating-ordered listings and ``min_rating`` filters. Where a user reviewed
+the same content more than once only the latest review is kept, so that one
+review per user can be enforced. Reviews are indexed in the id order they
+are listed in.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 09:12:37.118204
+"""
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# The prior of ratings.py, read from the same settings; reconcile_ratings corrects any later change
+RATING_PRIOR_MEAN = float(os.getenv('RATING_PRIOR_MEAN', '3.0'))
+RATING_PRIOR_WEIGHT = float(os.getenv('RATING_PRIOR_WEIGHT', '5'))
+
+reviews = sa.table('reviews', sa.column('id'), sa.column('content_id'), sa.column('user_id'), sa.column('rating'))
+content = sa.table(
+    'content', sa.column('id'), sa.column('creator_id'), sa.column('rating'), sa.column('rating_sum'),
+    sa.column('review_count'), sa.column('bayesian_rating'),
+)
+creator_profiles = sa.table(
+    'creator_profiles', sa.column('user_id'), sa.column('rating'), sa.column('rating_sum'), sa.column('review_count'),
+)
+
+
+def _mean(rating_sum, review_count):
+    return sa.case((review_count > 0, rating_sum * 1.0 / review_count), else_=0.0)
+
+
+def _bayesian(rating_sum, review_count):
+    shrunk = (
+        (sa.literal(RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN) + rating_sum)
+        / (sa.literal(RATING_PRIOR_WEIGHT) + review_count)
+    )
+    return sa.case((review_count > 0, shrunk), else_=0.0)
+
+
+def _dedupe_reviews():
+    latest = sa.select(sa.func.max(reviews.c.id)).group_by(reviews.c.content_id, reviews.c.user_id)
+    op.execute(reviews.delete().where(
+        reviews.c.content_id.is_not(None), reviews.c.user_id.is_not(None), reviews.c.id.not_in(latest),
+    ))
+
+
+def _backfill():
+    rating_sum = sa.select(sa.func.coalesce(sa.func.sum(reviews.c.rating), 0)).where(
+        reviews.c.content_id == content.c.id
+    ).scalar_subquery()
+    review_count = sa.select(sa.func.count()).where(reviews.c.content_id == content.c.id).scalar_subquery()
+    op.execute(content.update().values(rating_sum=rating_sum, review_count=review_count))
+    op.execute(content.update().values(
+        rating=_mean(content.c.rating_sum, content.c.review_count),
+        bayesian_rating=_bayesian(content.c.rating_sum, content.c.review_count),
+    ))
+
+    rating_sum = sa.select(sa.func.coalesce(sa.func.sum(content.c.rating_sum), 0)).where(
+        content.c.creator_id == creator_profiles.c.user_id
+    ).scalar_subquery()
+    review_count = sa.select(sa.func.coalesce(sa.func.sum(content.c.review_count), 0)).where(
+        content.c.creator_id == creator_profiles.c.user_id
+    ).scalar_subquery()
+    op.execute(creator_profiles.update().values(rating_sum=rating_sum, review_count=review_count))
+    op.execute(creator_profiles.update().values(
+        rating=_mean(creator_profiles.c.rating_sum, creator_profiles.c.review_count),
+    ))
+
+
+def upgrade():
+    op.add_column('content', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('content', sa.Column('bayesian_rating', sa.Float(), server_default='0', nullable=True))
+    op.add_column('creator_profiles', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=True))
+    op.add_column('creator_profiles', sa.Column('review_count', sa.Integer(), server_default='0', nullable=True))
+    _dedupe_reviews()
+    _backfill()
+
+    op.create_index('ux_reviews_content_user', 'reviews', ['content_id', 'user_id'], unique=True)
+    # Reviews are listed by keyset on id, which the created_at index cannot order
+    op.drop_index('ix_reviews_content_created', table_name='reviews')
+    op.create_index('ix_reviews_content_id', 'reviews', ['content_id', 'id'])
+    columns = ['content_type', 'bayesian_rating', 'id']
+    if op.get_context().dialect.name == 'postgresql':
+        # Built concurrently like the indexes in 0005, so content stays writable
+        with op.get_context().autocommit_block():
+            op.create_index(
+                'ix_content_published_type_rating', 'content', columns, postgresql_where=sa.text('is_published = true'),
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+    else:
+        op.create_index(
+            'ix_content_published_type_rating', 'content', columns, sqlite_where=sa.text('is_published = 1'),
+        )
+
+
+def downgrade():
+    op.drop_index('ix_content_published_type_rating', table_name='content')
+    op.create_index('ix_reviews_content_created', 'reviews', ['content_id', 'created_at'])
+    op.drop_index('ix_reviews_content_id', table_name='reviews')
+    op.drop_index('ux_reviews_content_user', table_name='reviews')
+    with op.batch_alter_table('creator_profiles') as batch_op:
+        batch_op.drop_column('review_count')
+        batch_op.drop_column('rating_sum')
+    with op.batch_alter_table('content') as batch_op:
+        batch_op.drop_column('bayesian_rating')
+        batch_op.drop_column('rating_sum')
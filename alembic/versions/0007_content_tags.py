@@ -0,0 +1,50 @@
+"""content_tags table for indexed tag filters
+
+Creates the one-row-per-tag mirror of ``content.tags`` maintained by
+facets.py and backfills it from the JSON column.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 10:41:05.502917
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+BACKFILL = {
+    'postgresql': """
+        INSERT INTO content_tags (tag, content_id)
+        SELECT DISTINCT tag.value, content.id
+        FROM content, json_array_elements_text(
+            CASE WHEN json_typeof(content.tags) = 'array' THEN content.tags ELSE '[]'::json END
+        ) AS tag(value)
+        WHERE tag.value <> ''
+    """,
+    'sqlite': """
+        INSERT INTO content_tags (tag, content_id)
+        SELECT DISTINCT tag.value, content.id
+        FROM content, json_each(CASE WHEN json_type(content.tags) = 'array' THEN content.tags ELSE '[]' END) AS tag
+        WHERE tag.type = 'text' AND tag.value <> ''
+    """,
+}
+
+
+def upgrade():
+    op.create_table('content_tags',
+    sa.Column('tag', sa.String(), nullable=False),
+    sa.Column('content_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['content_id'], ['content.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('tag', 'content_id')
+    )
+    op.create_index('ix_content_tags_content', 'content_tags', ['content_id'], unique=False)
+    op.execute(BACKFILL[op.get_context().dialect.name])
+
+
+def downgrade():
+    op.drop_index('ix_content_tags_content', table_name='content_tags')
+    op.drop_table('content_tags')
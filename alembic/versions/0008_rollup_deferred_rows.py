@@ -0,0 +1,30 @@
+"""rollup_deferred_rows for transactions that stay pending
+
+Lets the transaction rollup move its checkpoint past a transaction pending
+for longer than ``ROLLUP_PENDING_WAIT_SECONDS`` and fold it once it settles
+(see rollups.py).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 16:22:41.093812
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rollup_deferred_rows',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('source_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name', 'source_id')
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_deferred_rows')
@@ -0,0 +1,35 @@
+"""pipeline analysis status, error and request time
+
+Records pending and failed analyses next to ready ones, so that the analysis
+endpoint enqueues a workflow at most once per pending window or TTL (see
+pipeline_analysis.py). Existing analyses are ready.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 18:05:12.442190
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('pipeline_analyses', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(), server_default='ready', nullable=False))
+        batch_op.add_column(sa.Column('error', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('requested_at', sa.DateTime(timezone=True), nullable=True))
+        batch_op.alter_column('analysis', existing_type=sa.JSON(), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM pipeline_analyses WHERE analysis IS NULL")
+    with op.batch_alter_table('pipeline_analyses', schema=None) as batch_op:
+        batch_op.alter_column('analysis', existing_type=sa.JSON(), nullable=False)
+        batch_op.drop_column('requested_at')
+        batch_op.drop_column('error')
+        batch_op.drop_column('status')
@@ -0,0 +1,100 @@
+"""Compare benchmark results against a saved baseline.
+
+A scenario regresses when its p50 or p95 latency rises, or its throughput
+falls, by more than the threshold (10% by default), or when it runs more SQL
+statements per request than before. Exits 1 if any scenario regressed.
+
+    python -m benchmarks.compare benchmarks/baselines/main.json results.json --threshold 0.15
+
+Baselines are only comparable when taken on the same machine, database and
+scale with the same concurrency; differences in those are reported first.
+"""
+import argparse
+import json
+import sys
+
+DEFAULT_THRESHOLD = 0.10
+# Statements per request are averaged over the run; allow for a rare extra query
+QUERY_TOLERANCE = 0.05
+COMPARABLE_META = ("dialect", "target", "concurrency", "requests")
+# The use scenario adds usage records, so usage is expected to grow between runs
+COMPARABLE_SCALE = ("users", "content", "reviews")
+
+# (field, True when higher is better)
+CHECKS = (("p50_ms", False), ("p95_ms", False), ("throughput_rps", True))
+
+
+def _change(before, after):
+    return (after - before) / before if before else 0.0
+
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """One row per scenario in both results: ``(scenario, {field: (before, after, change)}, regressions)``."""
+    rows = []
+    for name, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        fields = {}
+        regressions = []
+        for field, higher_is_better in CHECKS:
+            change = _change(before[field], after[field])
+            fields[field] = (before[field], after[field], change)
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append(field)
+
+        queries_before, queries_after = before.get("queries_per_request"), after.get("queries_per_request")
+        if queries_before is not None and queries_after is not None:
+            fields["queries_per_request"] = (queries_before, queries_after, _change(queries_before, queries_after))
+            if queries_after > queries_before + QUERY_TOLERANCE:
+                regressions.append("queries_per_request")
+        if after.get("errors", 0) > before.get("errors", 0):
+            regressions.append("errors")
+        rows.append((name, fields, regressions))
+    return rows
+
+
+def report(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> int:
+    """Print the comparison; returns the exit status (1 on regression)."""
+    for key in COMPARABLE_META:
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"warning: {key} differs: baseline {baseline['meta'].get(key)!r}, now {current['meta'].get(key)!r}")
+    for key in COMPARABLE_SCALE:
+        before, after = baseline["meta"]["scale"].get(key), current["meta"]["scale"].get(key)
+        if before != after:
+            print(f"warning: number of {key} differs: baseline {before}, now {after}")
+
+    rows = compare(baseline, current, threshold)
+    print(f"{'scenario':<15}{'p50 ms':>20}{'p95 ms':>20}{'req/s':>22}{'queries':>16}  result")
+    for name, fields, regressions in rows:
+        cells = []
+        for field, width in (("p50_ms", 20), ("p95_ms", 20), ("throughput_rps", 22), ("queries_per_request", 16)):
+            if field not in fields:
+                cells.append(f"{'-':>{width}}")
+                continue
+            before, after, change = fields[field]
+            cells.append(f"{f'{before:.2f}>{after:.2f} {change:+.0%}':>{width}}")
+        print(f"{name:<15}{''.join(cells)}  {'REGRESSED ' + ', '.join(regressions) if regressions else 'ok'}")
+
+    missing = sorted(set(baseline["scenarios"]) - set(current["scenarios"]))
+    if missing:
+        print(f"not run: {', '.join(missing)}")
+    return 1 if any(regressions for _, _, regressions in rows) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative change in latency and throughput, e.g. 0.1 for 10%%")
+    args = parser.parse_args(argv)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    return report(baseline, current, args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
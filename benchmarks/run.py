@@ -0,0 +1,341 @@
+"""Drive the main endpoints concurrently and report throughput, latency and queries per request.
+
+By default requests go to the ASGI app in-process (httpx over ASGITransport, with
+the app's lifespan running), so no server or network is involved; ``--url``
+targets a local uvicorn instead, which must use the same ``DATABASE_URL`` and
+``SECRET_KEY`` as this process. Request parameters (ids, categories, users)
+are drawn from the database, which should have been filled by benchmarks.seed.
+
+Each scenario is warmed up, then run ``--repeat`` times; the reported figures
+are the medians across repeats. Latency is measured at the client, so
+in-process it includes httpx and ASGI overhead but no sockets. Queries per
+request come from the ``http_request_db_statements`` histogram on /metrics,
+scraped before and after each run, so metrics must be enabled.
+
+    python -m benchmarks.run --concurrency 16 --requests 2000 --output benchmarks/baselines/main.json
+    python -m benchmarks.run --baseline benchmarks/baselines/main.json
+
+Response-cached endpoints (listings, featured, trending) are mostly served from
+the cache after warmup; the ``X-Cache`` hit ratio is reported next to them.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import httpx
+from sqlalchemy import func, select
+
+from benchmarks import compare
+from benchmarks.seed import CATEGORIES, TAGS, WORDS
+from database import engine
+from models import Content, ContentType, Review, UsageRecord, User, UserRole
+from routes.auth import create_access_token
+
+BATCH_IDS = 50
+METRIC_LINE = re.compile(r'^http_request_db_statements_(sum|count)\{method="([^"]*)",route="([^"]*)"\} (\S+)$')
+
+
+class Context:
+    """Ids and vocabulary the scenarios draw their requests from."""
+
+    def __init__(self, rng: random.Random, limit: int = 5000):
+        self.rng = rng
+        with engine.connect() as conn:
+            published = select(Content.id).where(Content.is_published == True).order_by(Content.id).limit(limit)
+            self.content_ids = conn.scalars(published).all()
+            self.tool_ids = conn.scalars(published.where(Content.content_type == ContentType.TOOL)).all()
+            self.user_ids = conn.scalars(
+                select(User.id).where(User.role == UserRole.USER).order_by(User.id).limit(limit)
+            ).all()
+            self.creator_ids = conn.scalars(
+                select(User.id).where(User.role == UserRole.CREATOR).order_by(User.id).limit(limit)
+            ).all()
+            self.scale = {
+                "users": conn.scalar(select(func.count(User.id))),
+                "content": conn.scalar(select(func.count(Content.id))),
+                "reviews": conn.scalar(select(func.count(Review.id))),
+                "usage": conn.scalar(select(func.count(UsageRecord.id))),
+            }
+        if not self.tool_ids or not self.user_ids or not self.creator_ids:
+            raise SystemExit("The database has no published tools or users; run python -m benchmarks.seed first")
+        self._tokens = {}
+
+    def token(self, user_id: int) -> dict:
+        if user_id not in self._tokens:
+            self._tokens[user_id] = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+        return self._tokens[user_id]
+
+    def popular(self, ids) -> int:
+        # The seed makes low ids the popular ones; traffic follows
+        return ids[min(int(len(ids) * self.rng.random() ** 2), len(ids) - 1)]
+
+    def words(self) -> str:
+        return " ".join(self.rng.sample(WORDS, self.rng.choice((1, 1, 2))))
+
+
+# Each scenario is (method, route template as labelled on /metrics, request builder)
+def _list_tools(ctx):
+    params = {"sort": ctx.rng.choice(("newest", "rating"))}
+    if ctx.rng.random() < 0.5:
+        params["category"] = ctx.rng.choice(CATEGORIES)
+    return {"url": "/api/tools/", "params": params}
+
+
+def _tool_detail(ctx):
+    return {"url": f"/api/tools/{ctx.popular(ctx.tool_ids)}"}
+
+
+def _search(ctx):
+    params = {"q": ctx.words(), "limit": 20}
+    if ctx.rng.random() < 0.3:
+        params["category"] = ctx.rng.choice(CATEGORIES)
+    return {"url": "/api/marketplace/search", "params": params}
+
+
+def _search_facets(ctx):
+    params = {"q": ctx.words(), "limit": 20, "include_facets": "true"}
+    if ctx.rng.random() < 0.3:
+        params["tag"] = ctx.rng.choice(TAGS)
+    return {"url": "/api/marketplace/search", "params": params}
+
+
+def _trending(ctx):
+    params = {"window": ctx.rng.choice(("24h", "7d", "30d"))}
+    if ctx.rng.random() < 0.5:
+        params["content_type"] = ctx.rng.choice(list(ContentType)).value
+    return {"url": "/api/marketplace/trending", "params": params}
+
+
+def _featured(ctx):
+    return {"url": "/api/marketplace/featured"}
+
+
+def _batch(ctx):
+    return {"url": "/api/marketplace/content/batch", "json": {"ids": ctx.rng.sample(ctx.content_ids, BATCH_IDS)}}
+
+
+def _reviews(ctx):
+    return {"url": f"/api/marketplace/content/{ctx.popular(ctx.content_ids)}/reviews", "params": {"limit": 20}}
+
+
+def _dashboard(ctx):
+    return {"url": "/api/analytics/creator/dashboard", "headers": ctx.token(ctx.popular(ctx.creator_ids))}
+
+
+def _use(ctx):
+    content_id = ctx.popular(ctx.content_ids)
+    return {
+        "url": f"/api/marketplace/use/{content_id}",
+        "json": {"content_id": content_id, "usage_type": "execution"},
+        "headers": ctx.token(ctx.rng.choice(ctx.user_ids)),
+    }
+
+
+# Reads first: the writes change what later scenarios would read
+SCENARIOS = {
+    "list_tools": ("GET", "/api/tools/", _list_tools),
+    "tool_detail": ("GET", "/api/tools/{tool_id}", _tool_detail),
+    "search": ("GET", "/api/marketplace/search", _search),
+    "search_facets": ("GET", "/api/marketplace/search", _search_facets),
+    "trending": ("GET", "/api/marketplace/trending", _trending),
+    "featured": ("GET", "/api/marketplace/featured", _featured),
+    "batch": ("POST", "/api/marketplace/content/batch", _batch),
+    "reviews": ("GET", "/api/marketplace/content/{content_id}/reviews", _reviews),
+    "dashboard": ("GET", "/api/analytics/creator/dashboard", _dashboard),
+    "use": ("POST", "/api/marketplace/use/{content_id}", _use),
+}
+
+
+def percentile(ordered, p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+async def statement_totals(client: httpx.AsyncClient) -> dict:
+    """``(method, route) -> (statements, requests)`` from the /metrics histogram."""
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    totals = {}
+    for line in response.text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            kind, method, route, value = match.groups()
+            statements, requests = totals.get((method, route), (0.0, 0.0))
+            totals[(method, route)] = (statements + float(value), requests) if kind == "sum" else (statements, requests + float(value))
+    return totals
+
+
+async def drive(client: httpx.AsyncClient, ctx: Context, method: str, build, requests: int, concurrency: int) -> dict:
+    """Send ``requests`` requests from ``concurrency`` workers; returns raw latencies and counts."""
+    latencies = []
+    errors = 0
+    cache_hits = cache_lookups = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors, cache_hits, cache_lookups
+        while remaining > 0:
+            remaining -= 1
+            request = build(ctx)
+            started_at = time.perf_counter()
+            try:
+                response = await client.request(method, **request)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started_at)
+            if response.status_code >= 400:
+                errors += 1
+            if "X-Cache" in response.headers:
+                cache_lookups += 1
+                cache_hits += response.headers["X-Cache"] == "HIT"
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        "elapsed": time.perf_counter() - started_at,
+        "latencies": sorted(latencies),
+        "errors": errors,
+        "cache_hit_ratio": cache_hits / cache_lookups if cache_lookups else None,
+    }
+
+
+async def run_scenario(client, ctx, name: str, args) -> dict:
+    method, route, build = SCENARIOS[name]
+    if args.warmup:
+        await drive(client, ctx, method, build, args.warmup, args.concurrency)
+
+    runs = []
+    for _ in range(args.repeat):
+        before = await statement_totals(client)
+        raw = await drive(client, ctx, method, build, args.requests, args.concurrency)
+        after = await statement_totals(client)
+        statements, requests = (
+            a - b for a, b in zip(after.get((method, route), (0.0, 0.0)), before.get((method, route), (0.0, 0.0)))
+        )
+        latencies = raw["latencies"] or [0.0]
+        runs.append({
+            "throughput_rps": args.requests / raw["elapsed"],
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            "queries_per_request": statements / requests if requests else None,
+            "errors": raw["errors"],
+            "cache_hit_ratio": raw["cache_hit_ratio"],
+        })
+
+    result = {"requests": args.requests, "repeats": args.repeat}
+    for key in runs[0]:
+        values = [run[key] for run in runs if run[key] is not None]
+        result[key] = statistics.median(values) if values else None
+    return result
+
+
+@asynccontextmanager
+async def open_client(url: str = None, concurrency: int = 1):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if url:
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+            yield client
+        return
+
+    import main
+    # Scrapes also read Celery queue depths; the benchmark runs without a broker
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60) as client:
+            yield client
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_results(results: dict) -> str:
+    lines = [
+        f"{'scenario':<15}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}{'cached':>8}"
+    ]
+    for name, stats in results["scenarios"].items():
+        queries = stats["queries_per_request"]
+        cached = stats["cache_hit_ratio"]
+        lines.append(
+            f"{name:<15}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+            f"{stats['p99_ms']:>10.2f}{'-' if queries is None else f'{queries:.2f}':>9}{stats['errors']:>8.0f}"
+            f"{'-' if cached is None else f'{cached:.0%}':>8}"
+        )
+    return "\n".join(lines)
+
+
+async def benchmark(args) -> dict:
+    ctx = Context(random.Random(args.seed))
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "dialect": engine.dialect.name,
+            "target": args.url or "in-process",
+            "scale": ctx.scale,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "scenarios": {},
+    }
+    async with open_client(args.url, args.concurrency) as client:
+        for name in args.scenarios:
+            results["scenarios"][name] = await run_scenario(client, ctx, name, args)
+            print(f"{name}: done", file=sys.stderr)
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", help="base URL of a running server; in-process when omitted")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario and repeat")
+    parser.add_argument("--warmup", type=int, default=50, help="unrecorded requests per scenario")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", help="compare against these saved results; exit 1 on regression")
+    parser.add_argument("--threshold", type=float, default=compare.DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(benchmark(args))
+    print(format_results(results))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            return compare.report(json.load(f), results, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""Seed a synthetic catalogue for the benchmarks.
+
+Creates users, creators, content, reviews, usage records and transactions at
+a chosen scale, deterministically from ``--seed``, then runs the same rollup,
+trending, rating and counter jobs Celery would, so the database looks like a
+deployment in steady state. Rows go in with Core executemany in batches, and
+the columns normally kept by mapper events (search columns, tags) are filled
+in the way catalogue.py does for bulk imports.
+
+Seed a fresh database (the schema is migrated first)::
+
+    DATABASE_URL=sqlite:////tmp/bench.sqlite python -m benchmarks.seed --scale small
+    DATABASE_URL=postgresql://localhost/bench python -m benchmarks.seed --scale medium --usage 5000000
+
+Seeded users cannot log in; the runner mints their tokens directly.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import bindparam, func, insert, select, update
+
+import facets
+import platform_metrics
+import ratings
+import rollups
+import search
+import trending
+from database import SessionLocal, engine
+from models import (
+    Content, ContentType, CreatorProfile, PricingModel, Review, Transaction, UsageRecord, User, UserRole,
+)
+
+SCALES = {
+    "tiny": {"users": 200, "creators": 20, "content": 1000, "reviews": 2000, "usage": 20000},
+    "small": {"users": 2000, "creators": 100, "content": 10000, "reviews": 30000, "usage": 300000},
+    "medium": {"users": 20000, "creators": 500, "content": 50000, "reviews": 200000, "usage": 2000000},
+    "large": {"users": 100000, "creators": 2000, "content": 200000, "reviews": 1000000, "usage": 10000000},
+}
+BATCH_SIZE = 10000
+HISTORY_DAYS = 90
+
+# Shared with the runner, which draws search terms and filters from the same vocabulary
+WORDS = (
+    "aligner", "variant", "caller", "assembler", "annotation", "expression", "pipeline", "genome", "protein",
+    "structure", "single", "cell", "rna", "dna", "methylation", "peak", "quality", "trimming", "mapping",
+    "phylogeny", "metagenome", "proteomics", "spectra", "docking", "imaging", "segmentation", "counts",
+    "differential", "splicing", "fusion", "coverage", "haplotype", "imputation", "ancestry", "microbiome",
+)
+CATEGORIES = ("genomics", "transcriptomics", "proteomics", "metagenomics", "epigenomics", "imaging", "structural")
+TAGS = (
+    "python", "r", "nextflow", "cwl", "docker", "gpu", "bwa", "gatk", "star", "salmon", "seurat", "scanpy",
+    "qc", "variant-calling", "assembly", "long-reads", "short-reads", "hpc", "cloud", "benchmark",
+)
+USAGE_TYPES = ("execution", "download", "view")
+
+
+def _batches(rows, size: int = BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(table, rows, returning=None) -> list:
+    """Insert ``rows`` in batches, one transaction each; returns the ``returning`` column if given."""
+    returned = []
+    stmt = insert(table)
+    if returning is not None:
+        stmt = stmt.returning(returning, sort_by_parameter_order=True)
+    for batch in _batches(rows):
+        with engine.begin() as conn:
+            result = conn.execute(stmt, batch)
+            if returning is not None:
+                returned.extend(result.scalars().all())
+    return returned
+
+
+def _skewed(rng: random.Random, n: int) -> int:
+    """An index below ``n`` where low indexes are far more popular, as catalogue usage is."""
+    return min(int(n * rng.random() ** 3), n - 1)
+
+
+def _moment(rng: random.Random, now: datetime, days: int) -> datetime:
+    return now - timedelta(seconds=rng.random() * days * 86400)
+
+
+def _in_order(i: int, count: int, now: datetime) -> datetime:
+    """The ``i``-th of ``count`` moments spread evenly over the history, oldest first.
+
+    Usage and transactions are written in time order, so that id ranges map to
+    time as they do in production, without sorting millions of rows in memory.
+    """
+    return now - timedelta(days=HISTORY_DAYS) * (1 - i / count)
+
+
+def seed_users(rng, now, users: int, creators: int) -> tuple:
+    rows = (
+        {
+            "email": f"bench-user-{i}@example.com",
+            "username": f"bench-user-{i}",
+            "full_name": f"Bench User {i}",
+            "hashed_password": "!",  # matches no password
+            "role": UserRole.CREATOR if i < creators else UserRole.USER,
+            "is_verified": True,
+            "created_at": _moment(rng, now, 365),
+        }
+        for i in range(users)
+    )
+    user_ids = _insert(User.__table__, rows, returning=User.__table__.c.id)
+    creator_ids = user_ids[:creators]
+    _insert(CreatorProfile.__table__, (
+        {"user_id": user_id, "bio": "Synthetic benchmark creator", "research_areas": rng.sample(CATEGORIES, 2)}
+        for user_id in creator_ids
+    ))
+    return user_ids, creator_ids
+
+
+def _content_rows(rng, now, count: int, creator_ids, dialect_name: str):
+    types = list(ContentType)
+    pricing = list(PricingModel)
+    for i in range(count):
+        title = " ".join(rng.sample(WORDS, 3)).title()
+        description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40)))
+        tags = rng.sample(TAGS, rng.randint(1, 4))
+        category = rng.choice(CATEGORIES)
+        pricing_model = rng.choice(pricing)
+        yield {
+            "creator_id": creator_ids[_skewed(rng, len(creator_ids))],
+            "title": title,
+            "description": description,
+            "content_type": types[i % len(types)],
+            "category": category,
+            "tags": tags,
+            "pricing_model": pricing_model,
+            "price": 0.0 if pricing_model == PricingModel.FREE else round(rng.uniform(1, 250), 2),
+            "requirements": {},
+            "version": f"1.{rng.randint(0, 9)}.0",
+            "download_count": 0,
+            "is_published": rng.random() < 0.95,
+            "is_featured": rng.random() < 0.01,
+            "created_at": _moment(rng, now, 365),
+            **search.bulk_search_params(title, description, tags, category, dialect_name),
+        }
+
+
+def seed_content(rng, now, count: int, creator_ids) -> list:
+    dialect_name = engine.dialect.name
+    stmt = insert(Content.__table__).returning(
+        Content.__table__.c.id, Content.__table__.c.tags, sort_by_parameter_order=True,
+    )
+    if dialect_name == "postgresql":
+        stmt = stmt.values(search_vector=search.BULK_SEARCH_VECTOR)
+
+    content_ids = []
+    for batch in _batches(_content_rows(rng, now, count, creator_ids, dialect_name)):
+        with engine.begin() as conn:
+            created = conn.execute(stmt, batch).all()
+            tags = [tag for content_id, content_tags in created for tag in facets.tag_rows(content_id, content_tags)]
+            conn.execute(insert(facets.tag_table), tags)
+        content_ids.extend(content_id for content_id, _ in created)
+    return content_ids
+
+
+def seed_reviews(rng, now, count: int, user_ids, content_ids):
+    seen = set()
+    count = min(count, len(user_ids) * len(content_ids))
+
+    def rows():
+        while len(seen) < count:
+            key = (content_ids[_skewed(rng, len(content_ids))], rng.choice(user_ids))
+            if key in seen:
+                continue
+            seen.add(key)
+            yield {
+                "content_id": key[0],
+                "user_id": key[1],
+                "rating": rng.choices((1, 2, 3, 4, 5), weights=(1, 1, 3, 6, 5))[0],
+                "comment": "Synthetic review",
+                "created_at": _moment(rng, now, HISTORY_DAYS),
+            }
+
+    _insert(Review.__table__, rows())
+
+
+def seed_usage(rng, now, count: int, user_ids, content_ids, prices: dict, creators: dict) -> Counter:
+    usage_counts = Counter()
+
+    def usage_rows():
+        for i in range(count):
+            content_id = content_ids[_skewed(rng, len(content_ids))]
+            usage_counts[content_id] += 1
+            yield {
+                "user_id": rng.choice(user_ids),
+                "content_id": content_id,
+                "usage_type": rng.choice(USAGE_TYPES),
+                "cost": prices[content_id],
+                "created_at": _in_order(i, count, now),
+            }
+
+    _insert(UsageRecord.__table__, usage_rows())
+
+    def transaction_rows():
+        transactions = count // 10
+        for i in range(transactions):
+            content_id = content_ids[_skewed(rng, len(content_ids))]
+            amount = prices[content_id] or round(rng.uniform(1, 50), 2)
+            yield {
+                "user_id": rng.choice(user_ids),
+                "creator_id": creators[content_id],
+                "content_id": content_id,
+                "amount": amount,
+                "platform_fee": round(amount * 0.1, 2),
+                "creator_earnings": round(amount * 0.9, 2),
+                "transaction_id": f"bench-{i}",
+                "status": "completed",
+                "created_at": _in_order(i, transactions, now),
+            }
+
+    _insert(Transaction.__table__, transaction_rows())
+    return usage_counts
+
+
+def _store_usage_counts(usage_counts: Counter):
+    content = Content.__table__
+    stmt = update(content).where(content.c.id == bindparam("b_id")).values(usage_count=bindparam("b_count"))
+    for batch in _batches({"b_id": content_id, "b_count": n} for content_id, n in usage_counts.items()):
+        with engine.begin() as conn:
+            conn.execute(stmt, batch)
+
+
+def migrate():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = Config(os.path.join(root, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(root, "alembic"))
+    command.upgrade(config, "head")
+
+
+def seed(scale: dict, seed_value: int = 0, log=print) -> dict:
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    started_at = time.perf_counter()
+
+    def step(message):
+        log(f"[{time.perf_counter() - started_at:7.1f}s] {message}")
+
+    user_ids, creator_ids = seed_users(rng, now, scale["users"], scale["creators"])
+    step(f"{len(user_ids)} users, {len(creator_ids)} creators")
+    content_ids = seed_content(rng, now, scale["content"], creator_ids)
+    step(f"{len(content_ids)} content items")
+    seed_reviews(rng, now, scale["reviews"], user_ids, content_ids)
+    step(f"{scale['reviews']} reviews")
+
+    with engine.connect() as conn:
+        rows = conn.execute(select(Content.id, Content.price, Content.pricing_model, Content.creator_id)).all()
+    prices = {row.id: row.price if row.pricing_model == PricingModel.PAY_PER_USE else 0.0 for row in rows}
+    creators = {row.id: row.creator_id for row in rows}
+    usage_counts = seed_usage(rng, now, scale["usage"], user_ids, content_ids, prices, creators)
+    _store_usage_counts(usage_counts)
+    step(f"{scale['usage']} usage records, {scale['usage'] // 10} transactions")
+
+    # Nothing else writes while seeding, so the rollups need not wait for in-flight transactions
+    rollups.ROLLUP_SETTLE_SECONDS = 0
+    db = SessionLocal()
+    try:
+        ratings.reconcile_ratings(db)
+        rollups.fold_daily_usage(db)
+        rollups.fold_daily_transactions(db)
+        trending.refresh_trending(db, now=now)
+        platform_metrics.reconcile_counters(db)
+    finally:
+        db.close()
+    step("ratings, rollups, trending scores and platform counters computed")
+    return {"seed": seed_value, **scale}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, help=f"override the scale's number of {name}")
+    parser.add_argument("--seed", type=int, default=0, help="random seed; the same seed gives the same data")
+    args = parser.parse_args(argv)
+
+    scale = dict(SCALES[args.scale])
+    scale.update({name: getattr(args, name) for name in scale if getattr(args, name) is not None})
+    if scale["creators"] > scale["users"] or not scale["creators"] or not scale["content"]:
+        parser.error("need at least one creator and one content item, and no more creators than users")
+
+    migrate()
+    with engine.connect() as conn:
+        if conn.scalar(select(func.count(Content.id))):
+            print("The database already has content; seed a fresh one so that runs are comparable", file=sys.stderr)
+            return 1
+    seed(scale, args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""CPU time to build large listing responses, per 1,000 items.
+
+Requests big pages from the in-process app, each with a distinct dummy query
+parameter so that the response cache never answers, and reports process CPU
+time (database driver, ORM, serialization and ASGI, all in this process) per
+1,000 items served, as JSON and as NDJSON. Needs a seeded database with at
+least ``--items`` published tools (``python -m benchmarks.seed --scale small``).
+
+    python -m benchmarks.serialization --items 1000 --rounds 20
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import statistics
+import sys
+import time
+
+import httpx
+
+BATCH_MAX_IDS = 200
+
+# Unique across the run, so no request can be answered from the response cache
+_nocache = itertools.count()
+
+
+async def measure(client, method: str, url: str, rounds: int, **kwargs) -> tuple:
+    """Median CPU and wall milliseconds per request, and items per response."""
+    cpu, wall = [], []
+    items = 0
+    for i in range(rounds + 1):
+        params = {**kwargs.pop("params", {}), "nocache": next(_nocache)}
+        kwargs["params"] = params
+        started_cpu, started_wall = time.process_time(), time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        elapsed_cpu, elapsed_wall = time.process_time() - started_cpu, time.perf_counter() - started_wall
+        response.raise_for_status()
+        if response.headers["content-type"].startswith("application/x-ndjson"):
+            items = len(response.content.splitlines())
+        else:
+            body = response.json()
+            items = len(body["items"] if isinstance(body, dict) else body)
+        if i:  # the first request warms up
+            cpu.append(elapsed_cpu * 1000)
+            wall.append(elapsed_wall * 1000)
+    return statistics.median(cpu), statistics.median(wall), items
+
+
+async def run(args):
+    import main
+    from database import engine
+    from sqlalchemy import select
+    from models import Content
+
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+    with engine.connect() as conn:
+        ids = conn.scalars(
+            select(Content.id).where(Content.is_published == True).order_by(Content.id).limit(BATCH_MAX_IDS)
+        ).all()
+
+    ndjson = {"Accept": "application/x-ndjson"}
+    cases = (
+        ("tools JSON", "GET", "/api/tools/", {"params": {"limit": args.items}}),
+        ("tools NDJSON", "GET", "/api/tools/", {"params": {"limit": args.items}, "headers": ndjson}),
+        ("search JSON", "GET", "/api/marketplace/search", {"params": {"q": args.query, "limit": args.items}}),
+        ("search NDJSON", "GET", "/api/marketplace/search",
+         {"params": {"q": args.query, "limit": args.items}, "headers": ndjson}),
+        ("batch JSON", "POST", "/api/marketplace/content/batch", {"json": {"ids": ids}}),
+    )
+    print(f"{'response':<16}{'items':>7}{'CPU ms':>10}{'wall ms':>10}{'CPU ms / 1k items':>20}")
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            for name, method, url, kwargs in cases:
+                cpu, wall, items = await measure(client, method, url, args.rounds, **kwargs)
+                per_thousand = cpu * 1000 / items if items else float("nan")
+                print(f"{name:<16}{items:>7}{cpu:>10.1f}{wall:>10.1f}{per_thousand:>20.1f}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=1000, help="page size of the listing and search requests")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--query", default="genome", help="search terms; should match at least --items items")
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
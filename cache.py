@@ -0,0 +1,179 @@
+"""Two-tier caching: an in-process TTL LRU in front of an optional shared Redis tier.
+
+The Redis tier is enabled when ``CACHE_REDIS_URL`` (or ``REDIS_URL``) is set. Redis
+is treated as best effort: if it is unreachable the cache degrades to the local
+tier instead of failing the request.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError, WatchError
+
+logger = logging.getLogger(__name__)
+
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", os.getenv("REDIS_URL"))
+
+_redis = None
+
+# Every TieredCache by namespace, for the metrics endpoint
+caches = {}
+
+
+def get_redis():
+    """Shared async Redis client, or None when no Redis is configured."""
+    global _redis
+    if _redis is None and CACHE_REDIS_URL:
+        _redis = aioredis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+    return _redis
+
+
+class TTLCache:
+    """Thread-unsafe LRU cache with per-entry expiry, meant for use on the event loop."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    """Local TTL LRU backed by Redis under ``namespace``.
+
+    Values are cached locally as given; ``dumps``/``loads`` convert them to and
+    from the bytes stored in Redis. The local TTL bounds how long other
+    processes can serve an entry after it was invalidated elsewhere.
+
+    A value loaded while a concurrent ``delete`` invalidates the key must not be
+    written back afterwards. Callers that load from the source of truth take a
+    ``generation(key)`` token first and pass it to ``set``, which drops the
+    value if the key was deleted since, in this process or any other.
+    """
+
+    def __init__(self, namespace: str, dumps, loads, maxsize: int = 1024, ttl: float = 60.0, redis_ttl: float = 300.0):
+        self.namespace = namespace
+        self.dumps = dumps
+        self.loads = loads
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis_ttl = redis_ttl
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self._generations = {}  # key -> number of local deletes
+        caches[namespace] = self
+
+    def _redis_key(self, key) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _generation_key(self, key) -> str:
+        return f"{self.namespace}:generation:{key}"
+
+    async def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(self._redis_key(key))
+        except RedisError as exc:
+            self._redis_failed(exc)
+            return None
+        if raw is None:
+            return None
+
+        self.redis_hits += 1
+        value = self.loads(raw)
+        self.local.set(key, value)
+        return value
+
+    async def generation(self, key):
+        """Token for ``set`` of a value about to be loaded for ``key``."""
+        local = self._generations.get(key, 0)
+        client = get_redis()
+        if client is None:
+            return local, None
+        try:
+            return local, await client.get(self._generation_key(key)) or b""
+        except RedisError as exc:
+            self._redis_failed(exc)
+            return local, None
+
+    async def set(self, key, value, generation=None):
+        client = get_redis()
+        if client is not None:
+            try:
+                if generation is None:
+                    await client.set(self._redis_key(key), self.dumps(value), ex=int(self.redis_ttl))
+                elif generation[1] is not None and not await self._set_if_generation(client, key, value, generation[1]):
+                    return  # deleted elsewhere while the value was loading
+            except RedisError as exc:
+                self._redis_failed(exc)
+        if generation is not None and generation[0] != self._generations.get(key, 0):
+            return  # deleted in this process while the value was loading
+        self.local.set(key, value)
+
+    async def _set_if_generation(self, client, key, value, expected: bytes) -> bool:
+        """Store ``value`` in Redis unless the key's generation moved past ``expected``."""
+        try:
+            async with client.pipeline() as pipe:
+                await pipe.watch(self._generation_key(key))
+                if (await pipe.get(self._generation_key(key)) or b"") != expected:
+                    return False
+                pipe.multi()
+                pipe.set(self._redis_key(key), self.dumps(value), ex=int(self.redis_ttl))
+                await pipe.execute()
+                return True
+        except WatchError:
+            return False
+
+    async def delete(self, key):
+        self.local.delete(key)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            async with client.pipeline() as pipe:
+                pipe.incr(self._generation_key(key))
+                pipe.expire(self._generation_key(key), int(self.redis_ttl))
+                pipe.delete(self._redis_key(key))
+                await pipe.execute()
+        except RedisError as exc:
+            self._redis_failed(exc)
+
+    def _redis_failed(self, exc):
+        self.redis_errors += 1
+        logger.warning("Redis tier for %s cache unavailable: %s", self.namespace, exc)
@@ -0,0 +1,212 @@
+"""Bulk import and export of catalogue content.
+
+Import takes NDJSON (one ``ContentCreate`` object per line) or CSV with a
+header row (``tags`` separated by ``;``, ``requirements`` as JSON). The body
+is spooled to a temporary file as it arrives, then read back in batches of
+``batch_size`` records: each batch is parsed and validated on a worker thread
+and inserted with a single multi-row INSERT, then committed. Rows that fail
+validation are skipped and reported with their line number, so one bad row
+does not cost the whole file. Files attached through ``upload_id`` are not
+supported in bulk; such content is created with the per-item endpoints.
+
+Export streams the published catalogue as NDJSON straight from a server-side
+cursor, in the same shape the import accepts, plus ids and statistics.
+
+Bulk inserts bypass the ORM, so the search columns, the tag table and the
+catalogue version used by the response cache are maintained here explicitly.
+"""
+import csv
+import io
+import json
+import os
+import tempfile
+from itertools import islice
+
+import anyio
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import facets
+import search
+from database import AsyncSessionLocal
+from models import Content
+from schemas import ContentCreate
+
+CATALOGUE_IMPORT_BATCH_SIZE = int(os.getenv("CATALOGUE_IMPORT_BATCH_SIZE", "1000"))
+CATALOGUE_IMPORT_MAX_BATCH_SIZE = 10000
+CATALOGUE_IMPORT_MAX_SIZE = int(os.getenv("CATALOGUE_IMPORT_MAX_SIZE", str(256 * 1024 ** 2)))
+CATALOGUE_IMPORT_MAX_ERRORS = int(os.getenv("CATALOGUE_IMPORT_MAX_ERRORS", "1000"))
+CATALOGUE_EXPORT_BATCH_SIZE = int(os.getenv("CATALOGUE_EXPORT_BATCH_SIZE", "1000"))
+
+IMPORT_FORMATS = {"ndjson": "ndjson", "application/x-ndjson": "ndjson", "csv": "csv", "text/csv": "csv"}
+
+content_table = Content.__table__
+
+EXPORT_COLUMNS = (
+    content_table.c.id, content_table.c.creator_id, content_table.c.title, content_table.c.description,
+    content_table.c.content_type, content_table.c.category, content_table.c.tags, content_table.c.pricing_model,
+    content_table.c.price, content_table.c.requirements, content_table.c.version, content_table.c.download_count,
+    content_table.c.usage_count, content_table.c.rating, content_table.c.review_count, content_table.c.created_at,
+)
+
+
+def import_format(request: Request, requested: str = None) -> str:
+    media_type = requested or request.headers.get("content-type", "").split(";")[0].strip()
+    if media_type not in IMPORT_FORMATS:
+        raise HTTPException(status_code=415, detail="Send NDJSON (application/x-ndjson) or CSV (text/csv)")
+    return IMPORT_FORMATS[media_type]
+
+
+async def spool(request: Request):
+    """Copy the request body to an anonymous temporary file and return it rewound."""
+    spooled = anyio.wrap_file(await anyio.to_thread.run_sync(tempfile.TemporaryFile))
+    size = 0
+    try:
+        async for data in request.stream():
+            size += len(data)
+            if size > CATALOGUE_IMPORT_MAX_SIZE:
+                raise HTTPException(status_code=413, detail=f"Imports are limited to {CATALOGUE_IMPORT_MAX_SIZE} bytes")
+            await spooled.write(data)
+        await spooled.seek(0)
+    except BaseException:
+        await spooled.aclose()
+        raise
+    return spooled.wrapped
+
+
+def _csv_fields(row: dict) -> dict:
+    fields = {key: value for key, value in row.items() if key and value not in (None, "")}
+    if "tags" in fields:
+        tags = fields["tags"]
+        fields["tags"] = json.loads(tags) if tags.startswith("[") else [tag.strip() for tag in tags.split(";") if tag.strip()]
+    if "requirements" in fields:
+        fields["requirements"] = json.loads(fields["requirements"])
+    return fields
+
+
+def _records(text, fmt: str):
+    """Yield ``(line number, record)`` pairs, where a record is a dict of CSV fields,
+    a line of JSON or a ValueError describing why the line cannot be read."""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as exc:
+                yield reader.line_num, ValueError(f"Invalid CSV: {exc}")
+                continue
+            try:
+                yield reader.line_num, _csv_fields(row)
+            except ValueError as exc:
+                yield reader.line_num, ValueError(f"Invalid JSON in tags or requirements: {exc}")
+    else:
+        for number, line in enumerate(text, start=1):
+            if line.strip():
+                yield number, line
+
+
+def _validate(batch, creator_id: int, publish: bool, dialect_name: str):
+    rows, errors = [], []
+    for line, record in batch:
+        if isinstance(record, ValueError):
+            errors.append({"line": line, "errors": [str(record)]})
+            continue
+        try:
+            if isinstance(record, str):
+                record = ContentCreate.model_validate_json(record)
+            else:
+                record = ContentCreate.model_validate(record)
+        except ValidationError as exc:
+            errors.append({"line": line, "errors": [
+                f"{'.'.join(str(part) for part in error['loc']) or 'record'}: {error['msg']}" for error in exc.errors()
+            ]})
+            continue
+        if record.upload_id:
+            errors.append({"line": line, "errors": ["upload_id: files cannot be attached in a bulk import"]})
+            continue
+        rows.append({
+            "creator_id": creator_id,
+            "title": record.title,
+            "description": record.description,
+            "content_type": record.content_type,
+            "category": record.category,
+            "tags": record.tags or [],
+            "pricing_model": record.pricing_model,
+            "price": record.price,
+            "requirements": record.requirements or {},
+            "is_published": publish,
+            **search.bulk_search_params(record.title, record.description, record.tags, record.category, dialect_name),
+        })
+    return rows, errors
+
+
+async def import_content(db: AsyncSession, source, fmt: str, creator_id: int, publish: bool = False,
+                         batch_size: int = CATALOGUE_IMPORT_BATCH_SIZE) -> dict:
+    """Validate and insert every record of the spooled file ``source``, one batch per transaction."""
+    dialect_name = db.bind.dialect.name
+    stmt = insert(content_table).returning(content_table.c.id, content_table.c.search_document, content_table.c.tags)
+    if dialect_name == "postgresql":
+        stmt = stmt.values(search_vector=search.BULK_SEARCH_VECTOR)
+
+    text = io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+    records = _records(text, fmt)
+    inserted = failed = 0
+    errors = []
+    try:
+        while True:
+            batch = await anyio.to_thread.run_sync(lambda: list(islice(records, batch_size)))
+            if not batch:
+                break
+            rows, batch_errors = await anyio.to_thread.run_sync(_validate, batch, creator_id, publish, dialect_name)
+            failed += len(batch_errors)
+            errors.extend(batch_errors[:CATALOGUE_IMPORT_MAX_ERRORS - len(errors)])
+            if not rows:
+                continue
+            created = (await db.execute(stmt, rows)).all()
+            tags = [tag for content_id, _, content_tags in created for tag in facets.tag_rows(content_id, content_tags)]
+            if tags:
+                await db.execute(insert(facets.tag_table), tags)
+            # Mapper events do not fire for Core inserts; see response_cache.py
+            db.info["catalogue_changed"] = True
+            await db.commit()
+            search.index_bulk((content_id, document) for content_id, document, _ in created)
+            inserted += len(rows)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail={
+            "message": "Import must be UTF-8", "inserted": inserted, "failed": failed, "errors": errors,
+        })
+    finally:
+        text.close()
+
+    return {"inserted": inserted, "failed": failed, "errors": errors, "errors_truncated": failed > len(errors)}
+
+
+def _export_line(row) -> bytes:
+    item = dict(row._mapping)
+    item["content_type"] = item["content_type"].value
+    item["pricing_model"] = item["pricing_model"].value if item["pricing_model"] else None
+    item["created_at"] = item["created_at"].isoformat() if item["created_at"] else None
+    return json.dumps(item, separators=(",", ":")).encode() + b"\n"
+
+
+async def export_content(content_type=None, category: str = None, creator_id: int = None):
+    """Yield the published catalogue as NDJSON, in batches read from a server-side cursor.
+
+    Opens its own session: a streaming response outlives the request's dependencies.
+    """
+    query = select(*EXPORT_COLUMNS).where(content_table.c.is_published == True).order_by(content_table.c.id)
+    if content_type:
+        query = query.where(content_table.c.content_type == content_type)
+    if category:
+        query = query.where(content_table.c.category == category)
+    if creator_id:
+        query = query.where(content_table.c.creator_id == creator_id)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=CATALOGUE_EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield b"".join(_export_line(row) for row in rows)
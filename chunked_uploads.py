@@ -0,0 +1,320 @@
+"""Chunked, resumable uploads for content files.
+
+1. ``POST /api/uploads`` with the filename and size opens an upload session
+   and returns its id, chunk size and part count.
+2. ``PUT /api/uploads/{id}/parts/{n}`` sends part ``n`` (zero-based) as the raw
+   request body with its SHA-256 in the ``X-Chunk-SHA256`` header. Parts may be
+   sent in any order, concurrently, and re-sent.
+3. ``GET /api/uploads/{id}`` lists the parts received so far; after a
+   disconnect the client resends only the missing ones.
+4. ``POST /api/uploads/{id}/complete`` moves the file into place. The id is
+   then passed as ``upload_id`` when creating the tool, pipeline or dataset.
+
+Each part streams from the socket straight to its offset in a preallocated
+staging file through anyio's worker-thread file I/O, so the event loop never
+blocks on disk and memory per upload is bounded by the socket read size. At
+most ``UPLOAD_MAX_CONCURRENT_PARTS`` parts are written at once per process;
+beyond that clients get 503 with Retry-After and should retry the part.
+
+The whole-file SHA-256 used as the storage key (see storage.py) is computed
+while parts stream in, as long as they arrive in order on the same process;
+on completion only the bytes after the last in-order part are read back. The
+running hash remembers the digest of every part it covers, and is only used if
+those still match the parts recorded in the database; a part re-sent after it
+was hashed (on any process) makes completion hash the whole file again.
+"""
+import hashlib
+import math
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import partial
+
+import anyio
+from fastapi import HTTPException, Request
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+import storage
+from cache import TTLCache
+from database import dialect_insert
+from models import UploadPart, UploadSession
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(50 * 1024 ** 3)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(16 * 1024 ** 2)))
+UPLOAD_MIN_CHUNK_SIZE = 1024 ** 2
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", str(256 * 1024 ** 2)))
+UPLOAD_MAX_CONCURRENT_PARTS = int(os.getenv("UPLOAD_MAX_CONCURRENT_PARTS", "32"))
+UPLOAD_SESSION_TTL = timedelta(hours=float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")))
+
+HASH_READ_SIZE = 1024 ** 2
+
+_active_parts = 0
+# (upload id, part number) of the parts streaming in on this process
+_parts_in_flight = set()
+# upload id -> (running SHA-256 of the file, next part number it expects, digests of the parts it covers)
+_file_hashes = TTLCache(maxsize=1024, ttl=UPLOAD_SESSION_TTL.total_seconds())
+
+
+def _staging_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, "staging", upload_id)
+
+
+def part_count(upload: UploadSession) -> int:
+    return math.ceil(upload.total_size / upload.chunk_size)
+
+
+def _part_size(upload: UploadSession, part_number: int) -> int:
+    return min(upload.chunk_size, upload.total_size - part_number * upload.chunk_size)
+
+
+def describe(upload: UploadSession) -> dict:
+    return {
+        "id": upload.id,
+        "filename": upload.filename,
+        "total_size": upload.total_size,
+        "chunk_size": upload.chunk_size,
+        "part_count": part_count(upload),
+        "received_parts": [part.part_number for part in upload.parts],
+        "status": upload.status,
+        "expires_at": upload.expires_at,
+    }
+
+
+async def create_upload(db: AsyncSession, user_id: int, filename: str, size: int, chunk_size: int = None) -> UploadSession:
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+    if size > UPLOAD_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Uploads are limited to {UPLOAD_MAX_SIZE} bytes")
+    chunk_size = chunk_size or UPLOAD_CHUNK_SIZE
+    if not UPLOAD_MIN_CHUNK_SIZE <= chunk_size <= UPLOAD_MAX_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Chunk size must be between {UPLOAD_MIN_CHUNK_SIZE} and {UPLOAD_MAX_CHUNK_SIZE} bytes",
+        )
+    filename = os.path.basename(filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Filename is required")
+
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        total_size=size,
+        chunk_size=chunk_size,
+        status="uploading",
+        expires_at=datetime.now(timezone.utc) + UPLOAD_SESSION_TTL,
+        parts=[],
+    )
+
+    # Preallocate (sparsely) so parts can be written at their offsets in any order
+    staging_path = _staging_path(upload.id)
+    await anyio.to_thread.run_sync(partial(os.makedirs, os.path.dirname(staging_path), exist_ok=True))
+    async with await anyio.open_file(staging_path, "wb") as staging:
+        await staging.truncate(size)
+
+    db.add(upload)
+    await db.commit()
+    return upload
+
+
+async def get_upload(db: AsyncSession, upload_id: str, user_id: int) -> UploadSession:
+    upload = await db.scalar(
+        select(UploadSession).options(selectinload(UploadSession.parts)).where(
+            UploadSession.id == upload_id,
+            UploadSession.user_id == user_id,
+            UploadSession.expires_at > datetime.now(timezone.utc),
+        )
+    )
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload
+
+
+def _require_status(upload: UploadSession, status: str):
+    if upload.status != status:
+        raise HTTPException(status_code=409, detail=f"Upload is {upload.status}")
+
+
+async def _transition(db: AsyncSession, upload: UploadSession, expected: str, status: str, **values):
+    """Move ``upload`` from ``expected`` to ``status``, or 409 if another request moved it first."""
+    result = await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload.id, UploadSession.status == expected)
+        .values(status=status, **values)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"Upload is no longer {expected}")
+
+
+async def write_part(db: AsyncSession, upload: UploadSession, part_number: int, request: Request, sha256: str):
+    """Stream one part from the request body to its offset in the staging file.
+
+    No database connection is held while the part streams in; the session is
+    used again only to record the part.
+    """
+    global _active_parts
+
+    _require_status(upload, "uploading")
+    if not 0 <= part_number < part_count(upload):
+        raise HTTPException(status_code=400, detail=f"Part number must be between 0 and {part_count(upload) - 1}")
+    expected = _part_size(upload, part_number)
+    content_length = request.headers.get("content-length")
+    if content_length is not None and (not content_length.isdigit() or int(content_length) != expected):
+        raise HTTPException(status_code=400, detail=f"Part {part_number} must be {expected} bytes")
+
+    if _active_parts >= UPLOAD_MAX_CONCURRENT_PARTS:
+        raise HTTPException(status_code=503, detail="Too many uploads in progress", headers={"Retry-After": "1"})
+    if (upload.id, part_number) in _parts_in_flight:
+        # Two streams into the same bytes would leave a mix of both on disk
+        raise HTTPException(status_code=409, detail=f"Part {part_number} is already being uploaded")
+    # Both are taken before the first await, so concurrent requests see them
+    _active_parts += 1
+    _parts_in_flight.add((upload.id, part_number))
+    try:
+        return await _stream_part(db, upload, part_number, request, sha256, expected)
+    finally:
+        _active_parts -= 1
+        _parts_in_flight.discard((upload.id, part_number))
+
+
+async def _stream_part(db: AsyncSession, upload: UploadSession, part_number: int, request: Request, sha256: str, expected: int):
+    # Extend the running whole-file hash if this is the next part in order
+    state = _file_hashes.get(upload.id)
+    file_hash = None
+    covered = ()
+    if part_number == 0:
+        file_hash = hashlib.sha256()
+    elif state is not None and state[1] == part_number:
+        file_hash, covered = state[0].copy(), state[2]
+    elif state is not None and state[1] > part_number:
+        # A part already hashed is being replaced
+        _file_hashes.delete(upload.id)
+
+    # End the transaction that loaded the upload, returning its connection to the pool
+    await db.commit()
+
+    digest = hashlib.sha256()
+    received = 0
+    async with await anyio.open_file(_staging_path(upload.id), "r+b") as staging:
+        await staging.seek(part_number * upload.chunk_size)
+        async for data in request.stream():
+            received += len(data)
+            if received > expected:
+                raise HTTPException(status_code=413, detail=f"Part {part_number} must be {expected} bytes")
+            digest.update(data)
+            if file_hash is not None:
+                file_hash.update(data)
+            await staging.write(data)
+
+    # A short or corrupt part is not recorded, so the client simply sends it again
+    if received != expected:
+        raise HTTPException(status_code=400, detail=f"Part {part_number} must be {expected} bytes")
+    if digest.hexdigest() != sha256.lower():
+        raise HTTPException(status_code=400, detail=f"Checksum mismatch for part {part_number}")
+
+    insert = dialect_insert(db.bind.dialect.name)
+    stmt = insert(UploadPart).values(upload_id=upload.id, part_number=part_number, size=received, sha256=digest.hexdigest())
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["upload_id", "part_number"], set_={"size": stmt.excluded.size, "sha256": stmt.excluded.sha256}
+    ))
+    upload.expires_at = datetime.now(timezone.utc) + UPLOAD_SESSION_TTL
+    await db.commit()
+    # Only if no other part changed the hash state while this one streamed in
+    if file_hash is not None and _file_hashes.get(upload.id) is state:
+        _file_hashes.set(upload.id, (file_hash, part_number + 1, covered + (digest.hexdigest(),)))
+
+
+def _finish_hash(path: str, file_hash, offset: int) -> str:
+    with open(path, "rb") as staging:
+        staging.seek(offset)
+        while block := staging.read(HASH_READ_SIZE):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+async def complete_upload(db: AsyncSession, upload: UploadSession) -> UploadSession:
+    if upload.status == "completed":
+        return upload
+    _require_status(upload, "uploading")
+
+    received = {part.part_number for part in upload.parts}
+    missing = [n for n in range(part_count(upload)) if n not in received]
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Upload is missing parts", "missing_parts": missing})
+
+    # Only one request gets to hash and store the file; parts can no longer be sent
+    await _transition(db, upload, "uploading", "completing")
+    await db.commit()
+    try:
+        staging_path = _staging_path(upload.id)
+        state = _file_hashes.get(upload.id)
+        recorded = {part.part_number: part.sha256 for part in upload.parts}
+        if state is not None and state[2] == tuple(recorded[n] for n in range(state[1])):
+            file_hash, next_part = state[0].copy(), state[1]
+        else:
+            # Parts were re-sent since they were hashed, possibly to another process
+            file_hash, next_part = hashlib.sha256(), 0
+        digest = await anyio.to_thread.run_sync(_finish_hash, staging_path, file_hash, next_part * upload.chunk_size)
+
+        file_path = await storage.store_file(db, staging_path, digest, upload.total_size)
+        await _transition(db, upload, "completing", "completed", file_path=file_path, sha256=digest)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        await db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == upload.id, UploadSession.status == "completing")
+            .values(status="uploading")
+        )
+        await db.commit()
+        raise
+    _file_hashes.delete(upload.id)
+    return upload
+
+
+async def abort_upload(db: AsyncSession, upload: UploadSession):
+    _require_status(upload, "uploading")
+    await _transition(db, upload, "uploading", "aborted")
+    await db.commit()
+    _file_hashes.delete(upload.id)
+    await anyio.to_thread.run_sync(_remove, _staging_path(upload.id))
+
+
+async def attach_upload(db: AsyncSession, upload_id: str, user_id: int) -> UploadSession:
+    """Claim a completed upload for new content, which takes over its blob reference.
+
+    Committed together with the content.
+    """
+    upload = await get_upload(db, upload_id, user_id)
+    _require_status(upload, "completed")
+    # Two requests must not both attach the blob to new content
+    await _transition(db, upload, "completed", "attached")
+    return upload
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def expire_uploads(db: Session) -> int:
+    """Delete expired sessions that never got attached to content, releasing their files."""
+    expired = db.scalars(
+        select(UploadSession).where(
+            UploadSession.expires_at <= datetime.now(timezone.utc),
+            UploadSession.status != "attached",
+        )
+    ).all()
+    for upload in expired:
+        _remove(_staging_path(upload.id))
+        if upload.status == "completed":
+            storage.release(db, upload.sha256)
+        db.delete(upload)
+    db.commit()
+    return len(expired)
@@ -0,0 +1,164 @@
+"""File downloads for content.
+
+Local blobs are served with ``FileResponse``, which answers Range and
+If-Range requests (resumable and parallel partial downloads) and hands
+whole-file responses to the server as ``http.response.pathsend`` where the
+server supports it. Behind nginx, set ``DOWNLOAD_ACCEL_REDIRECT`` to an
+internal location aliased to ``STORAGE_ROOT`` and nginx serves the bytes
+itself with sendfile, ranges included. Blobs on S3 are served by redirecting
+to a presigned URL. The ETag is the file's SHA-256, so it is strong and the
+same on every server.
+
+Downloads are counted in memory and added to ``Content.download_count`` every
+``DOWNLOAD_FLUSH_INTERVAL`` seconds with one UPDATE per content, so a crash
+loses at most one interval of counts. Only requests that start at byte 0 are
+counted, so a file fetched as several parallel ranges counts once.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from urllib.parse import quote
+
+import anyio
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlalchemy import bindparam, update
+
+import storage
+from database import AsyncSessionLocal
+from models import Content
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_ACCEL_REDIRECT = os.getenv("DOWNLOAD_ACCEL_REDIRECT")
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 ** 2)))
+DOWNLOAD_FLUSH_INTERVAL = float(os.getenv("DOWNLOAD_FLUSH_INTERVAL", "5.0"))
+
+content_table = Content.__table__
+
+_increment_downloads = (
+    update(content_table)
+    .where(content_table.c.id == bindparam("b_content_id"))
+    .values(download_count=content_table.c.download_count + bindparam("b_count"))
+)
+
+
+class DownloadCounter:
+    def __init__(self):
+        self._counts = Counter()
+        self._task = None
+        self.flushed = 0
+
+    def add(self, content_id: int):
+        self._counts[content_id] += 1
+
+    @property
+    def pending(self) -> int:
+        return sum(self._counts.values())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Download count flush failed on shutdown; %d downloads were not counted", self.pending)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(DOWNLOAD_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Download count flush failed")
+
+    async def flush(self) -> int:
+        counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    _increment_downloads,
+                    [{"b_content_id": content_id, "b_count": n} for content_id, n in counts.items()],
+                )
+                db.info["catalogue_counters_changed"] = True  # see response_cache.py
+                await db.commit()
+        except Exception:
+            # Keep the counts for the next attempt
+            self._counts.update(counts)
+            raise
+        total = sum(counts.values())
+        self.flushed += total
+        return total
+
+
+download_counter = DownloadCounter()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _content_disposition(filename: str) -> str:
+    """An attachment header for ``filename``, as FileResponse builds it (RFC 5987 when it needs escaping)."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def _is_first_byte_request(request: Request) -> bool:
+    http_range = request.headers.get("range")
+    return http_range is None or http_range.replace(" ", "").startswith("bytes=0-")
+
+
+async def serve(request: Request, content) -> Response:
+    """Respond with the file of ``content`` (a row with id, file_path, file_name and file_hash)."""
+    headers = {"Cache-Control": "private, no-cache"}
+    if content.file_hash:
+        headers["ETag"] = f'"{content.file_hash}"'
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    key = content.file_path
+    backend = storage.get_storage()
+    content_addressed = key.startswith("sha256/")
+
+    if content_addressed and isinstance(backend, storage.S3Storage):
+        url = await anyio.to_thread.run_sync(backend.url, key)
+        response = RedirectResponse(url, status_code=307, headers=headers)
+    elif content_addressed and DOWNLOAD_ACCEL_REDIRECT:
+        response = Response(headers={
+            **headers,
+            "X-Accel-Redirect": f"{DOWNLOAD_ACCEL_REDIRECT.rstrip('/')}/{key}",
+            "Content-Disposition": _content_disposition(content.file_name or os.path.basename(key)),
+        })
+    else:
+        # Files uploaded before content-addressed storage keep their plain path
+        path = backend.path(key) if content_addressed else key
+        try:
+            stat_result = await anyio.to_thread.run_sync(os.stat, path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        response = FileResponse(
+            path, headers=headers, filename=content.file_name or os.path.basename(key), stat_result=stat_result
+        )
+        response.chunk_size = DOWNLOAD_CHUNK_SIZE
+
+    if _is_first_byte_request(request):
+        download_counter.add(content.id)
+    return response
@@ -0,0 +1,176 @@
+"""Facet counts for catalogue search, and the tag table behind tag filters.
+
+``search_facets`` counts the content matching a search by content type,
+category, pricing model, price bucket and tag in a single streamed pass over
+the matches. Counts are disjunctive: each facet is counted over the items that
+pass every *other* filter, so the sidebar keeps showing the alternatives to a
+selected value; tags narrow the results, so tag counts honour every filter.
+Results are cached per query and filters under the catalogue version from
+response_cache.py, which every committed change to ``Content`` (publishing
+included) bumps.
+
+``content_tags`` mirrors ``Content.tags`` one row per tag, kept in step by the
+mapper events below; ``tag_filter`` turns a tag filter into primary-key lookups
+instead of a scan of the JSON column. Core inserts bypass the events and must
+call ``tag_rows`` themselves (see catalogue.py).
+"""
+import json
+import os
+from collections import Counter
+
+from sqlalchemy import delete, event, inspect, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import search
+from cache import TieredCache
+from models import Content, ContentTag
+from response_cache import catalogue_version
+
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", "60"))
+FACET_CACHE_REDIS_TTL = float(os.getenv("FACET_CACHE_REDIS_TTL", "300"))
+FACET_CACHE_SIZE = int(os.getenv("FACET_CACHE_SIZE", "1024"))
+# Matches beyond this are not counted and the facets are flagged as truncated
+FACET_MAX_ROWS = int(os.getenv("FACET_MAX_ROWS", "50000"))
+FACET_MAX_TAGS = int(os.getenv("FACET_MAX_TAGS", "50"))
+
+FACETS = ("content_type", "category", "pricing_model", "price", "tags")
+# (inclusive upper bound, label); anything dearer is "100+"
+PRICE_BUCKETS = ((0.0, "free"), (10.0, "0-10"), (50.0, "10-50"), (100.0, "50-100"))
+
+tag_table = ContentTag.__table__
+
+_cache = TieredCache(
+    "facets",
+    dumps=lambda value: json.dumps(value).encode(),
+    loads=json.loads,
+    maxsize=FACET_CACHE_SIZE,
+    ttl=FACET_CACHE_TTL,
+    redis_ttl=FACET_CACHE_REDIS_TTL,
+)
+
+
+def price_bucket(price) -> str:
+    for bound, label in PRICE_BUCKETS:
+        if (price or 0.0) <= bound:
+            return label
+    return "100+"
+
+
+def tag_rows(content_id: int, tags) -> list:
+    return [{"content_id": content_id, "tag": tag} for tag in dict.fromkeys(tags or []) if tag]
+
+
+def tag_filter(query, tags):
+    """Restrict ``query`` to content carrying every one of ``tags``."""
+    for tag in dict.fromkeys(tags):
+        query = query.where(Content.id.in_(select(ContentTag.content_id).where(ContentTag.tag == tag)))
+    return query
+
+
+def _enum_value(value):
+    return value.value if value is not None else None
+
+
+# How a matched row is tested against each facet's filter
+_MATCHES = {
+    "content_type": lambda row, value: row.content_type == value,
+    "category": lambda row, value: row.category == value,
+    "pricing_model": lambda row, value: row.pricing_model == value,
+    "price": lambda row, max_price: (row.price or 0.0) <= max_price,
+    "tags": lambda row, tags: set(tags) <= set(row.tags or []),
+}
+
+# The value a matched row is counted under, per facet other than tags
+_VALUES = {
+    "content_type": lambda row: _enum_value(row.content_type),
+    "category": lambda row: row.category,
+    "pricing_model": lambda row: _enum_value(row.pricing_model),
+    "price": lambda row: price_bucket(row.price),
+}
+
+
+def _count(row, filters: dict, counts: dict):
+    failed = [facet for facet, value in filters.items() if not _MATCHES[facet](row, value)]
+    if not failed:
+        facets = FACETS
+    elif len(failed) == 1 and failed[0] != "tags":
+        facets = failed
+    else:
+        return
+
+    for facet in facets:
+        if facet == "tags":
+            counts["tags"].update(set(row.tags or []))
+            continue
+        value = _VALUES[facet](row)
+        if value is not None:
+            counts[facet][value] += 1
+
+
+async def search_facets(db: AsyncSession, q: str, filters: dict, min_rating: float = None) -> dict:
+    """Facet counts for the published content matching ``q``.
+
+    ``filters`` maps facet names to the selected value (``price`` to the
+    maximum price, ``tags`` to a list); unset facets are left out. Returns
+    ``{"counts": {facet: {value: count}}, "truncated": bool}``.
+    """
+    filters = {facet: value for facet, value in filters.items() if value not in (None, [])}
+    key = json.dumps(
+        [await catalogue_version.current(), q.lower(), min_rating,
+         {facet: getattr(value, "value", value) for facet, value in filters.items()}],
+        sort_keys=True, separators=(",", ":"),
+    )
+    cached = await _cache.get(key)
+    if cached is not None:
+        return cached
+
+    query = select(
+        Content.content_type, Content.category, Content.pricing_model, Content.price, Content.tags,
+    ).where(Content.is_published == True)
+    if min_rating:
+        query = query.where(Content.bayesian_rating >= min_rating)
+    query, _ = await search.apply_search(db, query, q)
+
+    counts = {facet: Counter() for facet in FACETS}
+    scanned = 0
+    result = await db.stream(query.limit(FACET_MAX_ROWS + 1).execution_options(yield_per=1000))
+    async for rows in result.partitions():
+        for row in rows[:FACET_MAX_ROWS - scanned]:
+            _count(row, filters, counts)
+        scanned += len(rows)
+
+    facets = {
+        "counts": {
+            facet: dict(counter.most_common(FACET_MAX_TAGS if facet == "tags" else None))
+            for facet, counter in counts.items()
+        },
+        "truncated": scanned > FACET_MAX_ROWS,
+    }
+    await _cache.set(key, facets)
+    return facets
+
+
+def _tags_changed(target) -> bool:
+    return inspect(target).attrs.tags.history.has_changes()
+
+
+@event.listens_for(Content, "after_insert")
+def _insert_tags(mapper, connection, target):
+    rows = tag_rows(target.id, target.tags)
+    if rows:
+        connection.execute(insert(tag_table), rows)
+
+
+@event.listens_for(Content, "after_update")
+def _update_tags(mapper, connection, target):
+    if not _tags_changed(target):
+        return
+    connection.execute(delete(tag_table).where(tag_table.c.content_id == target.id))
+    rows = tag_rows(target.id, target.tags)
+    if rows:
+        connection.execute(insert(tag_table), rows)
+
+
+@event.listens_for(Content, "before_delete")
+def _delete_tags(mapper, connection, target):
+    connection.execute(delete(tag_table).where(tag_table.c.content_id == target.id))
@@ -0,0 +1,89 @@
+"""Fast JSON for catalogue listings.
+
+Listing endpoints select the ``ContentResponse`` fields and the creator's
+``UserResponse`` fields as plain row tuples (no ORM entities, identity map or
+joined-eager loading), build the response items as dicts and encode them with
+orjson. Items are neither validated into pydantic models nor re-validated
+against the route's ``response_model``, which stays on the routes for the
+OpenAPI schema; the bytes are the same as ``ContentResponse`` would produce.
+
+Clients sending ``Accept: application/x-ndjson`` get a page as one item per
+line, encoded and streamed in chunks instead of as one JSON array. NDJSON
+pages bypass the response cache.
+"""
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+
+import response_cache
+from models import Content, User
+from schemas import ContentResponse, UserResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_CHUNK_ITEMS = 100
+# Matches pydantic's JSON for datetimes: UTC as "Z"
+_OPTIONS = orjson.OPT_UTC_Z
+
+CONTENT_FIELDS = tuple(name for name in ContentResponse.model_fields if name != "creator")
+CREATOR_FIELDS = tuple(UserResponse.model_fields)
+_TAGS = CONTENT_FIELDS.index("tags")
+_CREATOR = len(CONTENT_FIELDS)
+_END = _CREATOR + len(CREATOR_FIELDS)
+
+
+def select_items():
+    """Select the columns of a listing item, creator included; add filters and order as usual."""
+    return select(
+        *[getattr(Content, name) for name in CONTENT_FIELDS],
+        *[getattr(User, name).label(f"creator_{name}") for name in CREATOR_FIELDS],
+    ).join(User, User.id == Content.creator_id)
+
+
+def item(row) -> dict:
+    """A ``ContentResponse``-shaped dict from a ``select_items()`` row; extra trailing columns are ignored."""
+    content = dict(zip(CONTENT_FIELDS, row))
+    content["tags"] = row[_TAGS] or []
+    content["creator"] = dict(zip(CREATOR_FIELDS, row[_CREATOR:_END]))
+    return content
+
+
+def items(rows) -> list:
+    return [item(row) for row in rows]
+
+
+def encode(value) -> bytes:
+    return orjson.dumps(value, option=_OPTIONS)
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_response(rows, response: Response) -> StreamingResponse:
+    """Stream ``rows`` as NDJSON, keeping headers set on ``response`` (such as the next cursor)."""
+    def chunks():
+        for start in range(0, len(rows), NDJSON_CHUNK_ITEMS):
+            yield b"".join(
+                orjson.dumps(item(row), option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+                for row in rows[start:start + NDJSON_CHUNK_ITEMS]
+            )
+
+    return StreamingResponse(chunks(), media_type=NDJSON_MEDIA_TYPE, headers=dict(response.headers))
+
+
+def json_response(value, response: Response = None) -> Response:
+    """Encode ``value`` as the response body, keeping headers set on ``response``."""
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=encode(value), media_type="application/json", headers=headers)
+
+
+async def respond(request: Request, response: Response, fetch) -> Response:
+    """Serve the ``select_items()`` rows returned by ``fetch()``: as NDJSON if asked for, else cached JSON."""
+    if wants_ndjson(request):
+        return ndjson_response(await fetch(), response)
+
+    async def produce():
+        return encode(items(await fetch()))
+
+    return await response_cache.cached(request, response, produce)
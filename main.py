@@ -1,21 +1,32 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
 from typing import List, Optional
 import uvicorn
 
-from database import get_db, engine
-from models import Base
-from routes import auth, creators, tools, pipelines, data, marketplace, analytics
+import metrics
+from database import get_db, async_engine, engine
+from routes import auth, creators, tools, pipelines, data, marketplace, analytics, uploads, catalogue
+from downloads import download_counter
+from usage_ingest import ingestor
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ingestor.start()
+    await download_counter.start()
+    yield
+    await download_counter.stop()
+    await ingestor.stop()
+    # Close pooled connections cleanly on shutdown
+    await async_engine.dispose()
 
 app = FastAPI(
     title="BioPlatform Creator Marketplace",
     description="A marketplace for bioinformatics tools, pipelines, and datasets",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -25,14 +36,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Cache", "Content-Range", "Accept-Ranges", "Content-Disposition"],
 )
 
+# Per-route latency and SQL timings for /metrics; outermost, so it times the whole stack
+if metrics.METRICS_ENABLED:
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+    metrics.instrument_engine(engine, "sync")
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 app.include_router(creators.router, prefix="/api/creators", tags=["creators"])
 app.include_router(tools.router, prefix="/api/tools", tags=["tools"])
 app.include_router(pipelines.router, prefix="/api/pipelines", tags=["pipelines"])
 app.include_router(data.router, prefix="/api/data", tags=["datasets"])
+app.include_router(uploads.router, prefix="/api/uploads", tags=["uploads"])
+app.include_router(catalogue.router, prefix="/api/catalogue", tags=["catalogue"])
 app.include_router(marketplace.router, prefix="/api/marketplace", tags=["marketplace"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
 
@@ -44,5 +64,9 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(content=await metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
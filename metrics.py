@@ -0,0 +1,339 @@
+"""Prometheus metrics for the API and the Celery workers.
+
+The exposition format is plain text, so the few metric types needed are kept
+here rather than pulling in a client library. What is measured:
+
+- per route (the path template, not the raw URL): request latency, and the
+  number and total time of the SQL statements each request ran, from
+  ``MetricsMiddleware`` and the cursor events installed by ``instrument_engine``
+- every SQL statement's duration, per engine
+- connection pool size, checked-out connections and overflow, read at scrape
+- hits, misses and entries of every ``TieredCache`` (see cache.py)
+- Celery task durations by task and final state, and queue depths. Workers are
+  separate processes, so they add their observations to counters in the broker
+  Redis (``record_task``) and ``/metrics`` reads them back.
+
+Recording an observation is a dict lookup and a few additions under an
+uncontended lock; everything that needs I/O or a scan happens at scrape time.
+Set ``METRICS_ENABLED=false`` to skip the middleware and engine events.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+import redis
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+from sqlalchemy import event
+
+from cache import caches
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+CELERY_METRICS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")  # the Celery broker, see tasks.py
+CELERY_QUEUES = [queue for queue in os.getenv("CELERY_METRICS_QUEUES", "celery,reports").split(",") if queue]
+CELERY_METRICS_KEY = "metrics:celery_task_duration"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A counter or gauge, one value per combination of label values."""
+
+    def __init__(self, name: str, help: str, kind: str = "counter", labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set(self, value: float, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_number(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram; buckets are stored per bucket and summed when rendered."""
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def load(self, label_values, counts, total: float):
+        """Replace one series with per-bucket ``counts`` (``+Inf`` last) and their ``total``."""
+        with self._lock:
+            self._series[tuple(label_values)] = list(counts) + [total]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(label_values, list(values)) for label_values, values in self._series.items()]
+        for label_values, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = f'le="{_format_number(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_number(values[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template",
+    labels=("method", "route", "status"),
+)
+REQUEST_STATEMENTS = Histogram(
+    "http_request_db_statements", "SQL statements run per request",
+    labels=("method", "route"), buckets=STATEMENT_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds", "Time spent in SQL statements per request",
+    labels=("method", "route"),
+)
+STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "Duration of each SQL statement", labels=("engine",), buckets=STATEMENT_BUCKETS,
+)
+POOL_SIZE = Metric("db_pool_size", "Configured connection pool size", "gauge", ("engine",))
+POOL_CHECKED_OUT = Metric("db_pool_checked_out", "Connections currently in use", "gauge", ("engine",))
+POOL_OVERFLOW = Metric("db_pool_overflow", "Connections open beyond the pool size", "gauge", ("engine",))
+CACHE_HITS = Metric("cache_hits_total", "Cache hits by tier", "counter", ("cache", "tier"))
+CACHE_MISSES = Metric("cache_misses_total", "Lookups that missed every tier", "counter", ("cache",))
+CACHE_HIT_RATIO = Metric("cache_hit_ratio", "Hits over lookups since start", "gauge", ("cache",))
+CACHE_ENTRIES = Metric("cache_entries", "Entries in the local tier", "gauge", ("cache",))
+CACHE_REDIS_ERRORS = Metric("cache_redis_errors_total", "Failed Redis tier operations", "counter", ("cache",))
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Celery task run time, by task and final state",
+    labels=("task", "state"), buckets=TASK_BUCKETS,
+)
+QUEUE_DEPTH = Metric("celery_queue_length", "Messages waiting in a Celery queue", "gauge", ("queue",))
+
+REGISTRY = [
+    REQUEST_LATENCY, REQUEST_STATEMENTS, REQUEST_DB_TIME, STATEMENT_DURATION,
+    POOL_SIZE, POOL_CHECKED_OUT, POOL_OVERFLOW,
+    CACHE_HITS, CACHE_MISSES, CACHE_HIT_RATIO, CACHE_ENTRIES, CACHE_REDIS_ERRORS,
+    TASK_DURATION, QUEUE_DEPTH,
+]
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware; SQL events add to whichever request they run for
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request and its SQL statements."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            _request_stats.reset(token)
+            # The router records the matched route in the scope; raw paths would explode label cardinality
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            REQUEST_LATENCY.observe(elapsed, method, route, str(status[0]))
+            REQUEST_STATEMENTS.observe(stats.statements, method, route)
+            REQUEST_DB_TIME.observe(stats.db_seconds, method, route)
+
+
+_engines = {}
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement run on ``engine`` (the sync engine behind an async one)."""
+    _engines[name] = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started_at = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, "_metrics_started_at", None)
+        if started_at is None:
+            return
+        elapsed = time.perf_counter() - started_at
+        STATEMENT_DURATION.observe(elapsed, name)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+
+
+def _collect_pools():
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        POOL_SIZE.set(pool.size(), name)
+        POOL_CHECKED_OUT.set(pool.checkedout(), name)
+        # QueuePool counts overflow from -size while the pool is not full
+        POOL_OVERFLOW.set(max(pool.overflow(), 0), name)
+
+
+def _collect_caches():
+    for name, cache in caches.items():
+        lookups = cache.local.hits + cache.local.misses
+        hits = cache.local.hits + cache.redis_hits
+        CACHE_HITS.set(cache.local.hits, name, "local")
+        CACHE_HITS.set(cache.redis_hits, name, "redis")
+        CACHE_MISSES.set(cache.local.misses - cache.redis_hits, name)
+        CACHE_HIT_RATIO.set(hits / lookups if lookups else 0.0, name)
+        CACHE_ENTRIES.set(len(cache.local), name)
+        CACHE_REDIS_ERRORS.set(cache.redis_errors, name)
+
+
+_celery_redis = None
+_worker_redis = None
+
+
+def _celery_client():
+    global _celery_redis
+    if _celery_redis is None:
+        _celery_redis = aioredis.Redis.from_url(CELERY_METRICS_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+    return _celery_redis
+
+
+async def _collect_celery():
+    TASK_DURATION.clear()
+    QUEUE_DEPTH.clear()
+    client = _celery_client()
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(CELERY_METRICS_KEY)
+            for queue in CELERY_QUEUES:
+                pipe.llen(queue)
+            fields, *depths = await pipe.execute()
+    except RedisError as exc:
+        logger.warning("Could not read Celery metrics: %s", exc)
+        return
+
+    for queue, depth in zip(CELERY_QUEUES, depths):
+        QUEUE_DEPTH.set(depth, queue)
+
+    # Fields are "task|state|<bucket index>" counts and "task|state|sum"
+    series = {}
+    for field, value in fields.items():
+        task, state, slot = field.decode().rsplit("|", 2)
+        counts, total = series.setdefault((task, state), ([0] * (len(TASK_BUCKETS) + 1), [0.0]))
+        if slot == "sum":
+            total[0] = float(value)
+        else:
+            counts[int(slot)] = int(value)
+    for label_values, (counts, total) in series.items():
+        TASK_DURATION.load(label_values, counts, total[0])
+
+
+def record_task(task: str, state: str, seconds: float):
+    """Add one task run to the shared counters; called by the worker signal handlers in tasks.py."""
+    global _worker_redis
+    if _worker_redis is None:
+        _worker_redis = redis.Redis.from_url(CELERY_METRICS_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+    prefix = f"{task}|{state}|"
+    try:
+        pipe = _worker_redis.pipeline(transaction=False)
+        pipe.hincrby(CELERY_METRICS_KEY, prefix + str(bisect_left(TASK_BUCKETS, seconds)), 1)
+        pipe.hincrbyfloat(CELERY_METRICS_KEY, prefix + "sum", seconds)
+        pipe.execute()
+    except RedisError as exc:
+        logger.warning("Could not record Celery task metrics: %s", exc)
+
+
+async def render() -> str:
+    """Every metric in the Prometheus text format, with scrape-time values refreshed."""
+    _collect_pools()
+    _collect_caches()
+    await _collect_celery()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
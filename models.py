@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, Float, Boolean, ForeignKey, JSON, Enum, Index, UniqueConstraint, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -49,7 +50,9 @@ class CreatorProfile(Base):
     research_areas = Column(JSON)  # List of research areas
     total_earnings = Column(Float, default=0.0)
     total_downloads = Column(Integer, default=0)
-    rating = Column(Float, default=0.0)
+    rating = Column(Float, default=0.0)  # mean of every review of the creator's content (see ratings.py)
+    rating_sum = Column(Integer, default=0)
+    review_count = Column(Integer, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="creator_profile")
@@ -71,20 +74,33 @@ class Content(Base):
 
     # Meta_data
     version = Column(String, default="1.0.0")
-    file_path = Column(String)  # Path to uploaded files
+    file_path = Column(String)  # Storage key of the uploaded file (see storage.py)
+    file_name = Column(String)  # original filename, used for downloads
+    file_hash = Column(String, index=True)  # SHA-256 of the uploaded file
+    file_size = Column(BigInteger)
+    file_metadata = Column(JSON)  # format and statistics extracted by processing.py
+    processing_status = Column(String)  # pending, processing, ready, failed; null when there is no file
+    processing_error = Column(Text)
     docker_image = Column(String)  # For containerized tools
     requirements = Column(JSON)  # Dependencies, system requirements
 
     # Stats
     download_count = Column(Integer, default=0)
     usage_count = Column(Integer, default=0)
+    # Ratings (maintained by ratings.py, never set directly)
     rating = Column(Float, default=0.0)
+    rating_sum = Column(Integer, default=0)
     review_count = Column(Integer, default=0)
+    bayesian_rating = Column(Float, default=0.0)  # rating shrunk towards a prior; 0 until reviewed
 
     # Status
     is_published = Column(Boolean, default=False)
     is_featured = Column(Boolean, default=False)
 
+    # Search (maintained by search.py, never set directly)
+    search_document = Column(Text)
+    search_vector = Column(Text().with_variant(TSVECTOR(), "postgresql"))
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -92,6 +108,56 @@ class Content(Base):
     reviews = relationship("Review", back_populates="content")
     usage_records = relationship("UsageRecord", back_populates="content")
 
+# Listings page newest-first by keyset on id within a published content type
+Index("ix_content_listing", Content.content_type, Content.is_published, Content.id)
+
+# Published-only (partial) indexes for the catalogue's hot filters and orderings
+_published = Content.is_published == True
+Index(
+    "ix_content_published_category", Content.content_type, Content.category, Content.id,
+    postgresql_where=_published, sqlite_where=_published,
+)
+Index(
+    "ix_content_featured", Content.id,
+    postgresql_where=_published & (Content.is_featured == True), sqlite_where=_published & (Content.is_featured == True),
+)
+Index("ix_content_published_usage", Content.usage_count, Content.id, postgresql_where=_published, sqlite_where=_published)
+Index(
+    "ix_content_published_type_usage", Content.content_type, Content.usage_count, Content.id,
+    postgresql_where=_published, sqlite_where=_published,
+)
+Index("ix_content_creator", Content.creator_id, Content.id)
+Index(
+    "ix_content_published_type_rating", Content.content_type, Content.bayesian_rating, Content.id,
+    postgresql_where=_published, sqlite_where=_published,
+)
+
+# Full-text and trigram indexes only exist on PostgreSQL; other backends use the
+# in-process fallback index in search.py
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+Index("ix_content_search_vector", Content.search_vector, postgresql_using="gin").ddl_if(dialect="postgresql")
+Index(
+    "ix_content_search_document_trgm",
+    Content.search_document,
+    postgresql_using="gin",
+    postgresql_ops={"search_document": "gin_trgm_ops"},
+).ddl_if(dialect="postgresql")
+
+# Content.tags, one row per tag, so that tag filters are index lookups (maintained by facets.py)
+class ContentTag(Base):
+    __tablename__ = "content_tags"
+
+    tag = Column(String, primary_key=True)
+    content_id = Column(Integer, ForeignKey("content.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_content_tags_content", "content_id"),
+    )
+
 class Review(Base):
     __tablename__ = "reviews"
 
@@ -104,6 +170,11 @@ class Review(Base):
 
     content = relationship("Content", back_populates="reviews")
 
+    __table_args__ = (
+        Index("ix_reviews_content_id", "content_id", "id"),  # newest first per content
+        Index("ux_reviews_content_user", "content_id", "user_id", unique=True),  # one review per user
+    )
+
 class UsageRecord(Base):
     __tablename__ = "usage_records"
 
@@ -113,11 +184,16 @@ class UsageRecord(Base):
     usage_type = Column(String)  # download, execution, view
     cost = Column(Float, default=0.0)
     meta_data = Column(JSON)  # Execution details, parameters used
+    event_id = Column(String, unique=True)  # Idempotency key for buffered ingestion
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="usage_records")
     content = relationship("Content", back_populates="usage_records")
 
+    __table_args__ = (
+        Index("ix_usage_records_content_created", "content_id", "created_at"),
+    )
+
 class Transaction(Base):
     __tablename__ = "transactions"
 
@@ -131,3 +207,150 @@ class Transaction(Base):
     transaction_id = Column(String, unique=True)  # External payment processor ID
     status = Column(String, default="pending")  # pending, completed, failed
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_transactions_creator_created", "creator_id", "created_at"),
+    )
+
+class RollupCheckpoint(Base):
+    __tablename__ = "rollup_checkpoints"
+
+    name = Column(String, primary_key=True)  # which rollup consumed the source rows
+    last_id = Column(Integer, nullable=False, default=0)  # highest source row id folded in
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ContentUsageHourly(Base):
+    __tablename__ = "content_usage_hourly"
+
+    content_id = Column(Integer, ForeignKey("content.id"), primary_key=True)
+    hour = Column(DateTime(timezone=True), primary_key=True)  # start of the hour bucket
+    usage_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_content_usage_hourly_hour", "hour"),
+    )
+
+class TrendingScore(Base):
+    __tablename__ = "trending_scores"
+
+    window = Column(String, primary_key=True)  # 24h, 7d, 30d
+    content_id = Column(Integer, ForeignKey("content.id"), primary_key=True)
+    content_type = Column(Enum(ContentType), nullable=False)
+    usage_count = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_trending_scores_window_score", "window", "score", "content_id"),
+        Index("ix_trending_scores_window_type_score", "window", "content_type", "score", "content_id"),
+    )
+
+class ContentDailyRollup(Base):
+    __tablename__ = "content_daily_rollups"
+
+    content_id = Column(Integer, ForeignKey("content.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    usage_count = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+    distinct_users = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_content_daily_rollups_creator_day", "creator_id", "day"),
+    )
+
+class CreatorDailyRollup(Base):
+    __tablename__ = "creator_daily_rollups"
+
+    creator_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    usage_count = Column(Integer, nullable=False, default=0)
+    cost = Column(Float, nullable=False, default=0.0)
+    distinct_users = Column(Integer, nullable=False, default=0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+    transaction_amount = Column(Float, nullable=False, default=0.0)
+    creator_earnings = Column(Float, nullable=False, default=0.0)
+
+class RollupDailyUser(Base):
+    # Users already counted per rollup row, so distinct_users can be maintained incrementally
+    __tablename__ = "rollup_daily_users"
+
+    scope = Column(String, primary_key=True)  # content or creator
+    scope_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+
+class RollupDeferredRow(Base):
+    # Source rows a rollup's checkpoint moved past before they could be folded
+    __tablename__ = "rollup_deferred_rows"
+
+    name = Column(String, primary_key=True)  # which rollup deferred the row
+    source_id = Column(Integer, primary_key=True)
+
+class PlatformCounter(Base):
+    __tablename__ = "platform_counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)  # opaque id handed to the client
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="uploading")  # uploading, completing, completed, attached, aborted
+    file_path = Column(String)  # storage key once completed
+    sha256 = Column(String)  # digest of the whole file once completed
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    parts = relationship("UploadPart", order_by="UploadPart.part_number", cascade="all, delete-orphan")
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+
+    upload_id = Column(String, ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)  # zero-based
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=False)
+
+class StorageBlob(Base):
+    __tablename__ = "storage_blobs"
+
+    sha256 = Column(String, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # upload sessions and content using the blob
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PipelineAnalysis(Base):
+    __tablename__ = "pipeline_analyses"
+
+    file_hash = Column(String, primary_key=True)
+    version = Column(String, primary_key=True)  # analyzer, content version and requirements the result depends on
+    status = Column(String, nullable=False, default="ready", server_default="ready")  # pending, ready or failed
+    analysis = Column(JSON)
+    error = Column(Text)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    requested_at = Column(DateTime(timezone=True))  # when a worker was last asked to (re)compute it
+
+class CreatorReport(Base):
+    __tablename__ = "creator_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    creator_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    period = Column(String, nullable=False)  # YYYY, YYYY-MM or YYYY-MM-DD
+    status = Column(String, nullable=False, default="pending")  # pending, running, ready, failed
+    files = Column(JSON)  # format -> list of storage keys
+    summary = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        UniqueConstraint("creator_id", "period", name="uq_creator_reports_creator_period"),
+    )
@@ -0,0 +1,89 @@
+"""Keyset (cursor) pagination shared by the catalogue listing endpoints.
+
+Pages are ordered descending by a stable sort key such as ``(id,)`` (newest
+first) or ``(rank, id)``. The key of the last row is handed back to the client
+as an opaque cursor in the ``X-Next-Cursor`` response header; passing it as
+``?cursor=`` resumes right after that row with an index seek, so deep pages cost
+the same as the first one and concurrent inserts do not shift page boundaries.
+``skip`` is still honoured for clients that page by offset, but only when no
+cursor is supplied.
+"""
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Largest integer the databases accept in a BIGINT comparison
+_MAX_INT = 2 ** 63 - 1
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(list(values), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _matches_key(value, key) -> bool:
+    """Whether a decoded cursor value can be compared with the ``key`` column."""
+    if value is None:
+        return True
+    try:
+        expected = key.type.python_type
+    except NotImplementedError:
+        return True  # untyped expression; nothing to check against
+    if isinstance(value, bool):
+        return expected is bool
+    if expected is int:
+        return isinstance(value, int) and -_MAX_INT <= value <= _MAX_INT
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor: str, keys):
+    """Decode a cursor for ``keys``; a malformed or forged cursor is rejected with 400."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (
+        not isinstance(values, list)
+        or len(values) != len(keys)
+        or not all(_matches_key(value, key) for value, key in zip(values, keys))
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+async def paginate(db: AsyncSession, query, keys, cursor: str = None, skip: int = 0, limit: int = 50):
+    """Fetch one page of the ``query`` select ordered descending by ``keys``.
+
+    ``keys`` must end with a unique column so that the order is total. Returns
+    ``(items, next_cursor)``; ``next_cursor`` is None on the last page. Items
+    are entities for an entity select, and rows (trailing sort keys included)
+    for a select of several columns.
+    """
+    width = len(query.column_descriptions)
+    query = query.add_columns(*keys).order_by(*[key.desc() for key in keys])
+    if cursor:
+        query = query.where(tuple_(*keys) < tuple_(*decode_cursor(cursor, keys)))
+    elif skip:
+        query = query.offset(skip)
+
+    # One extra row tells us whether another page exists
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][width:])
+    return [row[0] for row in rows] if width == 1 else rows, next_cursor
+
+
+def set_next_cursor(response: Response, next_cursor: str):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -0,0 +1,123 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (100-300 ms per call), so hashing and verification
+run on a dedicated, bounded thread pool (bcrypt releases the GIL while it
+works). Calls beyond the pool size wait in its queue; once more than
+``PASSWORD_HASH_MAX_QUEUE`` are waiting, new requests are rejected with 503
+rather than letting a login storm pile up without bound.
+
+Changing ``BCRYPT_ROUNDS`` takes effect for existing users on their next
+successful login, when their hash is transparently upgraded.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_stats_lock = threading.Lock()  # worker threads update the stats
+
+
+class HashingStats:
+    def __init__(self):
+        self.in_flight = 0  # submitted and not yet finished, even if the caller has gone
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0  # dropped from the queue before they ran
+        self.rejected = 0
+        self.rehashed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return self.in_flight - self.running
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": PASSWORD_HASH_WORKERS,
+            "in_flight": self.in_flight,
+            "running": self.running,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "wait_seconds": self.wait_seconds,
+            "run_seconds": self.run_seconds,
+        }
+
+
+stats = HashingStats()
+
+
+async def _run(fn, *args):
+    if stats.in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        stats.rejected += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Too many concurrent authentication requests",
+            headers={"Retry-After": "1"},
+        )
+
+    submitted_at = time.perf_counter()
+
+    def timed():
+        started_at = time.perf_counter()
+        with _stats_lock:
+            stats.running += 1
+        try:
+            return fn(*args)
+        finally:
+            with _stats_lock:
+                stats.running -= 1
+                stats.wait_seconds += started_at - submitted_at
+                stats.run_seconds += time.perf_counter() - started_at
+
+    def finished(future):
+        # The slot is held until the work is done, not until the caller stops
+        # waiting: a cancelled request leaves bcrypt running in its thread
+        with _stats_lock:
+            stats.in_flight -= 1
+            if future.cancelled():
+                stats.cancelled += 1
+            elif future.exception() is not None:
+                stats.failed += 1
+            else:
+                stats.completed += 1
+
+    with _stats_lock:
+        stats.in_flight += 1
+    try:
+        future = _executor.submit(timed)
+    except BaseException:
+        with _stats_lock:
+            stats.in_flight -= 1
+        raise
+    future.add_done_callback(finished)
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str):
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash
+    uses outdated parameters and should be replaced."""
+    valid, new_hash = await _run(pwd_context.verify_and_update, password, hashed_password)
+    if new_hash:
+        stats.rehashed += 1
+    return valid, new_hash
@@ -0,0 +1,502 @@
+"""Pipeline analysis (``tasks.analyze_pipeline``).
+
+A workflow file (CWL or Nextflow) is parsed into a DAG of steps. Each step
+gets a CPU, memory and runtime estimate from, in order of preference:
+
+1. execution history: the 90th percentile over the most recent
+   ``PIPELINE_HISTORY_LIMIT`` execution ``UsageRecord``s of the same file,
+   once there are at least ``PIPELINE_MIN_SAMPLES``. Their ``meta_data`` may
+   carry ``runtime_seconds``, ``cpus`` and ``peak_memory_gb``, for the whole
+   run and per step under ``steps``;
+2. the resources the step declares in the workflow file;
+3. ``Content.requirements`` (``cpus``, ``memory_gb``, ``runtime_minutes``,
+   optionally per step under ``steps``);
+4. built-in defaults.
+
+The steps are then scheduled as early as their dependencies allow. That
+schedule gives the critical path (wall-clock runtime), peak parallelism, peak
+CPU and memory (what has to be available before a run), CPU and memory hours,
+and from those a suggested price per run.
+
+Results are stored in ``pipeline_analyses`` under the file hash and a
+version string covering the analyzer, the content version and its
+requirements. They are recomputed after ``PIPELINE_ANALYSIS_TTL`` hours so
+that new execution history is taken into account. A workflow that cannot be
+analyzed is stored as failed and retried after the same TTL. A row is pending
+from the moment a worker is asked to compute it (``claim_refresh``), and
+that worker is asked again only after ``PIPELINE_ANALYSIS_PENDING_MINUTES``
+without a result.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from statistics import quantiles
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import storage
+from database import dialect_insert
+from models import Content, PipelineAnalysis, UsageRecord
+
+logger = logging.getLogger(__name__)
+
+ANALYZER_VERSION = "1"
+PIPELINE_HISTORY_LIMIT = int(os.getenv("PIPELINE_HISTORY_LIMIT", "500"))
+PIPELINE_MIN_SAMPLES = int(os.getenv("PIPELINE_MIN_SAMPLES", "5"))
+PIPELINE_ANALYSIS_TTL = timedelta(hours=float(os.getenv("PIPELINE_ANALYSIS_TTL", "24")))
+PIPELINE_ANALYSIS_PENDING = timedelta(minutes=float(os.getenv("PIPELINE_ANALYSIS_PENDING_MINUTES", "10")))
+PIPELINE_CPU_HOUR_PRICE = float(os.getenv("PIPELINE_CPU_HOUR_PRICE", "0.05"))
+PIPELINE_GB_HOUR_PRICE = float(os.getenv("PIPELINE_GB_HOUR_PRICE", "0.005"))
+PIPELINE_PRICE_MARGIN = float(os.getenv("PIPELINE_PRICE_MARGIN", "0.3"))
+MAX_WORKFLOW_SIZE = 10 * 1024 ** 2
+WORKFLOW_FORMATS = ("cwl", "nextflow")
+
+DEFAULT_STEP = {"cpus": 1.0, "memory_gb": 2.0, "runtime_seconds": 600.0}
+MEMORY_UNITS = {"kb": 1 / 1024 ** 2, "mb": 1 / 1024, "gb": 1.0, "tb": 1024.0}
+TIME_UNITS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "d": 86400}
+# Raised on malformed workflows or requirements (JSONDecodeError and bad casts are ValueErrors)
+PARSE_ERRORS = (ValueError, TypeError, KeyError, AttributeError)
+
+
+class AnalysisError(Exception):
+    """The workflow cannot be analyzed."""
+
+
+# Parsing: each parser returns {step: declared resources} and a set of (upstream, downstream) edges
+
+def _brace_block(text: str, open_index: int) -> str:
+    depth = 0
+    for index in range(open_index, len(text)):
+        if text[index] == "{":
+            depth += 1
+        elif text[index] == "}":
+            depth -= 1
+            if depth == 0:
+                return text[open_index + 1:index]
+    raise AnalysisError("Unbalanced braces in workflow")
+
+
+def _nextflow_resources(body: str) -> dict:
+    declared = {}
+    match = re.search(r"^\s*cpus\s*[=\s]\s*(\d+(?:\.\d+)?)", body, re.M)
+    if match:
+        declared["cpus"] = float(match.group(1))
+    match = re.search(r"^\s*memory\s*[=\s]\s*['\"]?(\d+(?:\.\d+)?)\s*\.?\s*([KMGT]B)", body, re.M | re.I)
+    if match:
+        declared["memory_gb"] = float(match.group(1)) * MEMORY_UNITS[match.group(2).lower()]
+    match = re.search(r"^\s*time\s*[=\s]\s*['\"]?(\d+(?:\.\d+)?)\s*\.?\s*(min|sec|[smhd])\b", body, re.M)
+    if match:
+        declared["runtime_seconds"] = float(match.group(1)) * TIME_UNITS[match.group(2)]
+    return declared
+
+
+def parse_nextflow(text: str):
+    steps = {}
+    for match in re.finditer(r"^\s*process\s+(\w+)\s*\{", text, re.M):
+        steps[match.group(1)] = _nextflow_resources(_brace_block(text, match.end() - 1))
+    if not steps:
+        raise AnalysisError("Nextflow script defines no processes")
+
+    edges = set()
+    aliases = defaultdict(set)  # channel variable -> processes it comes from
+
+    def sources(expression: str) -> set:
+        found = set()
+        for name in re.findall(r"\b(\w+)\b", expression):
+            if name in steps and re.search(rf"\b{name}\.out\b", expression):
+                found.add(name)
+            found |= aliases.get(name, set())
+        return found
+
+    for match in re.finditer(r"^\s*workflow\s*\w*\s*\{", text, re.M):
+        for statement in _brace_block(text, match.end() - 1).splitlines():
+            statement = statement.split("//", 1)[0].strip()
+            target, _, expression = statement.rpartition("=") if re.match(r"^\w+\s*=[^=]", statement) else ("", "", statement)
+            produced = set()
+            if "|" in expression and "||" not in expression:
+                # a | P | Q: each stage feeds the next
+                upstream = sources(expression.split("|", 1)[0])
+                for stage in expression.split("|")[1:]:
+                    name = stage.strip().split("(", 1)[0].strip()
+                    if name in steps:
+                        edges.update((source, name) for source in upstream)
+                        upstream = {name}
+                produced = upstream
+            else:
+                for call in re.finditer(r"\b(\w+)\s*\(([^()]*(?:\([^()]*\)[^()]*)*)\)", expression):
+                    if call.group(1) in steps:
+                        edges.update((source, call.group(1)) for source in sources(call.group(2)))
+                        produced.add(call.group(1))
+                produced = produced or sources(expression)
+            if target.strip():
+                aliases[target.strip()] = produced
+    return steps, edges
+
+
+def _cwl_resources(requirements) -> dict:
+    declared = {}
+    entries = requirements.values() if isinstance(requirements, dict) else requirements or []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        if "coresMin" in entry:
+            declared["cpus"] = float(entry["coresMin"])
+        if "ramMin" in entry:
+            declared["memory_gb"] = float(entry["ramMin"]) / 1024
+        if "timelimit" in entry:
+            declared["runtime_seconds"] = float(entry["timelimit"])
+    return declared
+
+
+def _cwl_step_name(name: str) -> str:
+    return name.lstrip("#").split("/")[-1]
+
+
+def parse_cwl_json(document: dict):
+    if document.get("class") == "CommandLineTool":
+        # A single tool runs as a one-step workflow
+        declared = _cwl_resources(document.get("requirements"))
+        declared.update(_cwl_resources(document.get("hints")))
+        return {_cwl_step_name(str(document.get("id") or "tool")): declared}, set()
+    raw_steps = document.get("steps") or []
+    if isinstance(raw_steps, dict):
+        raw_steps = [{"id": name, **(step or {})} for name, step in raw_steps.items()]
+    steps, references = {}, {}
+    for step in raw_steps:
+        name = _cwl_step_name(step.get("id", ""))
+        declared = _cwl_resources(step.get("requirements"))
+        declared.update(_cwl_resources(step.get("hints")))
+        steps[name] = declared
+        references[name] = json.dumps(step.get("in", {}))
+    edges = set()
+    for name, inputs in references.items():
+        for upstream in re.findall(r"#?([\w-]+)/[\w-]+", inputs):
+            if upstream in steps and upstream != name:
+                edges.add((upstream, name))
+    return steps, edges
+
+
+def _cwl_yaml_resources(body: str) -> dict:
+    declared = {}
+    for key, field, scale in (("coresMin", "cpus", 1), ("ramMin", "memory_gb", 1 / 1024), ("timelimit", "runtime_seconds", 1)):
+        match = re.search(rf"\b{key}:\s*(\d+(?:\.\d+)?)", body)
+        if match:
+            declared[field] = float(match.group(1)) * scale
+    return declared
+
+
+def parse_cwl_yaml(text: str):
+    """Line-oriented reading of the ``steps`` section of a YAML CWL document."""
+    if re.search(r"^class:\s*['\"]?CommandLineTool\b", text, re.M):
+        # A single tool runs as a one-step workflow
+        match = re.search(r"^id:\s*['\"]?#?([\w-]+)", text, re.M)
+        return {match.group(1) if match else "tool": _cwl_yaml_resources(text)}, set()
+    blocks = {}
+    current = None
+    in_steps = False
+    step_indent = None
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip())
+        if indent == 0:
+            in_steps = line.startswith("steps:")
+            current = None
+            continue
+        if not in_steps:
+            continue
+        if step_indent is None:
+            step_indent = indent
+        if indent == step_indent:
+            match = re.match(r"\s*-\s*id:\s*['\"]?#?([\w-]+)", line) or re.match(r"\s*['\"]?([\w-]+)['\"]?\s*:", line)
+            current = match.group(1) if match else None
+            if current:
+                blocks[current] = []
+        elif current:
+            blocks[current].append(line)
+
+    steps, edges = {}, set()
+    for name, lines in blocks.items():
+        steps[name] = _cwl_yaml_resources("\n".join(lines))
+    for name, lines in blocks.items():
+        for upstream in re.findall(r"['\"]?#?([\w-]+)/[\w-]+", "\n".join(lines)):
+            if upstream in steps and upstream != name:
+                edges.add((upstream, name))
+    return steps, edges
+
+
+def parse_workflow(text: str, file_format: str):
+    if file_format == "nextflow":
+        steps, edges = parse_nextflow(text)
+    elif file_format == "cwl":
+        steps, edges = parse_cwl_json(json.loads(text)) if text.lstrip().startswith("{") else parse_cwl_yaml(text)
+    else:
+        raise AnalysisError(f"Cannot analyze {file_format or 'unknown'} files as pipelines")
+    if not steps:
+        raise AnalysisError("Workflow defines no steps")
+    return steps, edges
+
+
+# Estimation
+
+def _p90(values):
+    values = sorted(values)
+    if len(values) < 2:
+        return values[0]
+    return quantiles(values, n=10, method="inclusive")[-1]
+
+
+def history_stats(db: Session, file_hash: str) -> dict:
+    """Per-step and whole-run p90 resource usage from recent executions of this file."""
+    records = db.scalars(
+        select(UsageRecord.meta_data)
+        .join(Content, Content.id == UsageRecord.content_id)
+        .where(Content.file_hash == file_hash, UsageRecord.usage_type == "execution")
+        .order_by(UsageRecord.id.desc())
+        .limit(PIPELINE_HISTORY_LIMIT)
+    ).all()
+
+    samples = defaultdict(lambda: defaultdict(list))
+    for meta in records:
+        if not isinstance(meta, dict):
+            continue
+        for scope, stats in [("__run__", meta), *(meta.get("steps") or {}).items()]:
+            if not isinstance(stats, dict):
+                continue
+            for field in ("runtime_seconds", "cpus", "peak_memory_gb"):
+                if isinstance(stats.get(field), (int, float)):
+                    samples[scope][field].append(float(stats[field]))
+
+    result = {}
+    for scope, fields in samples.items():
+        estimate = {
+            ("memory_gb" if field == "peak_memory_gb" else field): _p90(values)
+            for field, values in fields.items() if len(values) >= PIPELINE_MIN_SAMPLES
+        }
+        if estimate:
+            result[scope] = {**estimate, "samples": max(len(values) for values in fields.values())}
+    return result
+
+
+def _requirement_defaults(requirements: dict, step: str) -> dict:
+    requirements = requirements or {}
+    defaults = {}
+    for source in (requirements, (requirements.get("steps") or {}).get(step) or {}):
+        if "cpus" in source:
+            defaults["cpus"] = float(source["cpus"])
+        if "memory_gb" in source:
+            defaults["memory_gb"] = float(source["memory_gb"])
+        if "runtime_minutes" in source:
+            defaults["runtime_seconds"] = float(source["runtime_minutes"]) * 60
+    return defaults
+
+
+def estimate_steps(steps: dict, requirements: dict, history: dict) -> dict:
+    estimates = {}
+    for name, declared in steps.items():
+        estimate, sources = {}, {}
+        for source, values in (
+            ("history", history.get(name, {})),
+            ("workflow", declared),
+            ("requirements", _requirement_defaults(requirements, name)),
+            ("default", DEFAULT_STEP),
+        ):
+            for field in DEFAULT_STEP:
+                if field not in estimate and field in values:
+                    estimate[field] = values[field]
+                    sources[field] = source
+        estimates[name] = {**estimate, "sources": sources}
+    return estimates
+
+
+def schedule(steps: dict, edges: set, estimates: dict) -> dict:
+    """Schedule every step as early as its dependencies allow and summarize the result."""
+    if not steps:
+        raise AnalysisError("Workflow defines no steps")
+    downstream = defaultdict(set)
+    indegree = {name: 0 for name in steps}
+    for upstream, step in edges:
+        if step not in downstream[upstream]:
+            downstream[upstream].add(step)
+            indegree[step] += 1
+
+    start, finish, via = {}, {}, {}
+    ready = deque(sorted(name for name, degree in indegree.items() if degree == 0))
+    for name in ready:
+        start[name] = 0.0
+    order = []
+    while ready:
+        name = ready.popleft()
+        order.append(name)
+        finish[name] = start[name] + estimates[name]["runtime_seconds"]
+        for step in sorted(downstream[name]):
+            if finish[name] >= start.get(step, 0.0):
+                start[step], via[step] = finish[name], name
+            indegree[step] -= 1
+            if not indegree[step]:
+                ready.append(step)
+    if len(order) != len(steps):
+        raise AnalysisError("Workflow has a dependency cycle")
+
+    # Walk back from the step that finishes last
+    critical_path = []
+    step = max(finish, key=finish.get)
+    while step is not None:
+        critical_path.append(step)
+        step = via.get(step)
+    critical_path.reverse()
+
+    # Sweep over start/finish events to find peak concurrent usage
+    events = sorted(
+        [(start[name], 1, name) for name in order] + [(finish[name], -1, name) for name in order],
+        key=lambda event: (event[0], event[1]),
+    )
+    running = cpus = memory = 0
+    peak_parallelism = peak_cpus = peak_memory = 0
+    for _, delta, name in events:
+        running += delta
+        cpus += delta * estimates[name]["cpus"]
+        memory += delta * estimates[name]["memory_gb"]
+        peak_parallelism = max(peak_parallelism, running)
+        peak_cpus = max(peak_cpus, cpus)
+        peak_memory = max(peak_memory, memory)
+
+    return {
+        "runtime_seconds": max(finish.values()),
+        "critical_path": critical_path,
+        "peak_parallelism": peak_parallelism,
+        "peak_cpus": peak_cpus,
+        "peak_memory_gb": peak_memory,
+        "cpu_hours": sum(estimates[name]["cpus"] * estimates[name]["runtime_seconds"] for name in order) / 3600,
+        "memory_gb_hours": sum(estimates[name]["memory_gb"] * estimates[name]["runtime_seconds"] for name in order) / 3600,
+        "schedule": [
+            {"step": name, "start_seconds": start[name], "finish_seconds": finish[name], **estimates[name]}
+            for name in order
+        ],
+    }
+
+
+def suggest_price(summary: dict) -> dict:
+    compute_cost = summary["cpu_hours"] * PIPELINE_CPU_HOUR_PRICE + summary["memory_gb_hours"] * PIPELINE_GB_HOUR_PRICE
+    return {
+        "compute_cost_per_run": round(compute_cost, 4),
+        "suggested_price_per_run": round(compute_cost * (1 + PIPELINE_PRICE_MARGIN), 2),
+    }
+
+
+# Orchestration
+
+def analyze_workflow(text: str, file_format: str, requirements: dict, history: dict) -> dict:
+    """Parse, estimate and schedule a workflow; AnalysisError if it cannot be analyzed."""
+    try:
+        steps, edges = parse_workflow(text, file_format)
+        estimates = estimate_steps(steps, requirements, history)
+        summary = schedule(steps, edges, estimates)
+    except PARSE_ERRORS as exc:
+        raise AnalysisError(f"Workflow could not be analyzed: {exc}") from exc
+    return {
+        "format": file_format,
+        "step_count": len(steps),
+        "edges": sorted([upstream, step] for upstream, step in edges),
+        **summary,
+        "observed_run": history.get("__run__"),
+        "pricing": suggest_price(summary),
+    }
+
+
+def analysis_version(content: Content) -> str:
+    requirements = json.dumps(content.requirements or {}, sort_keys=True)
+    return f"{ANALYZER_VERSION}:{content.version}:{hashlib.sha1(requirements.encode()).hexdigest()[:12]}"
+
+
+def is_stale(analysis: PipelineAnalysis) -> bool:
+    computed_at = analysis.computed_at
+    if computed_at.tzinfo is None:
+        computed_at = computed_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - computed_at >= PIPELINE_ANALYSIS_TTL
+
+
+async def get_cached(db: AsyncSession, content: Content):
+    return await db.get(PipelineAnalysis, (content.file_hash, analysis_version(content)))
+
+
+async def claim_refresh(db: AsyncSession, content: Content, cached) -> bool:
+    """Mark the analysis of ``content`` requested; False if it needs none or was requested recently.
+
+    Missing analyses are inserted as pending. A pending analysis, or a ready
+    or failed one past its TTL, is claimed if nobody asked for it within
+    ``PIPELINE_ANALYSIS_PENDING``, so only one request enqueues the work.
+    """
+    now = datetime.now(timezone.utc)
+    key = {"file_hash": content.file_hash, "version": analysis_version(content)}
+    if cached is None:
+        insert = dialect_insert(db.get_bind().dialect.name)
+        result = await db.execute(
+            insert(PipelineAnalysis).values(**key, status="pending", requested_at=now).on_conflict_do_nothing()
+        )
+    elif cached.status != "pending" and not is_stale(cached):
+        return False
+    else:
+        result = await db.execute(
+            update(PipelineAnalysis)
+            .where(
+                PipelineAnalysis.file_hash == key["file_hash"],
+                PipelineAnalysis.version == key["version"],
+                or_(PipelineAnalysis.requested_at.is_(None), PipelineAnalysis.requested_at < now - PIPELINE_ANALYSIS_PENDING),
+            )
+            # computed_at is when the result was computed, not when it was asked for
+            .values(requested_at=now, computed_at=PipelineAnalysis.computed_at)
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return result.rowcount == 1
+
+
+def _read_workflow(content: Content) -> str:
+    backend = storage.get_storage()
+    stream = backend.open(content.file_path) if content.file_path.startswith("sha256/") else open(content.file_path, "rb")
+    with stream:
+        data = stream.read(MAX_WORKFLOW_SIZE + 1)
+    if len(data) > MAX_WORKFLOW_SIZE:
+        raise AnalysisError("Workflow file is too large to analyze")
+    return data.decode("utf-8", errors="replace")
+
+
+def analyze_content(db: Session, content_id: int, force: bool = False) -> dict:
+    """Analyze the workflow of ``content_id``, reusing a fresh cached result when there is one."""
+    content = db.get(Content, content_id)
+    if content is None or not content.file_path or not content.file_hash:
+        raise AnalysisError("Content has no stored workflow file")
+
+    version = analysis_version(content)
+    cached = db.get(PipelineAnalysis, (content.file_hash, version))
+    if cached is not None and cached.status == "ready" and not force and not is_stale(cached):
+        return cached.analysis
+
+    file_format = (content.file_metadata or {}).get("format")
+    try:
+        text = _read_workflow(content)
+        history = history_stats(db, content.file_hash)
+        analysis = {"version": version, **analyze_workflow(text, file_format, content.requirements, history)}
+    except AnalysisError as exc:
+        # Recorded so that the endpoint reports it instead of asking again until the TTL passes
+        _store(db, content.file_hash, version, status="failed", error=str(exc))
+        raise
+    _store(db, content.file_hash, version, status="ready", analysis=analysis, error=None)
+    return analysis
+
+
+def _store(db: Session, file_hash: str, version: str, **values):
+    """Upsert a finished analysis; a failure keeps the last good result for the same version."""
+    values.update(computed_at=datetime.now(timezone.utc), requested_at=None)
+    insert = dialect_insert(db.get_bind().dialect.name)
+    db.execute(insert(PipelineAnalysis).values(file_hash=file_hash, version=version, **values).on_conflict_do_update(
+        index_elements=["file_hash", "version"], set_=values
+    ))
+    db.commit()
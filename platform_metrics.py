@@ -0,0 +1,119 @@
+"""Platform-wide counters for the admin analytics page.
+
+``reconcile_counters`` (a periodic celery task) stores the counters in
+``platform_counters``: user, creator and content counts are recomputed, and
+revenue is folded in incrementally from usage records above a checkpoint.
+``read_counters`` answers the admin page from those rows plus the revenue of
+usage not folded in yet, so revenue is exact and the counts are at most one
+reconcile interval old. ``check_drift`` compares the stored counters with the
+full aggregates they replace and optionally corrects them.
+"""
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import Content, PlatformCounter, RollupCheckpoint, UsageRecord, User, UserRole
+from rollups import get_checkpoint, settled_upper_id
+
+logger = logging.getLogger(__name__)
+
+REVENUE_CHECKPOINT = "platform_revenue"
+DRIFT_TOLERANCE = 1e-6
+
+# Ground truth for every counter; counts are recomputed on each reconcile
+COUNT_QUERIES = {
+    "total_users": select(func.count(User.id)),
+    "total_creators": select(func.count(User.id)).where(User.role == UserRole.CREATOR),
+    "total_content": select(func.count(Content.id)),
+}
+
+
+def _revenue_between(lower_id: int, upper_id: int = None):
+    query = select(func.coalesce(func.sum(UsageRecord.cost), 0.0)).where(UsageRecord.id > lower_id)
+    if upper_id is not None:
+        query = query.where(UsageRecord.id <= upper_id)
+    return query
+
+
+def _store(db: Session, values: dict):
+    insert = dialect_insert(db.get_bind().dialect.name)
+    stmt = insert(PlatformCounter)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["name"], set_={"value": stmt.excluded.value, "updated_at": func.now()}
+        ),
+        [{"name": name, "value": value} for name, value in values.items()],
+    )
+
+
+def reconcile_counters(db: Session) -> dict:
+    """Refresh the stored counters; returns the values written."""
+    values = {name: db.scalar(query) for name, query in COUNT_QUERIES.items()}
+
+    checkpoint = get_checkpoint(db, REVENUE_CHECKPOINT)
+    upper_id = max(checkpoint.last_id, settled_upper_id(db, REVENUE_CHECKPOINT, UsageRecord.id))
+    revenue = db.get(PlatformCounter, "total_revenue")
+    values["total_revenue"] = (revenue.value if revenue else 0.0) + db.scalar(
+        _revenue_between(checkpoint.last_id, upper_id)
+    )
+    checkpoint.last_id = upper_id
+
+    _store(db, values)
+    db.commit()
+    return values
+
+
+def check_drift(db: Session, correct: bool = False) -> dict:
+    """Compare stored counters with ground truth.
+
+    Returns ``{name: {"stored", "actual", "drift"}}`` for every counter that is
+    off. With ``correct=True`` the stored values are replaced by the actual ones.
+    """
+    checkpoint = get_checkpoint(db, REVENUE_CHECKPOINT)
+    actual = {name: db.scalar(query) for name, query in COUNT_QUERIES.items()}
+    # Revenue is only stored up to the checkpoint
+    actual["total_revenue"] = db.scalar(
+        select(func.coalesce(func.sum(UsageRecord.cost), 0.0)).where(UsageRecord.id <= checkpoint.last_id)
+    )
+    stored = dict(db.execute(select(PlatformCounter.name, PlatformCounter.value)).all())
+
+    drift = {}
+    for name, value in actual.items():
+        difference = value - stored.get(name, 0.0)
+        if abs(difference) > DRIFT_TOLERANCE:
+            drift[name] = {"stored": stored.get(name, 0.0), "actual": value, "drift": difference}
+    if drift:
+        logger.warning("Platform counters drifted: %s", drift)
+
+    if correct and drift:
+        _store(db, {name: entry["actual"] for name, entry in drift.items()})
+    db.commit()
+    return drift
+
+
+async def read_counters(db: AsyncSession) -> dict:
+    """Stored counters plus revenue not folded in yet."""
+    counters = {
+        counter.name: counter
+        for counter in (await db.scalars(select(PlatformCounter))).all()
+    }
+    checkpoint = await db.get(RollupCheckpoint, REVENUE_CHECKPOINT)
+    tail = await db.scalar(_revenue_between(checkpoint.last_id if checkpoint else 0))
+
+    values = {name: int(counters[name].value) if name in counters else 0 for name in COUNT_QUERIES}
+    values["total_revenue"] = (counters["total_revenue"].value if "total_revenue" in counters else 0.0) + tail
+    updated = [counter.updated_at for counter in counters.values() if counter.updated_at]
+    values["as_of"] = min(updated) if updated else None
+    return values
+
+
+async def read_exact(db: AsyncSession) -> dict:
+    """Full aggregates, bypassing the counters."""
+    values = {name: await db.scalar(query) for name, query in COUNT_QUERIES.items()}
+    values["total_revenue"] = await db.scalar(_revenue_between(0))
+    values["as_of"] = datetime.now(timezone.utc)
+    return values
@@ -0,0 +1,562 @@
+"""Processing of uploaded content files (``tasks.process_tool_upload``).
+
+A file is read once, as a stream of ``PROCESSING_BLOCK_SIZE`` blocks, and
+every block goes through these stages:
+
+- checksum: the SHA-256 of the raw bytes is checked against
+  ``Content.file_hash``. It runs on a worker thread (hashlib releases the GIL)
+  at the same time as the stages below.
+- decompression: gzip and BGZF input is inflated incrementally, with a bound
+  on the output produced per block.
+- format analysis: the format is sniffed from the first decompressed bytes,
+  with the filename as a fallback, and a format-specific analyzer extracts
+  metadata. Supported formats are FASTA, FASTQ, VCF, BAM, CWL and Nextflow.
+- security scan: native executables disguised under a data-format extension
+  are rejected, and risky shell patterns in workflows are reported.
+
+``Content.processing_status`` moves from pending to processing to ready or
+failed; malformed input of any kind (a corrupt gzip stream, a truncated BAM
+record) marks it failed. Ready content is published. Processing is
+idempotent: rerunning it for content that is already ready does nothing, and
+results are reused from any other ready content with the same file hash.
+"""
+import hashlib
+import logging
+import os
+import re
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+import storage
+from models import Content
+
+logger = logging.getLogger(__name__)
+
+PROCESSING_BLOCK_SIZE = int(os.getenv("PROCESSING_BLOCK_SIZE", str(4 * 1024 ** 2)))
+MAX_INFLATE_PER_CALL = 16 * PROCESSING_BLOCK_SIZE
+MAX_LISTED_NAMES = 100
+
+DATA_EXTENSIONS = {
+    ".fa": "fasta", ".fasta": "fasta", ".fna": "fasta", ".faa": "fasta",
+    ".fq": "fastq", ".fastq": "fastq",
+    ".vcf": "vcf",
+    ".bam": "bam",
+    ".cwl": "cwl",
+    ".nf": "nextflow",
+}
+SEQUENCE_FORMATS = {"fasta", "fastq", "vcf", "bam"}
+EXECUTABLE_MAGIC = (b"\x7fELF", b"MZ", b"\xcf\xfa\xed\xfe", b"\xfe\xed\xfa\xcf")
+# Raised by the parsers on malformed input (UnicodeDecodeError is a ValueError)
+PARSE_ERRORS = (zlib.error, struct.error, ValueError, LookupError, ArithmeticError)
+PROCESSING_STALLED_AFTER = timedelta(hours=float(os.getenv("PROCESSING_STALLED_HOURS", "1")))
+RISKY_PATTERNS = [
+    (re.compile(rb"(curl|wget)[^\n|]*\|\s*(ba|z)?sh\b"), "pipes a download into a shell"),
+    (re.compile(rb"rm\s+-rf\s+/(\s|$)"), "removes the root filesystem"),
+    (re.compile(rb"/dev/tcp/"), "opens a raw network socket"),
+]
+
+
+class ProcessingError(Exception):
+    """The file is invalid; processing it again will not help."""
+
+
+def _extension_format(filename: str):
+    name = (filename or "").lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return DATA_EXTENSIONS.get(os.path.splitext(name)[1])
+
+
+def sniff(head: bytes, filename: str = None):
+    """Best guess at the format of a file from its first decompressed bytes."""
+    text = head.lstrip()
+    if head.startswith(b"BAM\x01"):
+        return "bam"
+    if head.startswith(b"##fileformat=VCF"):
+        return "vcf"
+    if text.startswith(b">"):
+        return "fasta"
+    if text.startswith(b"@") and b"\n+" in head:
+        return "fastq"
+    if re.search(rb"^cwlVersion:|\"cwlVersion\"\s*:", head, re.M):
+        return "cwl"
+    if re.search(rb"^\s*(process\s+\w+\s*\{|workflow\s*\{|nextflow\.enable\.dsl)", head, re.M):
+        return "nextflow"
+    return _extension_format(filename)
+
+
+class _Inflater:
+    """Incremental gunzip for multi-member streams such as BGZF."""
+
+    def __init__(self):
+        self._inflate = zlib.decompressobj(31)
+        self._in_member = False
+
+    def feed(self, data: bytes):
+        while data:
+            self._in_member = True
+            chunk = self._inflate.decompress(data, MAX_INFLATE_PER_CALL)
+            if chunk:
+                yield chunk
+            if self._inflate.eof:
+                data = self._inflate.unused_data
+                self._inflate = zlib.decompressobj(31)
+                self._in_member = False
+            else:
+                data = self._inflate.unconsumed_tail
+
+    def finish(self):
+        if self._in_member:
+            raise ProcessingError("gzip stream is truncated")
+
+
+class _LineAnalyzer:
+    """Feeds complete lines to ``line()``, carrying partial lines across blocks."""
+
+    def __init__(self):
+        self._tail = b""
+
+    def feed(self, block: bytes):
+        lines = (self._tail + block).split(b"\n")
+        self._tail = lines.pop()
+        for line in lines:
+            self.line(line.rstrip(b"\r"))
+
+    def finish(self) -> dict:
+        if self._tail:
+            self.line(self._tail.rstrip(b"\r"))
+            self._tail = b""
+        return self.result()
+
+
+class FastaAnalyzer:
+    """Counts sequences and residues per block with bytes methods rather than per line."""
+
+    def __init__(self):
+        self._tail = b""
+        self.sequences = 0
+        self.residues = 0
+        self.longest = 0
+        self._current = 0
+        self._alphabet = set()
+        self._alphabet_samples = 0
+
+    def feed(self, block: bytes):
+        data = self._tail + block
+        cut = data.rfind(b"\n") + 1
+        self._tail = data[cut:]
+        self._scan(data[:cut])
+
+    def _scan(self, data: bytes):
+        # data always starts at a line boundary; headers are found with bytes.find, not per line
+        position = 0
+        header = 0 if data.startswith(b">") else self._next_header(data, 0)
+        while header >= 0:
+            self._add_residues(data[position:header])
+            self._end_sequence()
+            self.sequences += 1
+            end = data.find(b"\n", header)
+            position = len(data) if end < 0 else end + 1
+            header = self._next_header(data, position - 1)
+        self._add_residues(data[position:])
+
+    @staticmethod
+    def _next_header(data: bytes, start: int) -> int:
+        found = data.find(b"\n>", start)
+        return found + 1 if found >= 0 else -1
+
+    def _add_residues(self, segment: bytes):
+        if not segment:
+            return
+        self._current += len(segment) - segment.count(b"\n") - segment.count(b"\r")
+        if self._alphabet_samples < 1000:
+            self._alphabet_samples += 1
+            self._alphabet.update(segment[:200].upper().replace(b"\n", b"").replace(b"\r", b""))
+
+    def _end_sequence(self):
+        self.residues += self._current
+        self.longest = max(self.longest, self._current)
+        self._current = 0
+
+    def finish(self) -> dict:
+        self._scan(self._tail)
+        self._tail = b""
+        self._end_sequence()
+        if not self.sequences:
+            raise ProcessingError("FASTA file has no sequences")
+        return {
+            "sequence_count": self.sequences,
+            "total_length": self.residues,
+            "longest_sequence": self.longest,
+            "alphabet": "nucleotide" if self._alphabet <= set(b"ACGTUN-") else "protein",
+        }
+
+
+class FastqAnalyzer:
+    """Checks and counts whole four-line records a block at a time."""
+
+    def __init__(self):
+        self._tail = b""
+        self.reads = 0
+        self.bases = 0
+        self.shortest = None
+        self.longest = 0
+
+    def feed(self, block: bytes):
+        lines = (self._tail + block).split(b"\n")
+        complete = (len(lines) - 1) // 4 * 4
+        self._tail = b"\n".join(lines[complete:])
+        self._records(lines[:complete])
+
+    def _records(self, lines):
+        if not lines:
+            return
+        if not all(header.startswith(b"@") for header in lines[0::4]):
+            raise ProcessingError(f"FASTQ record after read {self.reads} does not start with '@'")
+        lengths = [len(sequence.rstrip(b"\r")) for sequence in lines[1::4]]
+        if lengths != [len(quality.rstrip(b"\r")) for quality in lines[3::4]]:
+            raise ProcessingError(f"FASTQ quality length does not match sequence after read {self.reads}")
+        self.reads += len(lengths)
+        self.bases += sum(lengths)
+        self.longest = max(self.longest, max(lengths))
+        self.shortest = min(lengths) if self.shortest is None else min(self.shortest, min(lengths))
+
+    def finish(self) -> dict:
+        lines = self._tail.split(b"\n")
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if len(lines) % 4:
+            raise ProcessingError("FASTQ file is truncated")
+        self._records(lines)
+        if not self.reads:
+            raise ProcessingError("FASTQ file has no reads")
+        return {
+            "read_count": self.reads,
+            "total_bases": self.bases,
+            "shortest_read": self.shortest,
+            "longest_read": self.longest,
+        }
+
+
+class VcfAnalyzer(_LineAnalyzer):
+    def __init__(self):
+        super().__init__()
+        self.version = None
+        self.samples = []
+        self.records = 0
+        self.contigs = set()
+
+    def line(self, line: bytes):
+        if line.startswith(b"##fileformat="):
+            self.version = line.split(b"=", 1)[1].decode(errors="replace")
+        elif line.startswith(b"#CHROM"):
+            self.samples = [name.decode(errors="replace") for name in line.split(b"\t")[9:]]
+        elif line and not line.startswith(b"#"):
+            self.records += 1
+            if len(self.contigs) < MAX_LISTED_NAMES:
+                self.contigs.add(line.split(b"\t", 1)[0].decode(errors="replace"))
+
+    def result(self) -> dict:
+        if self.version is None:
+            raise ProcessingError("VCF file has no ##fileformat header")
+        return {
+            "vcf_version": self.version,
+            "sample_count": len(self.samples),
+            "samples": self.samples[:MAX_LISTED_NAMES],
+            "record_count": self.records,
+            "contigs": sorted(self.contigs),
+        }
+
+
+class CwlAnalyzer(_LineAnalyzer):
+    def __init__(self):
+        super().__init__()
+        self.fields = {}
+        self.steps = 0
+        self._in_steps = False
+
+    def line(self, line: bytes):
+        match = re.match(rb"^\"?(cwlVersion|class|label)\"?\s*:\s*\"?([^\",]+)", line)
+        if match and match.group(1).decode() not in self.fields:
+            self.fields[match.group(1).decode()] = match.group(2).strip().decode(errors="replace")
+        if re.match(rb"^\w", line):
+            self._in_steps = line.startswith(b"steps:")
+        elif self._in_steps and re.match(rb"^  (- id:|[\w-]+:)", line):
+            self.steps += 1
+
+    def result(self) -> dict:
+        if "cwlVersion" not in self.fields:
+            raise ProcessingError("CWL document has no cwlVersion")
+        return {**self.fields, "step_count": self.steps}
+
+
+class NextflowAnalyzer(_LineAnalyzer):
+    def __init__(self):
+        super().__init__()
+        self.processes = []
+        self.workflows = 0
+        self.dsl = None
+
+    def line(self, line: bytes):
+        match = re.match(rb"^\s*process\s+(\w+)", line)
+        if match:
+            self.processes.append(match.group(1).decode())
+        if re.match(rb"^\s*workflow\b", line):
+            self.workflows += 1
+        match = re.match(rb"^\s*nextflow\.enable\.dsl\s*=\s*(\d+)", line)
+        if match:
+            self.dsl = int(match.group(1))
+
+    def result(self) -> dict:
+        if not self.processes and not self.workflows:
+            raise ProcessingError("Nextflow script defines no process or workflow")
+        return {
+            "dsl": self.dsl or 2,
+            "process_count": len(self.processes),
+            "processes": self.processes[:MAX_LISTED_NAMES],
+            "workflow_count": self.workflows,
+        }
+
+
+class BamAnalyzer:
+    """Walks the decompressed BAM stream: header, reference list, then alignment records."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._state = "magic"
+        self._remaining_refs = 0
+        self.references = []
+        self.reference_count = 0
+        self.header_text = b""
+        self.records = 0
+
+    def _take(self, size: int):
+        if len(self._buffer) < size:
+            return None
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _int32(self, offset: int = 0):
+        if len(self._buffer) < offset + 4:
+            return None
+        return struct.unpack_from("<i", self._buffer, offset)[0]
+
+    def feed(self, block: bytes):
+        self._buffer += block
+        while True:
+            if self._state == "magic":
+                if len(self._buffer) < 8:
+                    return
+                if self._take(4) != b"BAM\x01":
+                    raise ProcessingError("Not a BAM file")
+                self._state = "text"
+            elif self._state == "text":
+                l_text = self._int32()
+                if l_text is None or len(self._buffer) < 4 + l_text:
+                    return
+                self.header_text = self._take(4 + l_text)[4:]
+                self._state = "n_ref"
+            elif self._state == "n_ref":
+                n_ref = self._int32()
+                if n_ref is None:
+                    return
+                self._take(4)
+                self.reference_count = self._remaining_refs = n_ref
+                self._state = "refs" if n_ref else "records"
+            elif self._state == "refs":
+                l_name = self._int32()
+                if l_name is None or len(self._buffer) < 8 + l_name:
+                    return
+                entry = self._take(8 + l_name)
+                if len(self.references) < MAX_LISTED_NAMES:
+                    self.references.append(entry[4:4 + l_name].rstrip(b"\x00").decode(errors="replace"))
+                self._remaining_refs -= 1
+                if not self._remaining_refs:
+                    self._state = "records"
+            else:
+                block_size = self._int32()
+                if block_size is None or len(self._buffer) < 4 + block_size:
+                    return
+                del self._buffer[:4 + block_size]
+                self.records += 1
+
+    def finish(self) -> dict:
+        if self._state in ("magic", "text", "n_ref") or self._buffer:
+            raise ProcessingError("BAM file is truncated")
+        sort_order = re.search(rb"@HD[^\n]*\tSO:(\w+)", self.header_text)
+        return {
+            "reference_count": self.reference_count,
+            "references": self.references,
+            "record_count": self.records,
+            "sort_order": sort_order.group(1).decode() if sort_order else None,
+        }
+
+
+ANALYZERS = {
+    "fasta": FastaAnalyzer,
+    "fastq": FastqAnalyzer,
+    "vcf": VcfAnalyzer,
+    "bam": BamAnalyzer,
+    "cwl": CwlAnalyzer,
+    "nextflow": NextflowAnalyzer,
+}
+
+
+class SecurityScan:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.scan_scripts = True  # shell patterns only matter outside the sequence and variant formats
+        self.findings = []
+        self._tail = b""
+        self._first = True
+
+    def feed(self, block: bytes):
+        if self._first:
+            self._first = False
+            if block.startswith(EXECUTABLE_MAGIC) and _extension_format(self.filename):
+                raise ProcessingError(f"{self.filename} is a native executable, not a data file")
+        if not self.scan_scripts:
+            return
+        # Overlap blocks so patterns spanning a boundary are still found
+        window = self._tail + block
+        for pattern, reason in RISKY_PATTERNS:
+            if reason not in self.findings and pattern.search(window):
+                self.findings.append(reason)
+        self._tail = block[-256:]
+
+
+def analyze_stream(stream, filename: str, expected_sha256: str = None) -> dict:
+    """Run every stage over ``stream`` in one pass and return the file metadata."""
+    checksum = hashlib.sha256()
+    inflater = None
+    analyzer = None
+    file_format = None
+    scan = SecurityScan(filename)
+    size = 0
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="checksum") as checksum_worker:
+        pending_checksum = None
+        while block := stream.read(PROCESSING_BLOCK_SIZE):
+            size += len(block)
+            # Hash block n on the worker while block n is parsed; updates stay in order
+            if pending_checksum is not None:
+                pending_checksum.result()
+            pending_checksum = checksum_worker.submit(checksum.update, block)
+
+            if analyzer is None and inflater is None and block.startswith(b"\x1f\x8b"):
+                inflater = _Inflater()
+            try:
+                for data in (inflater.feed(block) if inflater else (block,)):
+                    if file_format is None:
+                        file_format = sniff(data[:65536], filename) or "unknown"
+                        if file_format in ANALYZERS:
+                            analyzer = ANALYZERS[file_format]()
+                        scan.scan_scripts = file_format not in SEQUENCE_FORMATS
+                    scan.feed(data)
+                    if analyzer is not None:
+                        analyzer.feed(data)
+            except PARSE_ERRORS as exc:
+                raise ProcessingError(f"File could not be parsed: {exc}") from exc
+        if pending_checksum is not None:
+            pending_checksum.result()
+
+    digest = checksum.hexdigest()
+    if expected_sha256 and digest != expected_sha256:
+        raise ProcessingError("Stored file does not match its checksum")
+
+    try:
+        if inflater is not None:
+            inflater.finish()
+        metadata = analyzer.finish() if analyzer is not None else {}
+    except PARSE_ERRORS as exc:
+        raise ProcessingError(f"File could not be parsed: {exc}") from exc
+
+    return {
+        "format": file_format or "unknown",
+        "compression": "gzip" if inflater else None,
+        "size": size,
+        "sha256": digest,
+        "security_findings": scan.findings,
+        **metadata,
+    }
+
+
+def _release_claim(db: Session, content_id: int):
+    """Put content back to pending so the retry can claim it again."""
+    try:
+        db.rollback()
+        db.execute(
+            update(Content)
+            .where(Content.id == content_id, Content.processing_status == "processing")
+            .values(processing_status="pending")
+        )
+        db.commit()
+    except Exception:
+        # Left processing; it is claimed again once it counts as stalled
+        logger.exception("Could not release the processing claim on content %s", content_id)
+
+
+def process_content(db: Session, content_id: int) -> str:
+    """Process the file of ``content_id`` and return its resulting status.
+
+    Content is claimed if it is pending or failed, or has been processing for
+    longer than ``PROCESSING_STALLED_AFTER`` (its worker died), so a duplicate
+    delivery finds it claimed and does nothing. Transient errors (storage or
+    database) put the content back to pending and propagate for the caller to
+    retry; invalid files mark the content failed.
+    """
+    stalled_before = datetime.now(timezone.utc) - PROCESSING_STALLED_AFTER
+    claimed = db.execute(
+        update(Content)
+        .where(
+            Content.id == content_id,
+            Content.processing_status.in_(("pending", "failed"))
+            | ((Content.processing_status == "processing") & (Content.updated_at < stalled_before)),
+        )
+        .values(processing_status="processing", processing_error=None)
+        .execution_options(synchronize_session=False)  # the commit below expires the session
+    ).rowcount
+    db.commit()
+    content = db.get(Content, content_id)
+    if not claimed or content is None or not content.file_path:
+        return content.processing_status if content else "missing"
+
+    # The same file was already processed for other content
+    reused = db.scalar(
+        select(Content.file_metadata).where(
+            Content.file_hash == content.file_hash,
+            Content.processing_status == "ready",
+            Content.id != content.id,
+        ).limit(1)
+    ) if content.file_hash else None
+
+    if reused is not None:
+        metadata = reused
+    else:
+        try:
+            backend = storage.get_storage()
+            # Files uploaded before content-addressed storage keep their plain path
+            stream = backend.open(content.file_path) if content.file_path.startswith("sha256/") else open(content.file_path, "rb")
+            with stream:
+                metadata = analyze_stream(stream, content.file_name or content.file_path, content.file_hash)
+        except ProcessingError as exc:
+            content.processing_status = "failed"
+            content.processing_error = str(exc)
+            db.commit()
+            logger.info("Content %s failed processing: %s", content_id, exc)
+            return "failed"
+        except Exception:
+            _release_claim(db, content_id)
+            raise
+
+    content.file_metadata = metadata
+    content.processing_status = "ready"
+    content.is_published = True
+    db.commit()
+    return "ready"
@@ -0,0 +1,180 @@
+"""Denormalized review ratings.
+
+Every content row keeps the running ``rating_sum`` and ``review_count`` of its
+reviews, and every creator profile the same over all of the creator's content.
+``submit_review`` stores a review and folds it into both with relative
+``UPDATE ... SET rating_sum = rating_sum + :delta`` statements in the review's
+transaction, so concurrent reviews never lose an update and nothing rescans
+``reviews``. The mean ``rating`` and the ``bayesian_rating`` used by
+``min_rating`` filters and rating-ordered listings are recomputed from the new
+running totals in the same statement.
+
+The Bayesian score shrinks the mean of an item with few reviews towards
+``RATING_PRIOR_MEAN`` as if it had ``RATING_PRIOR_WEIGHT`` extra reviews at that
+mean, so a single five-star review does not outrank a hundred four-star ones.
+Unreviewed content scores 0 and sorts last. ``reconcile_ratings`` (a daily
+celery task) recomputes everything from ``reviews`` and corrects any drift,
+including scores left over from a changed prior.
+"""
+import logging
+import os
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, bindparam, case, func, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Content, CreatorProfile, Review
+
+logger = logging.getLogger(__name__)
+
+RATING_PRIOR_MEAN = float(os.getenv("RATING_PRIOR_MEAN", "3.0"))
+RATING_PRIOR_WEIGHT = float(os.getenv("RATING_PRIOR_WEIGHT", "5"))
+MIN_RATING, MAX_RATING = 1, 5
+DRIFT_TOLERANCE = 1e-6
+
+content_table = Content.__table__
+creator_table = CreatorProfile.__table__
+
+
+def mean(rating_sum, review_count):
+    return case((review_count > 0, rating_sum * 1.0 / review_count), else_=0.0)
+
+
+def bayesian(rating_sum, review_count):
+    shrunk = (literal(RATING_PRIOR_WEIGHT * RATING_PRIOR_MEAN) + rating_sum) / (literal(RATING_PRIOR_WEIGHT) + review_count)
+    return case((review_count > 0, shrunk), else_=0.0)
+
+
+def _aggregates(rating_sum, review_count, bayesian_score: bool):
+    values = {"rating_sum": rating_sum, "review_count": review_count, "rating": mean(rating_sum, review_count)}
+    if bayesian_score:
+        values["bayesian_rating"] = bayesian(rating_sum, review_count)
+    return values
+
+
+def _fold(sum_delta: int, count_delta: int):
+    """SET clauses adding a review delta to a table's running totals."""
+    def values(table, bayesian_score):
+        rating_sum = func.coalesce(table.c.rating_sum, 0) + sum_delta
+        review_count = func.coalesce(table.c.review_count, 0) + count_delta
+        return _aggregates(rating_sum, review_count, bayesian_score)
+
+    return values
+
+
+async def apply_review(db: AsyncSession, content_id: int, sum_delta: int, count_delta: int):
+    """Fold one review delta into the content and its creator."""
+    values = _fold(sum_delta, count_delta)
+    creator_id = await db.scalar(
+        update(content_table).where(content_table.c.id == content_id)
+        .values(**values(content_table, True)).returning(content_table.c.creator_id)
+    )
+    await db.execute(
+        update(creator_table).where(creator_table.c.user_id == creator_id)
+        .values(**values(creator_table, False))
+    )
+    # Listings sort by rating; Core updates do not reach the response cache's mapper events
+    db.info["catalogue_changed"] = True
+
+
+async def submit_review(db: AsyncSession, content: Content, user_id: int, rating: int, comment: str = None) -> Review:
+    """Create the user's review of ``content``, or replace it if they already wrote one."""
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise HTTPException(status_code=400, detail=f"Rating must be between {MIN_RATING} and {MAX_RATING}")
+
+    # Lock an existing review so that two edits cannot fold the same old rating out twice
+    review = await db.scalar(
+        select(Review).where(Review.content_id == content.id, Review.user_id == user_id).with_for_update()
+    )
+    if review:
+        sum_delta, count_delta = rating - review.rating, 0
+        review.rating, review.comment = rating, comment
+    else:
+        sum_delta, count_delta = rating, 1
+        review = Review(content_id=content.id, user_id=user_id, rating=rating, comment=comment)
+        db.add(review)
+
+    try:
+        await db.flush()
+    except IntegrityError:
+        # Another request created this user's review first
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Review already submitted; retry to update it")
+    await apply_review(db, content.id, sum_delta, count_delta)
+    # Core updates skip mapper events; rating-ordered pages must not be served stale (see response_cache.py)
+    db.info["catalogue_changed"] = True
+    await db.commit()
+    await db.refresh(review, ["created_at"])
+    return review
+
+
+def _content_drift(db: Session):
+    reviews = select(
+        Review.content_id, func.count(Review.id).label("review_count"), func.sum(Review.rating).label("rating_sum"),
+    ).group_by(Review.content_id).subquery()
+    rating_sum = func.coalesce(reviews.c.rating_sum, 0)
+    review_count = func.coalesce(reviews.c.review_count, 0)
+    return db.execute(
+        select(content_table.c.id.label("key"), rating_sum.label("rating_sum"), review_count.label("review_count"))
+        .outerjoin(reviews, reviews.c.content_id == content_table.c.id)
+        .where(or_(
+            func.coalesce(content_table.c.rating_sum, -1) != rating_sum,
+            func.coalesce(content_table.c.review_count, -1) != review_count,
+            func.abs(func.coalesce(content_table.c.rating, -1.0) - mean(rating_sum, review_count)) > DRIFT_TOLERANCE,
+            func.abs(
+                func.coalesce(content_table.c.bayesian_rating, -1.0) - bayesian(rating_sum, review_count)
+            ) > DRIFT_TOLERANCE,
+        ))
+    ).all()
+
+
+def _creator_drift(db: Session):
+    reviews = select(
+        Content.creator_id, func.count(Review.id).label("review_count"), func.sum(Review.rating).label("rating_sum"),
+    ).join(Content, Content.id == Review.content_id).group_by(Content.creator_id).subquery()
+    rating_sum = func.coalesce(reviews.c.rating_sum, 0)
+    review_count = func.coalesce(reviews.c.review_count, 0)
+    return db.execute(
+        select(creator_table.c.user_id.label("key"), rating_sum.label("rating_sum"), review_count.label("review_count"))
+        .outerjoin(reviews, reviews.c.creator_id == creator_table.c.user_id)
+        .where(or_(
+            func.coalesce(creator_table.c.rating_sum, -1) != rating_sum,
+            func.coalesce(creator_table.c.review_count, -1) != review_count,
+            func.abs(func.coalesce(creator_table.c.rating, -1.0) - mean(rating_sum, review_count)) > DRIFT_TOLERANCE,
+        ))
+    ).all()
+
+
+def _correct(db: Session, table, key_column, rows, bayesian_score: bool):
+    values = _aggregates(bindparam("b_sum", type_=Integer), bindparam("b_count", type_=Integer), bayesian_score)
+    db.execute(
+        update(table).where(key_column == bindparam("b_key")).values(**values)
+        .execution_options(synchronize_session=False),
+        [{"b_key": row.key, "b_sum": row.rating_sum, "b_count": row.review_count} for row in rows],
+    )
+
+
+def reconcile_ratings(db: Session) -> dict:
+    """Recompute every stored rating from ``reviews`` and correct the rows that drifted.
+
+    Returns the number of corrected content rows and creator profiles.
+    """
+    content = _content_drift(db)
+    creators = _creator_drift(db)
+    if content:
+        _correct(db, content_table, content_table.c.id, content, True)
+    if creators:
+        _correct(db, creator_table, creator_table.c.user_id, creators, False)
+    if content or creators:
+        logger.warning("Ratings drifted: %d content rows, %d creator profiles corrected", len(content), len(creators))
+    if content:
+        db.info["catalogue_changed"] = True
+    db.commit()
+    return {"content": len(content), "creators": len(creators)}
+
+
+def listing_keys(sort: str):
+    """Pagination keys for a catalogue listing: newest first, or best rated first."""
+    return [Content.bayesian_rating, Content.id] if sort == "rating" else [Content.id]
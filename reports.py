@@ -0,0 +1,348 @@
+"""Creator usage and earnings reports (``tasks.generate_usage_report``).
+
+A report covers one creator and one period (``YYYY``, ``YYYY-MM`` or
+``YYYY-MM-DD``) and is written in each of ``REPORT_FORMATS``:
+
+- ``csv`` and ``parquet``: one row per usage record and one per transaction,
+  in ``usage`` and ``transactions`` files;
+- ``pdf``: totals, a per-content breakdown and a daily series.
+
+Rows are streamed in batches of ``REPORT_BATCH_SIZE`` (server-side cursors on
+PostgreSQL), written out as they arrive and folded into per-content and
+per-day totals, so memory depends on the batch size and the number of
+content items and days, not on the number of rows. Usage is read one content
+item at a time along ``ix_usage_records_content_created`` and transactions
+along ``ix_transactions_creator_created``, so neither query sorts.
+
+Reports run on the ``reports`` Celery queue, one creator per task, so they
+can be spread over as many worker processes as there are to spare without
+holding up upload processing.
+"""
+import csv
+import logging
+import os
+import shutil
+import tempfile
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import storage
+from database import dialect_insert
+from models import Content, CreatorReport, Transaction, User, UsageRecord
+
+logger = logging.getLogger(__name__)
+
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "10000"))
+REPORT_FORMATS = tuple(os.getenv("REPORT_FORMATS", "csv,pdf").split(","))
+REPORT_TMP_DIR = os.getenv("REPORT_TMP_DIR")  # defaults to the system temp dir
+
+PERIOD_FORMATS = (("%Y-%m-%d", relativedelta(days=1)), ("%Y-%m", relativedelta(months=1)), ("%Y", relativedelta(years=1)))
+
+USAGE_COLUMNS = (
+    ("record_id", "int"), ("created_at", "timestamp"), ("content_id", "int"),
+    ("content_title", "str"), ("usage_type", "str"), ("cost", "float"),
+)
+TRANSACTION_COLUMNS = (
+    ("transaction_id", "int"), ("created_at", "timestamp"), ("content_id", "int"), ("content_title", "str"),
+    ("status", "str"), ("amount", "float"), ("platform_fee", "float"), ("creator_earnings", "float"),
+)
+
+
+class ReportError(Exception):
+    """The report cannot be generated as requested."""
+
+
+def parse_period(period: str):
+    """Return the ``[start, end)`` UTC range of ``period``."""
+    for fmt, length in PERIOD_FORMATS:
+        try:
+            start = datetime.strptime(period, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        return start, start + length
+    raise ReportError(f"Invalid period {period!r}; expected YYYY, YYYY-MM or YYYY-MM-DD")
+
+
+def previous_month(now: datetime = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return (now.replace(day=1) - relativedelta(months=1)).strftime("%Y-%m")
+
+
+# Outputs: write(rows) is called once per batch
+
+class CsvOutput:
+    extension = "csv"
+
+    def __init__(self, path: str, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([name for name, _ in columns])
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    extension = "parquet"
+
+    def __init__(self, path: str, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as exc:
+            raise RuntimeError("Parquet reports require pyarrow") from exc
+        types = {
+            "int": pyarrow.int64(), "float": pyarrow.float64(), "str": pyarrow.string(),
+            "timestamp": pyarrow.timestamp("us", tz="UTC"),
+        }
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        # One row group per batch
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+TABULAR_OUTPUTS = {"csv": CsvOutput, "parquet": ParquetOutput}
+
+
+def _pdf_text(text: str) -> str:
+    text = text.encode("latin-1", errors="replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, lines, lines_per_page: int = 60):
+    """Write ``lines`` as a plain monospaced A4 document."""
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    # 1: catalog, 2: page tree, 3: font, then a content stream and a page per page
+    objects = [b"", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>"]
+    kids = []
+    for page in pages:
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td\n" + "".join(f"({_pdf_text(line)}) '\n" for line in page) + "ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    with open(path, "wb") as output:
+        output.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(output.tell())
+            output.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = output.tell()
+        output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        output.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+        output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+# Generation
+
+class _Totals:
+    """Running per-content and per-day totals."""
+
+    def __init__(self):
+        self.content = defaultdict(lambda: {
+            "usage_count": 0, "usage_cost": 0.0, "usage_types": Counter(), "distinct_users": 0,
+            "transactions": 0, "gross": 0.0, "platform_fees": 0.0, "earnings": 0.0,
+        })
+        self.daily = defaultdict(lambda: {"usage_count": 0, "usage_cost": 0.0, "transactions": 0, "earnings": 0.0})
+        self.transaction_statuses = Counter()
+
+    def add_usage(self, rows):
+        for _, created_at, content_id, _, usage_type, cost in rows:
+            totals, day = self.content[content_id], self.daily[created_at.date().isoformat()]
+            totals["usage_count"] += 1
+            totals["usage_cost"] += cost or 0.0
+            totals["usage_types"][usage_type] += 1
+            day["usage_count"] += 1
+            day["usage_cost"] += cost or 0.0
+
+    def add_transactions(self, rows):
+        for _, created_at, content_id, _, status, amount, platform_fee, earnings in rows:
+            self.transaction_statuses[status] += 1
+            if status != "completed":
+                continue
+            totals, day = self.content[content_id], self.daily[created_at.date().isoformat()]
+            totals["transactions"] += 1
+            totals["gross"] += amount or 0.0
+            totals["platform_fees"] += platform_fee or 0.0
+            totals["earnings"] += earnings or 0.0
+            day["transactions"] += 1
+            day["earnings"] += earnings or 0.0
+
+    def summary(self, titles: dict) -> dict:
+        content = [
+            {"content_id": content_id, "title": titles.get(content_id), **totals, "usage_types": dict(totals["usage_types"])}
+            for content_id, totals in sorted(self.content.items())
+        ]
+        return {
+            "usage_count": sum(item["usage_count"] for item in content),
+            "usage_cost": round(sum(item["usage_cost"] for item in content), 2),
+            "transactions": sum(item["transactions"] for item in content),
+            "gross": round(sum(item["gross"] for item in content), 2),
+            "platform_fees": round(sum(item["platform_fees"] for item in content), 2),
+            "earnings": round(sum(item["earnings"] for item in content), 2),
+            "transaction_statuses": dict(self.transaction_statuses),
+            "content": content,
+            "daily": [{"day": day, **totals} for day, totals in sorted(self.daily.items())],
+        }
+
+
+def _stream(db: Session, query):
+    """Yield the rows of ``query`` in batches of REPORT_BATCH_SIZE."""
+    yield from db.execute(query.execution_options(yield_per=REPORT_BATCH_SIZE)).partitions()
+
+
+def _with_titles(rows, titles: dict):
+    return [(row[0], row[1], row[2], titles.get(row[2]), *row[3:]) for row in rows]
+
+
+def _pdf_lines(creator: User, period: str, summary: dict, generated_at: datetime):
+    lines = [
+        f"Usage and earnings report: {creator.username}",
+        f"Period: {period}    Generated: {generated_at:%Y-%m-%d %H:%M} UTC",
+        "",
+        f"Usage events:         {summary['usage_count']:>14,}",
+        f"Usage charges:        {summary['usage_cost']:>14,.2f}",
+        f"Sales:                {summary['transactions']:>14,}",
+        f"Gross sales:          {summary['gross']:>14,.2f}",
+        f"Platform fees:        {summary['platform_fees']:>14,.2f}",
+        f"Earnings:             {summary['earnings']:>14,.2f}",
+        "Transactions by status: " + (", ".join(
+            f"{status} {count:,}" for status, count in sorted(summary["transaction_statuses"].items())
+        ) or "none"),
+        "",
+        f"{'Content':<36} {'Usage':>10} {'Users':>8} {'Sales':>8} {'Earnings':>12}",
+    ]
+    lines += [
+        f"{(item['title'] or str(item['content_id']))[:36]:<36} {item['usage_count']:>10,} "
+        f"{item['distinct_users']:>8,} {item['transactions']:>8,} {item['earnings']:>12,.2f}"
+        for item in summary["content"]
+    ]
+    lines += ["", f"{'Day':<12} {'Usage':>10} {'Charges':>12} {'Sales':>8} {'Earnings':>12}"]
+    lines += [
+        f"{item['day']:<12} {item['usage_count']:>10,} {item['usage_cost']:>12,.2f} "
+        f"{item['transactions']:>8,} {item['earnings']:>12,.2f}"
+        for item in summary["daily"]
+    ]
+    return lines
+
+
+def _set_status(db: Session, creator_id: int, period: str, status: str):
+    insert = dialect_insert(db.get_bind().dialect.name)
+    stmt = insert(CreatorReport).values(creator_id=creator_id, period=period, status=status)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["creator_id", "period"], set_={"status": status, "error": None}
+    ))
+    db.commit()
+    return db.scalar(select(CreatorReport).where(CreatorReport.creator_id == creator_id, CreatorReport.period == period))
+
+
+def generate_report(db: Session, creator_id: int, period: str, formats=REPORT_FORMATS) -> dict:
+    """Generate and store the report of ``creator_id`` for ``period``; returns the storage keys by format."""
+    start, end = parse_period(period)
+    creator = db.get(User, creator_id)
+    if creator is None:
+        raise ReportError(f"Creator {creator_id} does not exist")
+    unknown = set(formats) - set(TABULAR_OUTPUTS) - {"pdf"}
+    if unknown:
+        raise ReportError(f"Unknown report formats: {', '.join(sorted(unknown))}")
+
+    report = _set_status(db, creator_id, period, "running")
+    workdir = tempfile.mkdtemp(prefix="report-", dir=REPORT_TMP_DIR)
+    try:
+        titles = dict(db.execute(select(Content.id, Content.title).where(Content.creator_id == creator_id)).all())
+        totals = _Totals()
+        paths = []
+        usage_outputs, transaction_outputs = [], []
+        for fmt in formats:
+            if fmt in TABULAR_OUTPUTS:
+                output_class = TABULAR_OUTPUTS[fmt]
+                for name, columns, outputs in (
+                    ("usage", USAGE_COLUMNS, usage_outputs), ("transactions", TRANSACTION_COLUMNS, transaction_outputs)
+                ):
+                    path = os.path.join(workdir, f"{name}.{output_class.extension}")
+                    outputs.append(output_class(path, columns))
+                    paths.append((fmt, path))
+
+        try:
+            for content_id in sorted(titles):
+                for rows in _stream(db, select(
+                    UsageRecord.id, UsageRecord.created_at, UsageRecord.content_id, UsageRecord.usage_type, UsageRecord.cost,
+                ).where(
+                    UsageRecord.content_id == content_id, UsageRecord.created_at >= start, UsageRecord.created_at < end,
+                ).order_by(UsageRecord.created_at, UsageRecord.id)):
+                    rows = _with_titles(rows, titles)
+                    totals.add_usage(rows)
+                    for output in usage_outputs:
+                        output.write(rows)
+
+            for rows in _stream(db, select(
+                Transaction.id, Transaction.created_at, Transaction.content_id, Transaction.status,
+                Transaction.amount, Transaction.platform_fee, Transaction.creator_earnings,
+            ).where(
+                Transaction.creator_id == creator_id, Transaction.created_at >= start, Transaction.created_at < end,
+            ).order_by(Transaction.created_at, Transaction.id)):
+                rows = _with_titles(rows, titles)
+                totals.add_transactions(rows)
+                for output in transaction_outputs:
+                    output.write(rows)
+        finally:
+            for output in usage_outputs + transaction_outputs:
+                output.close()
+
+        # Distinct users are left to the database rather than held in memory
+        for content_id, users in db.execute(
+            select(UsageRecord.content_id, func.count(func.distinct(UsageRecord.user_id)))
+            .where(UsageRecord.content_id.in_(list(totals.content)), UsageRecord.created_at >= start, UsageRecord.created_at < end)
+            .group_by(UsageRecord.content_id)
+        ):
+            totals.content[content_id]["distinct_users"] = users
+
+        summary = totals.summary(titles)
+        generated_at = datetime.now(timezone.utc)
+        if "pdf" in formats:
+            path = os.path.join(workdir, "report.pdf")
+            write_pdf(path, _pdf_lines(creator, period, summary, generated_at))
+            paths.append(("pdf", path))
+
+        files = defaultdict(list)
+        backend = storage.get_storage()
+        for fmt, path in paths:
+            key = f"reports/{creator_id}/{period}/{os.path.basename(path)}"
+            backend.put(path, key, overwrite=True)
+            files[fmt].append(key)
+
+        report.status = "ready"
+        report.files = dict(files)
+        report.summary = {key: value for key, value in summary.items() if key not in ("content", "daily")}
+        report.completed_at = generated_at
+        db.commit()
+        return report.files
+    except Exception as exc:
+        db.rollback()
+        report.status = "failed"
+        report.error = str(exc)
+        db.commit()
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,226 @@
+"""Response cache for anonymous, read-heavy catalogue endpoints.
+
+Responses are stored pre-serialized (JSON bytes plus the headers that matter)
+in the two-tier cache from cache.py, keyed by path, query string and the
+current catalogue version. Any committed ORM change to ``Content`` (publish,
+edit, new upload) bumps the version, locally and in Redis, which orphans every
+cached page at once; orphaned entries simply age out. Other processes pick up
+a bump within ``CATALOGUE_VERSION_TTL`` seconds. Core writes, which mapper
+events do not see, set ``session.info["catalogue_changed"]`` before commit.
+
+Usage and download counters change constantly, so writes to them set
+``session.info["catalogue_counters_changed"]`` instead: that bumps the version
+at most once per ``RESPONSE_CACHE_TTL``, so counts in cached pages are never
+older than the local TTL, in any tier.
+
+Every response carries a strong ETag, and ``If-None-Match`` revalidation is
+answered with 304 without touching the database or the serializer.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+
+import redis
+from fastapi import Request, Response
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from cache import CACHE_REDIS_URL, TieredCache, get_redis
+from models import Content
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_REDIS_TTL = float(os.getenv("RESPONSE_CACHE_REDIS_TTL", "300"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+CATALOGUE_VERSION_TTL = float(os.getenv("CATALOGUE_VERSION_TTL", "1"))
+CATALOGUE_VERSION_KEY = "catalogue:version"
+
+# Response headers that are part of the cached representation
+CACHED_HEADERS = ("x-next-cursor",)
+
+
+class CatalogueVersion:
+    """Monotonic version of the published catalogue, shared through Redis when available."""
+
+    def __init__(self):
+        self.value = 0
+        self._checked_at = 0.0
+        self._bumped_at = 0.0
+        self._counters_changed = False
+        self._sync_redis = None
+        self._publishing = set()
+
+    def _seen(self, value: int):
+        # Never go back: a local bump may not have reached Redis yet
+        self.value = max(self.value, value)
+        self._checked_at = time.monotonic()
+
+    async def current(self) -> int:
+        if self._counters_changed and time.monotonic() - self._bumped_at >= RESPONSE_CACHE_TTL:
+            self.bump()
+        client = get_redis()
+        if client is not None and time.monotonic() - self._checked_at > CATALOGUE_VERSION_TTL:
+            try:
+                self._seen(int(await client.get(CATALOGUE_VERSION_KEY) or 0))
+            except RedisError as exc:
+                logger.warning("Could not read catalogue version: %s", exc)
+        return self.value
+
+    def bump(self):
+        """Move to a new version: at once locally, and in Redis without blocking the event loop."""
+        self.value += 1
+        self._bumped_at = time.monotonic()
+        self._counters_changed = False
+        if not CACHE_REDIS_URL:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Celery workers and scripts: no event loop to hold up
+            self._publish_sync()
+            return
+        task = loop.create_task(self._publish())
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    def counters_changed(self):
+        """Bump for counter updates, at most once per ``RESPONSE_CACHE_TTL``."""
+        if time.monotonic() - self._bumped_at >= RESPONSE_CACHE_TTL:
+            self.bump()
+        else:
+            self._counters_changed = True  # bumped by current() once the interval has passed
+
+    async def _publish(self):
+        try:
+            self._seen(int(await get_redis().incr(CATALOGUE_VERSION_KEY)))
+        except RedisError as exc:
+            logger.warning("Could not publish catalogue version: %s", exc)
+
+    def _publish_sync(self):
+        if self._sync_redis is None:
+            self._sync_redis = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=0.25, socket_connect_timeout=0.25)
+        try:
+            self._seen(int(self._sync_redis.incr(CATALOGUE_VERSION_KEY)))
+        except RedisError as exc:
+            logger.warning("Could not publish catalogue version: %s", exc)
+
+
+class ResponseCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "hit_ratio": self.hit_ratio,
+            "avg_hit_ms": 1000 * self.hit_seconds / self.hits if self.hits else 0.0,
+            "avg_miss_ms": 1000 * self.miss_seconds / self.misses if self.misses else 0.0,
+            "entries": len(_cache.local),
+            "redis_hits": _cache.redis_hits,
+            "redis_errors": _cache.redis_errors,
+        }
+
+
+def _dumps(entry) -> bytes:
+    etag, headers, body = entry
+    header_line = "\t".join(f"{name}:{value}" for name, value in headers.items())
+    return b"\n".join([etag.encode(), header_line.encode(), body])
+
+
+def _loads(raw: bytes):
+    etag, header_line, body = raw.split(b"\n", 2)
+    headers = dict(item.split(":", 1) for item in header_line.decode().split("\t") if item)
+    return etag.decode(), headers, body
+
+
+catalogue_version = CatalogueVersion()
+stats = ResponseCacheStats()
+_cache = TieredCache(
+    "response",
+    dumps=_dumps,
+    loads=_loads,
+    maxsize=RESPONSE_CACHE_SIZE,
+    ttl=RESPONSE_CACHE_TTL,
+    redis_ttl=RESPONSE_CACHE_REDIS_TTL,
+)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _respond(request: Request, etag: str, headers: dict, body: bytes, cache_status: str) -> Response:
+    headers = {**headers, "ETag": etag, "Cache-Control": "no-cache", "X-Cache": cache_status}
+    if _etag_matches(request, etag):
+        stats.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def cached(request: Request, response: Response, produce) -> Response:
+    """Serve ``produce()`` through the cache.
+
+    ``produce`` is the endpoint's own coroutine returning the JSON body (see
+    listing.py); headers it sets on ``response`` (such as the pagination
+    cursor) are cached with the body.
+    """
+    started_at = time.perf_counter()
+    key = f"{await catalogue_version.current()}:{request.url.path}?{request.url.query}"
+
+    entry = await _cache.get(key)
+    if entry is not None:
+        stats.hits += 1
+        stats.hit_seconds += time.perf_counter() - started_at
+        return _respond(request, *entry, cache_status="HIT")
+
+    body = await produce()
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+    await _cache.set(key, (etag, headers, body))
+
+    stats.misses += 1
+    stats.miss_seconds += time.perf_counter() - started_at
+    return _respond(request, etag, headers, body, cache_status="MISS")
+
+
+@event.listens_for(Content, "after_insert")
+@event.listens_for(Content, "after_update")
+@event.listens_for(Content, "after_delete")
+def _mark_catalogue_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["catalogue_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_catalogue_change(session):
+    counters_changed = session.info.pop("catalogue_counters_changed", False)
+    if session.info.pop("catalogue_changed", False):
+        catalogue_version.bump()
+    elif counters_changed:
+        catalogue_version.counters_changed()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalogue_change(session):
+    session.info.pop("catalogue_changed", None)
+    session.info.pop("catalogue_counters_changed", None)
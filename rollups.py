@@ -0,0 +1,269 @@
+"""Incremental rollups over append-only source tables.
+
+Each rollup remembers the highest source row id it has folded in
+(``RollupCheckpoint``) and on every run only reads rows above it, so the cost
+of a run depends on how much was written since the last one, not on lifetime
+volume. Readers combine the rollup tables with the un-rolled tail above the
+checkpoint to get exact totals.
+
+Ids are allocated when a row is inserted, but the row only becomes visible
+when its transaction commits, which can be after rows with higher ids (usage
+is written in batches, see usage_ingest.py). A run therefore never folds past
+``settled_upper_id``: the highest id another run saw at least
+``ROLLUP_SETTLE_SECONDS`` earlier, by which time every transaction holding a
+lower id has ended. That setting must exceed the longest transaction that
+writes usage records or transactions.
+
+Payment transactions are only folded once final. One still pending after
+``ROLLUP_PENDING_WAIT_SECONDS`` (an abandoned checkout, say) no longer holds
+the checkpoint back: it is recorded in ``RollupDeferredRow`` and folded by a
+later run once it settles.
+"""
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import (
+    Content, ContentDailyRollup, ContentUsageHourly, CreatorDailyRollup, RollupCheckpoint,
+    RollupDailyUser, RollupDeferredRow, Transaction, UsageRecord,
+)
+
+ROLLUP_BATCH_SIZE = 50000
+ROLLUP_SETTLE_SECONDS = float(os.getenv("ROLLUP_SETTLE_SECONDS", "60"))
+ROLLUP_PENDING_WAIT_SECONDS = float(os.getenv("ROLLUP_PENDING_WAIT_SECONDS", "3600"))
+
+# Transactions are only folded once they can no longer change
+FINAL_TRANSACTION_STATUSES = ("completed", "failed")
+
+
+def get_checkpoint(db: Session, name: str) -> RollupCheckpoint:
+    checkpoint = db.get(RollupCheckpoint, name, with_for_update=True)
+    if checkpoint is None:
+        checkpoint = RollupCheckpoint(name=name, last_id=0)
+        db.add(checkpoint)
+    return checkpoint
+
+
+def _aware(value):
+    # SQLite hands timestamps back without their (UTC) timezone
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def settled_upper_id(db: Session, name: str, id_column) -> int:
+    """Highest id of ``id_column`` the rollup ``name`` may fold up to; 0 if none is settled yet.
+
+    Records the current highest id (in the checkpoint ``<name>:observed``) for a
+    later run once the previous observation is old enough to be used.
+    """
+    highest = db.scalar(select(func.max(id_column))) or 0
+    if not ROLLUP_SETTLE_SECONDS:
+        return highest
+
+    now = datetime.now(timezone.utc)
+    observed = get_checkpoint(db, f"{name}:observed")
+    observed_at = _aware(observed.updated_at)
+    if observed_at is not None and (now - observed_at).total_seconds() < ROLLUP_SETTLE_SECONDS:
+        return 0
+
+    upper_id = observed.last_id
+    observed.last_id, observed.updated_at = highest, now
+    return upper_id
+
+
+def upsert_increments(db: Session, model, key_columns, rows):
+    """Insert ``rows`` into ``model``, adding their values onto existing rows with the same key."""
+    if not rows:
+        return
+    insert = dialect_insert(db.get_bind().dialect.name)
+    stmt = insert(model)
+    increments = {
+        name: getattr(model, name) + getattr(stmt.excluded, name)
+        for name in rows[0] if name not in key_columns
+    }
+    db.execute(stmt.on_conflict_do_update(index_elements=key_columns, set_=increments), rows)
+
+
+def _new_usage_rows(db: Session, checkpoint: RollupCheckpoint, upper_id: int, *columns):
+    """Yield batches of usage records above the checkpoint, advancing it as they are consumed."""
+    while checkpoint.last_id < upper_id:
+        rows = db.execute(
+            select(UsageRecord.id, *columns)
+            .where(UsageRecord.id > checkpoint.last_id, UsageRecord.id <= upper_id)
+            .order_by(UsageRecord.id)
+            .limit(ROLLUP_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        yield rows
+        checkpoint.last_id = rows[-1].id
+
+
+def _hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def fold_usage_hourly(db: Session) -> int:
+    """Add usage records written since the last run to the per-content hourly buckets.
+
+    Returns the number of usage records folded in.
+    """
+    checkpoint = get_checkpoint(db, "content_usage_hourly")
+    upper_id = settled_upper_id(db, "content_usage_hourly", UsageRecord.id)
+
+    folded = 0
+    for rows in _new_usage_rows(db, checkpoint, upper_id, UsageRecord.content_id, UsageRecord.created_at):
+        buckets = Counter((row.content_id, _hour(row.created_at)) for row in rows)
+        upsert_increments(db, ContentUsageHourly, ["content_id", "hour"], [
+            {"content_id": content_id, "hour": hour, "usage_count": n}
+            for (content_id, hour), n in buckets.items()
+        ])
+        folded += len(rows)
+
+    db.commit()
+    return folded
+
+
+def _count_new_users(db: Session, scope: str, users_by_key) -> Counter:
+    """Record (scope id, day, user) memberships and count the ones not seen before."""
+    rows = [
+        {"scope": scope, "scope_id": scope_id, "day": day, "user_id": user_id}
+        for (scope_id, day), user_ids in users_by_key.items()
+        for user_id in user_ids
+    ]
+    if not rows:
+        return Counter()
+    insert = dialect_insert(db.get_bind().dialect.name)
+    stmt = insert(RollupDailyUser).on_conflict_do_nothing().returning(RollupDailyUser.scope_id, RollupDailyUser.day)
+    return Counter((scope_id, day) for scope_id, day in db.execute(stmt, rows))
+
+
+def fold_daily_usage(db: Session) -> int:
+    """Fold new usage records into the per-content and per-creator daily rollups."""
+    checkpoint = get_checkpoint(db, "daily_usage")
+    upper_id = settled_upper_id(db, "daily_usage", UsageRecord.id)
+
+    folded = 0
+    batches = _new_usage_rows(
+        db, checkpoint, upper_id,
+        UsageRecord.content_id, UsageRecord.user_id, UsageRecord.cost, UsageRecord.created_at,
+    )
+    for rows in batches:
+        creators = dict(db.execute(
+            select(Content.id, Content.creator_id).where(Content.id.in_({row.content_id for row in rows}))
+        ).all())
+
+        by_content = defaultdict(lambda: [0, 0.0])
+        by_creator = defaultdict(lambda: [0, 0.0])
+        content_users = defaultdict(set)
+        creator_users = defaultdict(set)
+        for row in rows:
+            day = row.created_at.date()
+            creator_id = creators.get(row.content_id)
+            for totals in (by_content[(row.content_id, day)], by_creator[(creator_id, day)]):
+                totals[0] += 1
+                totals[1] += row.cost or 0.0
+            if row.user_id is not None:
+                content_users[(row.content_id, day)].add(row.user_id)
+                creator_users[(creator_id, day)].add(row.user_id)
+
+        new_content_users = _count_new_users(db, "content", content_users)
+        new_creator_users = _count_new_users(db, "creator", creator_users)
+
+        upsert_increments(db, ContentDailyRollup, ["content_id", "day"], [
+            {
+                "content_id": content_id,
+                "day": day,
+                "creator_id": creators.get(content_id),
+                "usage_count": usage_count,
+                "cost": cost,
+                "distinct_users": new_content_users[(content_id, day)],
+            }
+            for (content_id, day), (usage_count, cost) in by_content.items()
+            if content_id in creators
+        ])
+        upsert_increments(db, CreatorDailyRollup, ["creator_id", "day"], [
+            {
+                "creator_id": creator_id,
+                "day": day,
+                "usage_count": usage_count,
+                "cost": cost,
+                "distinct_users": new_creator_users[(creator_id, day)],
+            }
+            for (creator_id, day), (usage_count, cost) in by_creator.items()
+            if creator_id is not None
+        ])
+        folded += len(rows)
+
+    db.commit()
+    return folded
+
+
+def fold_daily_transactions(db: Session) -> int:
+    """Fold final transactions into the per-creator daily rollups.
+
+    The checkpoint stops at the first transaction that is still pending, so
+    nothing is skipped when it settles later, unless it has been pending for
+    longer than ``ROLLUP_PENDING_WAIT_SECONDS``: then it is deferred and the
+    checkpoint moves on. Deferred transactions that have since settled are
+    folded on every run.
+    """
+    checkpoint = get_checkpoint(db, "daily_transactions")
+    upper_id = settled_upper_id(db, "daily_transactions", Transaction.id)
+    columns = (Transaction.id, Transaction.creator_id, Transaction.amount,
+               Transaction.creator_earnings, Transaction.status, Transaction.created_at)
+    rows = db.execute(
+        select(*columns)
+        .where(Transaction.id > checkpoint.last_id, Transaction.id <= upper_id)
+        .order_by(Transaction.id)
+        .limit(ROLLUP_BATCH_SIZE)
+    ).all()
+    settled = db.execute(
+        select(*columns)
+        .join(RollupDeferredRow, RollupDeferredRow.source_id == Transaction.id)
+        .where(RollupDeferredRow.name == "daily_transactions",
+               Transaction.status.in_(FINAL_TRANSACTION_STATUSES))
+    ).all()
+
+    stuck_before = datetime.now(timezone.utc) - timedelta(seconds=ROLLUP_PENDING_WAIT_SECONDS)
+    final, deferred = list(settled), []
+    for row in rows:
+        if row.status not in FINAL_TRANSACTION_STATUSES:
+            if _aware(row.created_at) >= stuck_before:
+                break
+            deferred.append(RollupDeferredRow(name="daily_transactions", source_id=row.id))
+        else:
+            final.append(row)
+        checkpoint.last_id = row.id
+
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    for row in final:
+        if row.status == "completed":
+            entry = totals[(row.creator_id, row.created_at.date())]
+            entry[0] += 1
+            entry[1] += row.amount
+            entry[2] += row.creator_earnings
+
+    upsert_increments(db, CreatorDailyRollup, ["creator_id", "day"], [
+        {
+            "creator_id": creator_id,
+            "day": day,
+            "transaction_count": count,
+            "transaction_amount": amount,
+            "creator_earnings": earnings,
+        }
+        for (creator_id, day), (count, amount, earnings) in totals.items()
+    ])
+    if settled:
+        db.execute(delete(RollupDeferredRow).where(
+            RollupDeferredRow.name == "daily_transactions",
+            RollupDeferredRow.source_id.in_([row.id for row in settled]),
+        ))
+    db.add_all(deferred)
+    db.commit()
+    return len(final)
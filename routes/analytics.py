@@ -1,60 +1,151 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from datetime import datetime, timedelta
+from sqlalchemy import func, desc, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
 
-from database import get_db
-from models import User, Content, UsageRecord, Transaction, UserRole
-from routes.auth import get_current_user
+import platform_metrics
+import response_cache
+import storage
+from database import get_async_db
+from models import (
+    Content, UsageRecord, Transaction, UserRole, CreatorDailyRollup, RollupCheckpoint, RollupDeferredRow,
+)
+from schemas import UserResponse
+from routes.auth import get_current_user, principal_cache
 
 router = APIRouter()
 
+DASHBOARD_DAYS = 30
+RECENT_ACTIVITY_LIMIT = 10
+
 @router.get("/creator/dashboard")
 async def get_creator_dashboard(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if current_user.role not in [UserRole.CREATOR, UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Access denied")
 
     # Get creator's content
-    content_count = db.query(Content).filter(Content.creator_id == current_user.id).count()
+    content_count = await db.scalar(
+        select(func.count(Content.id)).where(Content.creator_id == current_user.id)
+    )
 
-    # Get total usage
-    total_usage = db.query(func.sum(UsageRecord.cost)).filter(
-        UsageRecord.content_id.in_(
-            db.query(Content.id).filter(Content.creator_id == current_user.id)
+    # Lifetime totals come from the daily rollups plus usage and transactions not folded in yet
+    rolled = (await db.execute(
+        select(
+            func.coalesce(func.sum(CreatorDailyRollup.usage_count), 0),
+            func.coalesce(func.sum(CreatorDailyRollup.cost), 0.0),
+            func.coalesce(func.sum(CreatorDailyRollup.transaction_count), 0),
+            func.coalesce(func.sum(CreatorDailyRollup.creator_earnings), 0.0),
+        ).where(CreatorDailyRollup.creator_id == current_user.id)
+    )).one()
+    checkpoint = await db.get(RollupCheckpoint, "daily_usage")
+    transactions_checkpoint = await db.get(RollupCheckpoint, "daily_transactions")
+    transactions_tail = (await db.execute(
+        select(func.count(Transaction.id), func.coalesce(func.sum(Transaction.creator_earnings), 0.0))
+        .where(
+            Transaction.creator_id == current_user.id,
+            Transaction.status == "completed",
+            or_(
+                Transaction.id > (transactions_checkpoint.last_id if transactions_checkpoint else 0),
+                Transaction.id.in_(
+                    select(RollupDeferredRow.source_id).where(RollupDeferredRow.name == "daily_transactions")
+                ),
+            ),
+        )
+    )).one()
+    tail = (await db.execute(
+        select(func.count(UsageRecord.id), func.coalesce(func.sum(UsageRecord.cost), 0.0))
+        .join(Content, Content.id == UsageRecord.content_id)
+        .where(
+            Content.creator_id == current_user.id,
+            UsageRecord.id > (checkpoint.last_id if checkpoint else 0),
         )
-    ).scalar() or 0
+    )).one()
+
+    since = datetime.now(timezone.utc).date() - timedelta(days=DASHBOARD_DAYS)
+    daily = (await db.execute(
+        select(CreatorDailyRollup)
+        .where(CreatorDailyRollup.creator_id == current_user.id, CreatorDailyRollup.day >= since)
+        .order_by(CreatorDailyRollup.day)
+    )).scalars().all()
 
-    # Get recent activity
-    recent_usage = db.query(UsageRecord).join(Content).filter(
-        Content.creator_id == current_user.id
-    ).order_by(desc(UsageRecord.created_at)).limit(10).all()
+    # Get recent activity, looking back only as many days as it takes to find it
+    recent_days = (await db.scalars(
+        select(CreatorDailyRollup.day)
+        .where(CreatorDailyRollup.creator_id == current_user.id, CreatorDailyRollup.usage_count > 0)
+        .order_by(desc(CreatorDailyRollup.day))
+        .limit(RECENT_ACTIVITY_LIMIT)
+    )).all()
+    activity_since = recent_days[-1] if len(recent_days) == RECENT_ACTIVITY_LIMIT else None
+    recent_query = (
+        select(UsageRecord.id, UsageRecord.content_id, UsageRecord.user_id,
+               UsageRecord.usage_type, UsageRecord.cost, UsageRecord.created_at)
+        .join(Content, Content.id == UsageRecord.content_id)
+        .where(Content.creator_id == current_user.id)
+        .order_by(desc(UsageRecord.created_at), desc(UsageRecord.id))
+        .limit(RECENT_ACTIVITY_LIMIT)
+    )
+    if activity_since is not None:
+        recent_query = recent_query.where(UsageRecord.created_at >= activity_since)
+    recent_usage = (await db.execute(recent_query)).all()
 
     return {
         "content_count": content_count,
-        "total_earnings": total_usage,
-        "recent_activity": recent_usage
+        "total_usage": rolled[0] + tail[0],
+        "total_earnings": rolled[1] + tail[1],
+        "transaction_count": rolled[2] + transactions_tail[0],
+        "transaction_earnings": rolled[3] + transactions_tail[1],
+        "daily": [
+            {
+                "day": row.day,
+                "usage_count": row.usage_count,
+                "cost": row.cost,
+                "distinct_users": row.distinct_users,
+                "transaction_count": row.transaction_count,
+                "creator_earnings": row.creator_earnings,
+            }
+            for row in daily
+        ],
+        "recent_activity": [dict(row._mapping) for row in recent_usage]
     }
 
 @router.get("/admin/platform")
 async def get_platform_analytics(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    exact: bool = False,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if current_user.role != UserRole.ADMIN:
         raise HTTPException(status_code=403, detail="Admin access required")
 
     # Platform metrics
-    total_users = db.query(User).count()
-    total_creators = db.query(User).filter(User.role == UserRole.CREATOR).count()
-    total_content = db.query(Content).count()
-    total_revenue = db.query(func.sum(UsageRecord.cost)).scalar() or 0
+    if exact:
+        return await platform_metrics.read_exact(db)
+    return await platform_metrics.read_counters(db)
+
+@router.get("/admin/storage")
+async def get_storage_usage(
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    return await storage.usage(db)
+
+@router.get("/admin/cache")
+async def get_cache_stats(current_user: UserResponse = Depends(get_current_user)):
+    if current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
 
     return {
-        "total_users": total_users,
-        "total_creators": total_creators,
-        "total_content": total_content,
-        "total_revenue": total_revenue
+        "responses": response_cache.stats.as_dict(),
+        "principals": {
+            "hits": principal_cache.local.hits,
+            "misses": principal_cache.local.misses,
+            "redis_hits": principal_cache.redis_hits,
+            "entries": len(principal_cache.local),
+        },
     }
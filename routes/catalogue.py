@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+import catalogue
+from database import get_async_db
+from models import ContentType, UserRole
+from schemas import UserResponse
+from routes.auth import get_current_user
+
+router = APIRouter()
+
+@router.post("/import")
+async def import_content(
+    request: Request,
+    format: Optional[str] = None,
+    publish: bool = False,
+    batch_size: int = catalogue.CATALOGUE_IMPORT_BATCH_SIZE,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create many tools, pipelines and datasets from an NDJSON or CSV body"""
+    if current_user.role not in [UserRole.CREATOR, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Only creators can import content")
+    if not 1 <= batch_size <= catalogue.CATALOGUE_IMPORT_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"Batch size must be between 1 and {catalogue.CATALOGUE_IMPORT_MAX_BATCH_SIZE}"
+        )
+
+    fmt = catalogue.import_format(request, format)
+    source = await catalogue.spool(request)
+    return await catalogue.import_content(db, source, fmt, current_user.id, publish=publish, batch_size=batch_size)
+
+@router.get("/export")
+async def export_content(
+    content_type: Optional[ContentType] = None,
+    category: Optional[str] = None,
+    creator_id: Optional[int] = None
+):
+    """Stream the published catalogue as NDJSON"""
+    return StreamingResponse(
+        catalogue.export_content(content_type, category, creator_id), media_type="application/x-ndjson"
+    )
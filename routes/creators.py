@@ -1,27 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Response
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import anyio
+import os
 
-from database import get_db
-from models import User, CreatorProfile, UserRole
-from schemas import CreatorProfileCreate, CreatorProfileResponse, UserResponse
-from routes.auth import get_current_user
+import pagination
+import reports
+import storage
+import tasks
+from database import dialect_insert, get_async_db
+from models import User, CreatorProfile, CreatorReport, UserRole
+from schemas import CreatorProfileCreate, CreatorProfileResponse, ReportCreate, ReportResponse, UserResponse
+from routes.auth import get_current_user, invalidate_principal
 
 router = APIRouter()
 
 @router.post("/profile", response_model=CreatorProfileResponse)
 async def create_creator_profile(
     profile_data: CreatorProfileCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Check if profile already exists
-    existing_profile = db.query(CreatorProfile).filter(CreatorProfile.user_id == current_user.id).first()
+    existing_profile = await db.scalar(select(CreatorProfile).where(CreatorProfile.user_id == current_user.id))
     if existing_profile:
         raise HTTPException(status_code=400, detail="Creator profile already exists")
 
     # Update user role to creator
-    current_user.role = UserRole.CREATOR
+    await db.execute(update(User).where(User.id == current_user.id).values(role=UserRole.CREATOR))
 
     # Create profile
     profile = CreatorProfile(
@@ -33,19 +41,81 @@ async def create_creator_profile(
     )
 
     db.add(profile)
-    db.commit()
-    db.refresh(profile)
+    await db.commit()
+    await db.refresh(profile)
+    await invalidate_principal(current_user.id)
 
     return profile
 
 @router.get("/profile", response_model=CreatorProfileResponse)
-async def get_creator_profile(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    profile = db.query(CreatorProfile).filter(CreatorProfile.user_id == current_user.id).first()
+async def get_creator_profile(current_user: UserResponse = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    profile = await db.scalar(select(CreatorProfile).where(CreatorProfile.user_id == current_user.id))
     if not profile:
         raise HTTPException(status_code=404, detail="Creator profile not found")
     return profile
 
 @router.get("/", response_model=List[CreatorProfileResponse])
-async def list_creators(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
-    profiles = db.query(CreatorProfile).offset(skip).limit(limit).all()
+async def list_creators(
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_async_db)
+):
+    profiles, next_cursor = await pagination.paginate(
+        db, select(CreatorProfile), [CreatorProfile.id], cursor=cursor, skip=skip, limit=limit
+    )
+    pagination.set_next_cursor(response, next_cursor)
     return profiles
+
+@router.post("/reports", response_model=ReportResponse, status_code=202)
+async def request_report(
+    report_data: ReportCreate,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    if current_user.role not in [UserRole.CREATOR, UserRole.ADMIN]:
+        raise HTTPException(status_code=403, detail="Only creators have usage reports")
+    try:
+        reports.parse_period(report_data.period)
+    except reports.ReportError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    insert = dialect_insert(db.bind.dialect.name)
+    stmt = insert(CreatorReport).values(creator_id=current_user.id, period=report_data.period, status="pending")
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["creator_id", "period"], set_={"status": "pending", "error": None}
+    ))
+    await db.commit()
+    report = await db.scalar(select(CreatorReport).where(
+        CreatorReport.creator_id == current_user.id, CreatorReport.period == report_data.period
+    ).execution_options(populate_existing=True))
+    await tasks.enqueue_report(current_user.id, report_data.period)
+    return report
+
+@router.get("/reports", response_model=List[ReportResponse])
+async def list_reports(current_user: UserResponse = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    return (await db.scalars(
+        select(CreatorReport).where(CreatorReport.creator_id == current_user.id).order_by(CreatorReport.period.desc())
+    )).all()
+
+@router.get("/reports/{report_id}/{filename}")
+async def download_report_file(
+    report_id: int,
+    filename: str,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    report = await db.get(CreatorReport, report_id)
+    if not report or (report.creator_id != current_user.id and current_user.role != UserRole.ADMIN):
+        raise HTTPException(status_code=404, detail="Report not found")
+    key = next(
+        (key for keys in (report.files or {}).values() for key in keys if os.path.basename(key) == filename), None
+    )
+    if key is None:
+        raise HTTPException(status_code=404, detail="Report file not found")
+
+    backend = storage.get_storage()
+    if isinstance(backend, storage.S3Storage):
+        return RedirectResponse(await anyio.to_thread.run_sync(backend.url, key), status_code=307)
+    return FileResponse(backend.path(key), filename=f"{report.period}-{filename}")
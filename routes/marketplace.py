@@ -1,67 +1,184 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from typing import List, Optional
-
-from database import get_db
-from models import Content, UsageRecord, User
-from schemas import ContentResponse, UsageRecordCreate
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional, Union
+import os
+
+import downloads
+import facets
+import listing
+import pagination
+import ratings
+import search
+import trending
+from database import get_async_db
+from models import Content, ContentType, PricingModel, Review, TrendingScore, UserRole
+from schemas import (
+    ContentBatchRequest, ContentBatchResponse, ContentResponse, ReviewCreate, ReviewResponse, SearchResults,
+    UsageRecordCreate, UserResponse,
+)
 from routes.auth import get_current_user
+from usage_ingest import ingestor
 
 router = APIRouter()
 
+BATCH_LOOKUP_MAX_IDS = int(os.getenv("BATCH_LOOKUP_MAX_IDS", "200"))
+
 @router.get("/featured", response_model=List[ContentResponse])
-async def get_featured_content(db: Session = Depends(get_db)):
-    content = db.query(Content).filter(Content.is_featured == True, Content.is_published == True).limit(10).all()
-    return content
+async def get_featured_content(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
+    async def fetch():
+        return (await db.execute(
+            listing.select_items().where(Content.is_featured == True, Content.is_published == True).limit(10)
+        )).all()
 
-@router.get("/trending", response_model=List[ContentResponse])
-async def get_trending_content(db: Session = Depends(get_db)):
-    # Get content with highest usage in last 30 days
-    content = db.query(Content).filter(Content.is_published == True).order_by(desc(Content.usage_count)).limit(20).all()
-    return content
+    return await listing.respond(request, response, fetch)
 
-@router.get("/search", response_model=List[ContentResponse])
+@router.get("/trending", response_model=List[ContentResponse])
+async def get_trending_content(
+    request: Request,
+    response: Response,
+    window: Literal["24h", "7d", "30d"] = trending.DEFAULT_TRENDING_WINDOW,
+    content_type: Optional[ContentType] = None,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_async_db)
+):
+    async def fetch():
+        # Scores are precomputed per window by the refresh_trending_scores task
+        query = listing.select_items().join(TrendingScore, TrendingScore.content_id == Content.id).where(
+            TrendingScore.window == window
+        )
+        if content_type:
+            query = query.where(TrendingScore.content_type == content_type)
+        content = (await db.execute(
+            query.order_by(desc(TrendingScore.score), desc(TrendingScore.content_id)).limit(limit)
+        )).all()
+        if content:
+            return content
+
+        # No scores yet (fresh deployment or quiet window): fall back to lifetime usage
+        query = listing.select_items().where(Content.is_published == True)
+        if content_type:
+            query = query.where(Content.content_type == content_type)
+        return (await db.execute(query.order_by(desc(Content.usage_count)).limit(limit))).all()
+
+    return await listing.respond(request, response, fetch)
+
+@router.get("/search", response_model=Union[List[ContentResponse], SearchResults])
 async def search_content(
+    request: Request,
+    response: Response,
     q: str,
-    content_type: Optional[str] = None,
+    content_type: Optional[ContentType] = None,
     category: Optional[str] = None,
+    pricing_model: Optional[PricingModel] = None,
+    tag: List[str] = Query([]),
     min_rating: Optional[float] = None,
     max_price: Optional[float] = None,
+    include_facets: bool = False,
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Content).filter(Content.is_published == True)
+    """Search published content; with ``include_facets`` the page comes back as ``items`` next to
+    counts per content type, category, pricing model, price bucket and tag"""
+    ndjson = listing.wants_ndjson(request)
+    if ndjson and include_facets:
+        raise HTTPException(status_code=406, detail="Facets are only available as JSON")
 
-    # Text search in title and description
-    query = query.filter(
-        (Content.title.ilike(f"%{q}%")) | (Content.description.ilike(f"%{q}%"))
-    )
+    query = listing.select_items().where(Content.is_published == True)
 
     if content_type:
-        query = query.filter(Content.content_type == content_type)
+        query = query.where(Content.content_type == content_type)
 
     if category:
-        query = query.filter(Content.category == category)
+        query = query.where(Content.category == category)
+
+    if pricing_model:
+        query = query.where(Content.pricing_model == pricing_model)
+
+    if tag:
+        query = facets.tag_filter(query, tag)
 
     if min_rating:
-        query = query.filter(Content.rating >= min_rating)
+        query = query.where(Content.bayesian_rating >= min_rating)
 
     if max_price:
-        query = query.filter(Content.price <= max_price)
+        query = query.where(Content.price <= max_price)
+
+    # Indexed full-text search over title, description, tags and category, best match first
+    query, rank = await search.apply_search(db, query, q)
+    content, next_cursor = await pagination.paginate(db, query, [rank, Content.id], cursor=cursor, skip=skip, limit=limit)
+    pagination.set_next_cursor(response, next_cursor)
+    if ndjson:
+        return listing.ndjson_response(content, response)
+    if not include_facets:
+        return listing.json_response(listing.items(content), response)
+
+    counts = await facets.search_facets(db, q, {
+        "content_type": content_type,
+        "category": category,
+        "pricing_model": pricing_model,
+        "price": max_price or None,
+        "tags": tag,
+    }, min_rating=min_rating)
+    return listing.json_response({"items": listing.items(content), "facets": counts}, response)
+
+@router.post("/content/batch", response_model=ContentBatchResponse)
+async def get_content_batch(batch: ContentBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """Details of many tools, pipelines and datasets in one query, for carts, collections and recommendations"""
+    ids = list(dict.fromkeys(batch.ids))
+    if len(ids) > BATCH_LOOKUP_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_LOOKUP_MAX_IDS} ids per request")
+
+    found = {}
+    if ids:
+        rows = await db.execute(listing.select_items().where(Content.id.in_(ids)))
+        found = {row.id: row for row in rows}
+    return listing.json_response({
+        "items": [listing.item(found[content_id]) for content_id in ids if content_id in found],
+        "missing": [content_id for content_id in ids if content_id not in found],
+    })
+
+@router.post("/content/{content_id}/reviews", response_model=ReviewResponse)
+async def review_content(
+    content_id: int,
+    review_data: ReviewCreate,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Rate published content 1-5; submitting again replaces the user's earlier review"""
+    content = await db.get(Content, content_id)
+    if not content or not content.is_published:
+        raise HTTPException(status_code=404, detail="Content not found")
+    if content.creator_id == current_user.id:
+        raise HTTPException(status_code=403, detail="Creators cannot review their own content")
 
-    content = query.offset(skip).limit(limit).all()
-    return content
+    return await ratings.submit_review(db, content, current_user.id, review_data.rating, review_data.comment)
+
+@router.get("/content/{content_id}/reviews", response_model=List[ReviewResponse])
+async def list_reviews(
+    content_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_async_db)
+):
+    query = select(Review).where(Review.content_id == content_id)
+    reviews, next_cursor = await pagination.paginate(db, query, [Review.id], cursor=cursor, limit=limit)
+    pagination.set_next_cursor(response, next_cursor)
+    return reviews
 
 @router.post("/use/{content_id}")
 async def use_content(
     content_id: int,
     usage_data: UsageRecordCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    content = db.query(Content).filter(Content.id == content_id).first()
+    content = (await db.execute(
+        select(Content.pricing_model, Content.price).where(Content.id == content_id)
+    )).first()
     if not content:
         raise HTTPException(status_code=404, detail="Content not found")
 
@@ -70,19 +187,34 @@ async def use_content(
     if content.pricing_model.value == "pay_per_use":
         cost = content.price
 
-    # Create usage record
-    usage_record = UsageRecord(
+    # Record usage and bump usage_count, either now or via the write-behind buffer
+    await ingestor.record(
+        db,
         user_id=current_user.id,
         content_id=content_id,
         usage_type=usage_data.usage_type,
         cost=cost,
-        metadata=usage_data.metadata
+        meta_data=usage_data.metadata
     )
 
-    # Update content stats
-    content.usage_count += 1
-
-    db.add(usage_record)
-    db.commit()
-
     return {"message": "Content used successfully", "cost": cost}
+
+@router.get("/download/{content_id}")
+async def download_content(
+    content_id: int,
+    request: Request,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    content = (await db.execute(
+        select(
+            Content.id, Content.creator_id, Content.is_published,
+            Content.file_path, Content.file_name, Content.file_hash,
+        ).where(Content.id == content_id)
+    )).first()
+    if not content or not content.file_path:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not content.is_published and content.creator_id != current_user.id and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return await downloads.serve(request, content)
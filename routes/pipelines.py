@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import shutil
-import os
-
-from database import get_db
-from models import User, Content, ContentType, UserRole
-from schemas import ContentCreate, ContentResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Literal, Optional
+
+import chunked_uploads
+import listing
+import pagination
+import ratings
+import pipeline_analysis
+import tasks
+from database import get_async_db
+from models import Content, ContentType, UserRole
+from schemas import ContentCreate, ContentResponse, UserResponse
 from routes.auth import get_current_user
 
 router = APIRouter()
@@ -14,22 +20,16 @@ router = APIRouter()
 @router.post("/", response_model=ContentResponse)
 async def create_tool(
     pipeline_data: ContentCreate,
-    file: Optional[UploadFile] = File(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if current_user.role not in [UserRole.CREATOR, UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Only creators can upload tools")
 
     # Handle file upload
-    file_path = None
-    if file:
-        upload_dir = f"uploads/pipelines/{current_user.id}"
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = f"{upload_dir}/{file.filename}"
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    upload = None
+    if pipeline_data.upload_id:
+        upload = await chunked_uploads.attach_upload(db, pipeline_data.upload_id, current_user.id)
 
     # Create tool
     pipeline = Content(
@@ -41,34 +41,85 @@ async def create_tool(
         tags=pipeline_data.tags,
         pricing_model=pipeline_data.pricing_model,
         price=pipeline_data.price,
-        file_path=file_path,
+        file_path=upload.file_path if upload else None,
+        file_name=upload.filename if upload else None,
+        file_hash=upload.sha256 if upload else None,
+        file_size=upload.total_size if upload else None,
+        processing_status="pending" if upload else None,
         requirements=pipeline_data.requirements
     )
 
     db.add(pipeline)
-    db.commit()
-    db.refresh(pipeline)
+    await db.commit()
+    await db.refresh(pipeline, ["created_at", "creator"])
+    if upload:
+        await tasks.enqueue_processing(pipeline.id)
 
     return pipeline
 
 @router.get("/", response_model=List[ContentResponse])
 async def list_pipelines(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    min_rating: Optional[float] = None,
+    sort: Literal["newest", "rating"] = "newest",
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Content).filter(Content.content_type == ContentType.TOOL, Content.is_published == True)
+    async def fetch():
+        query = listing.select_items().where(
+            Content.content_type == ContentType.TOOL, Content.is_published == True
+        )
+
+        if category:
+            query = query.where(Content.category == category)
+
+        if min_rating:
+            query = query.where(Content.bayesian_rating >= min_rating)
 
-    if category:
-        query = query.filter(Content.category == category)
+        pipelines, next_cursor = await pagination.paginate(
+            db, query, ratings.listing_keys(sort), cursor=cursor, skip=skip, limit=limit
+        )
+        pagination.set_next_cursor(response, next_cursor)
+        return pipelines
 
-    pipelines = query.offset(skip).limit(limit).all()
-    return pipelines
+    return await listing.respond(request, response, fetch)
 
 @router.get("/{pipeline_id}", response_model=ContentResponse)
-async def get_pipeline(pipeline_id: int, db: Session = Depends(get_db)):
-    pipeline = db.query(Content).filter(Content.id == pipeline_id, Content.content_type == ContentType.TOOL).first()
+async def get_pipeline(pipeline_id: int, db: AsyncSession = Depends(get_async_db)):
+    pipeline = await db.scalar(
+        select(Content).options(joinedload(Content.creator)).where(
+            Content.id == pipeline_id, Content.content_type == ContentType.TOOL
+        )
+    )
     if not pipeline:
         raise HTTPException(status_code=404, detail="Pipeline not found")
     return pipeline
+
+@router.get("/{pipeline_id}/analysis")
+async def get_pipeline_analysis(pipeline_id: int, response: Response, db: AsyncSession = Depends(get_async_db)):
+    """Estimated resources, runtime and suggested price per run; 202 while the analysis is computed
+
+    At most one request per pending window or TTL enqueues the analysis (see
+    ``pipeline_analysis.claim_refresh``); the others get the stored state.
+    """
+    pipeline = await db.get(Content, pipeline_id)
+    if (
+        not pipeline
+        or not pipeline.is_published
+        or (pipeline.file_metadata or {}).get("format") not in pipeline_analysis.WORKFLOW_FORMATS
+    ):
+        raise HTTPException(status_code=404, detail="Pipeline workflow not found")
+
+    cached = await pipeline_analysis.get_cached(db, pipeline)
+    if await pipeline_analysis.claim_refresh(db, pipeline, cached):
+        await tasks.enqueue_analysis(pipeline.id)
+    if cached is None or cached.status == "pending":
+        response.status_code = 202
+        return {"status": "pending"}
+    if cached.status == "failed":
+        return {"status": "failed", "computed_at": cached.computed_at, "error": cached.error}
+    return {"status": "ready", "computed_at": cached.computed_at, **cached.analysis}
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
-from typing import List, Optional
-import shutil
-import os
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import List, Literal, Optional
 
-from database import get_db
-from models import User, Content, ContentType, UserRole
-from schemas import ContentCreate, ContentResponse
+import chunked_uploads
+import listing
+import pagination
+import ratings
+import tasks
+from database import get_async_db
+from models import Content, ContentType, UserRole
+from schemas import ContentCreate, ContentResponse, UserResponse
 from routes.auth import get_current_user
 
 router = APIRouter()
@@ -14,22 +19,16 @@ router = APIRouter()
 @router.post("/", response_model=ContentResponse)
 async def create_tool(
     tool_data: ContentCreate,
-    file: Optional[UploadFile] = File(None),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     if current_user.role not in [UserRole.CREATOR, UserRole.ADMIN]:
         raise HTTPException(status_code=403, detail="Only creators can upload tools")
 
     # Handle file upload
-    file_path = None
-    if file:
-        upload_dir = f"uploads/tools/{current_user.id}"
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = f"{upload_dir}/{file.filename}"
-
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    upload = None
+    if tool_data.upload_id:
+        upload = await chunked_uploads.attach_upload(db, tool_data.upload_id, current_user.id)
 
     # Create tool
     tool = Content(
@@ -41,34 +40,60 @@ async def create_tool(
         tags=tool_data.tags,
         pricing_model=tool_data.pricing_model,
         price=tool_data.price,
-        file_path=file_path,
+        file_path=upload.file_path if upload else None,
+        file_name=upload.filename if upload else None,
+        file_hash=upload.sha256 if upload else None,
+        file_size=upload.total_size if upload else None,
+        processing_status="pending" if upload else None,
         requirements=tool_data.requirements
     )
 
     db.add(tool)
-    db.commit()
-    db.refresh(tool)
+    await db.commit()
+    await db.refresh(tool, ["created_at", "creator"])
+    if upload:
+        await tasks.enqueue_processing(tool.id)
 
     return tool
 
 @router.get("/", response_model=List[ContentResponse])
 async def list_tools(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = 50,
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    min_rating: Optional[float] = None,
+    sort: Literal["newest", "rating"] = "newest",
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(Content).filter(Content.content_type == ContentType.TOOL, Content.is_published == True)
+    async def fetch():
+        query = listing.select_items().where(
+            Content.content_type == ContentType.TOOL, Content.is_published == True
+        )
+
+        if category:
+            query = query.where(Content.category == category)
 
-    if category:
-        query = query.filter(Content.category == category)
+        if min_rating:
+            query = query.where(Content.bayesian_rating >= min_rating)
 
-    tools = query.offset(skip).limit(limit).all()
-    return tools
+        tools, next_cursor = await pagination.paginate(
+            db, query, ratings.listing_keys(sort), cursor=cursor, skip=skip, limit=limit
+        )
+        pagination.set_next_cursor(response, next_cursor)
+        return tools
+
+    return await listing.respond(request, response, fetch)
 
 @router.get("/{tool_id}", response_model=ContentResponse)
-async def get_tool(tool_id: int, db: Session = Depends(get_db)):
-    tool = db.query(Content).filter(Content.id == tool_id, Content.content_type == ContentType.TOOL).first()
+async def get_tool(tool_id: int, db: AsyncSession = Depends(get_async_db)):
+    tool = await db.scalar(
+        select(Content).options(joinedload(Content.creator)).where(
+            Content.id == tool_id, Content.content_type == ContentType.TOOL
+        )
+    )
     if not tool:
         raise HTTPException(status_code=404, detail="Tool not found")
     return tool
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Header, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import chunked_uploads
+from database import get_async_db
+from schemas import UploadCreate, UploadResponse, UserResponse
+from routes.auth import get_current_user
+
+router = APIRouter()
+
+@router.post("/", response_model=UploadResponse)
+async def create_upload(
+    upload_data: UploadCreate,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    upload = await chunked_uploads.create_upload(
+        db, current_user.id, upload_data.filename, upload_data.size, upload_data.chunk_size
+    )
+    return chunked_uploads.describe(upload)
+
+@router.get("/{upload_id}", response_model=UploadResponse)
+async def get_upload(
+    upload_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    upload = await chunked_uploads.get_upload(db, upload_id, current_user.id)
+    return chunked_uploads.describe(upload)
+
+@router.put("/{upload_id}/parts/{part_number}", status_code=204)
+async def upload_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    x_chunk_sha256: str = Header(...),
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    upload = await chunked_uploads.get_upload(db, upload_id, current_user.id)
+    await chunked_uploads.write_part(db, upload, part_number, request, x_chunk_sha256)
+
+@router.post("/{upload_id}/complete", response_model=UploadResponse)
+async def complete_upload(
+    upload_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    upload = await chunked_uploads.get_upload(db, upload_id, current_user.id)
+    upload = await chunked_uploads.complete_upload(db, upload)
+    return chunked_uploads.describe(upload)
+
+@router.delete("/{upload_id}", status_code=204)
+async def abort_upload(
+    upload_id: str,
+    current_user: UserResponse = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    upload = await chunked_uploads.get_upload(db, upload_id, current_user.id)
+    await chunked_uploads.abort_upload(db, upload)
@@ -35,6 +35,7 @@ class CreatorProfileResponse(BaseModel):
     total_earnings: float
     total_downloads: int
     rating: float
+    review_count: int = 0
 
     class Config:
         from_attributes = True
@@ -48,6 +49,7 @@ class ContentCreate(BaseModel):
     pricing_model: PricingModel = PricingModel.FREE
     price: float = 0.0
     requirements: Optional[Dict[str, Any]] = {}
+    upload_id: Optional[str] = None  # completed chunked upload holding the file
 
 class ContentResponse(BaseModel):
     id: int
@@ -63,20 +65,38 @@ class ContentResponse(BaseModel):
     usage_count: int
     rating: float
     review_count: int
+    bayesian_rating: float = 0.0
     is_published: bool
     is_featured: bool
+    processing_status: Optional[str] = None
     created_at: datetime
     creator: UserResponse
 
     class Config:
         from_attributes = True
 
+class ContentBatchRequest(BaseModel):
+    ids: List[int]
+
+class ContentBatchResponse(BaseModel):
+    items: List[ContentResponse]  # in request order, duplicates removed
+    missing: List[int]
+
+class SearchFacets(BaseModel):
+    counts: Dict[str, Dict[str, int]]  # facet -> value -> number of matching items
+    truncated: bool  # too many matches to count them all
+
+class SearchResults(BaseModel):
+    items: List[ContentResponse]
+    facets: SearchFacets
+
 class ReviewCreate(BaseModel):
     rating: int
     comment: Optional[str] = None
 
 class ReviewResponse(BaseModel):
     id: int
+    user_id: int
     rating: int
     comment: Optional[str]
     created_at: datetime
@@ -92,3 +112,34 @@ class UsageRecordCreate(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    chunk_size: Optional[int] = None
+
+class UploadResponse(BaseModel):
+    id: str
+    filename: str
+    total_size: int
+    chunk_size: int
+    part_count: int
+    received_parts: List[int]
+    status: str
+    expires_at: datetime
+
+class ReportCreate(BaseModel):
+    period: str  # YYYY, YYYY-MM or YYYY-MM-DD
+
+class ReportResponse(BaseModel):
+    id: int
+    period: str
+    status: str
+    files: Optional[Dict[str, List[str]]] = None
+    summary: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
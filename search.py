@@ -0,0 +1,304 @@
+"""Full-text search over the content catalogue.
+
+On PostgreSQL every content row carries a weighted ``tsvector`` (title, then
+tags/category, then description) backed by a GIN index, plus a trigram index on
+the plain-text search document so that typos still match. Results are ordered
+by ``ts_rank_cd``.
+
+Other backends (SQLite test runs) use an in-process inverted index ranked with
+BM25. It is loaded lazily on the first search and kept current by the same
+mapper events that maintain the PostgreSQL columns; changes reach it only when
+their transaction commits.
+
+Rows written before the search columns existed are filled in by
+``backfill_search_columns`` (the ``backfill_search_columns`` task).
+"""
+import asyncio
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, event, false, func, inspect, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from models import Content
+
+TEXT_SEARCH_CONFIG = "english"
+INDEXED_FIELDS = ("title", "description", "tags", "category")
+
+# Upper bound on candidates ranked by the fallback index per query
+FALLBACK_MAX_CANDIDATES = 1000
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def build_document(title, description=None, tags=None, category=None) -> str:
+    parts = [title or "", " ".join(tags or []), category or "", description or ""]
+    return " ".join(part for part in parts if part).lower()
+
+
+def _keywords(tags, category) -> str:
+    return " ".join(tags or []) + " " + (category or "")
+
+
+def _search_vector(title, keywords, description):
+    """Weighted tsvector of the given strings or bound parameters."""
+    def weighted(text, weight):
+        return func.setweight(func.to_tsvector(TEXT_SEARCH_CONFIG, text), weight)
+
+    return weighted(title, "A").op("||")(weighted(keywords, "B")).op("||")(weighted(description, "C"))
+
+
+# For content inserted in bulk with Core, which bypasses the mapper events below:
+# use BULK_SEARCH_VECTOR as the search_vector value and bulk_search_params() per row
+BULK_SEARCH_VECTOR = _search_vector(
+    bindparam("b_search_title"), bindparam("b_search_keywords"), bindparam("b_search_description")
+)
+
+
+def bulk_search_params(title, description, tags, category, dialect_name: str) -> dict:
+    params = {"search_document": build_document(title, description, tags, category)}
+    if dialect_name == "postgresql":
+        params.update(
+            b_search_title=title or "",
+            b_search_keywords=_keywords(tags, category),
+            b_search_description=description or "",
+        )
+    return params
+
+
+def index_bulk(documents):
+    """Add ``(content_id, search_document)`` pairs of bulk-inserted content to the fallback index."""
+    if _fallback_index is not None:
+        for content_id, document in documents:
+            _fallback_index.add(content_id, document or "")
+
+
+class InvertedIndex:
+    """Minimal BM25 inverted index used when PostgreSQL full-text search is unavailable."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self.doc_lengths = {}
+        self.doc_terms = {}
+        self.total_length = 0
+        self._terms = None  # sorted term list for prefix lookups, rebuilt lazily
+        self._lock = threading.Lock()
+
+    def add(self, doc_id: int, text: str):
+        with self._lock:
+            self._remove(doc_id)
+            tokens = tokenize(text)
+            for token in tokens:
+                postings = self.postings[token]
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+            self.doc_lengths[doc_id] = len(tokens)
+            self.doc_terms[doc_id] = set(tokens)
+            self.total_length += len(tokens)
+            self._terms = None
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int):
+        if doc_id not in self.doc_lengths:
+            return
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+        self._terms = None
+
+    def _expand_prefix(self, prefix: str):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect_left(self._terms, prefix)
+        for term in self._terms[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def search(self, query: str, limit: int = FALLBACK_MAX_CANDIDATES):
+        """Return ``(doc_id, score)`` pairs, best first. Every query term must match;
+        the last term is treated as a prefix so that search-as-you-type works."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            avg_length = self.total_length / n_docs
+            scores = None
+            for position, token in enumerate(tokens):
+                if position == len(tokens) - 1:
+                    terms = list(self._expand_prefix(token))
+                else:
+                    terms = [token] if token in self.postings else []
+
+                term_scores = defaultdict(float)
+                for term in terms:
+                    postings = self.postings[term]
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, tf in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                        term_scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: score + term_scores[doc_id] for doc_id, score in scores.items() if doc_id in term_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit]
+
+
+_fallback_index = None
+_fallback_lock = asyncio.Lock()
+
+
+async def _get_fallback_index(db: AsyncSession) -> InvertedIndex:
+    global _fallback_index
+    if _fallback_index is None:
+        async with _fallback_lock:
+            if _fallback_index is None:
+                index = InvertedIndex()
+                for content_id, document in await db.execute(select(Content.id, Content.search_document)):
+                    index.add(content_id, document or "")
+                _fallback_index = index
+    return _fallback_index
+
+
+def reset_fallback_index():
+    global _fallback_index
+    _fallback_index = None
+
+
+def _prefix_tsquery(q: str) -> str:
+    # Each token must match; prefix matching keeps search-as-you-type useful
+    return " & ".join(f"{token}:*" for token in tokenize(q))
+
+
+async def apply_search(db: AsyncSession, query, q: str):
+    """Restrict the ``query`` select to content matching ``q``.
+
+    Returns the filtered query and a relevance expression (higher is better)
+    for the caller to order or paginate by.
+    """
+    if not tokenize(q):
+        return query.where(false()), literal(0.0)
+
+    if db.bind.dialect.name == "postgresql":
+        tsquery = func.to_tsquery(TEXT_SEARCH_CONFIG, _prefix_tsquery(q))
+        word_similarity = func.word_similarity(q.lower(), Content.search_document)
+        rank = func.ts_rank_cd(Content.search_vector, tsquery, 32) + 0.1 * word_similarity
+        query = query.where(
+            Content.search_vector.op("@@")(tsquery) | literal(q.lower()).op("<%")(Content.search_document)
+        )
+        return query, rank
+
+    scores = dict((await _get_fallback_index(db)).search(q))
+    if not scores:
+        return query.where(false()), literal(0.0)
+    rank = case(scores, value=Content.id, else_=0.0)
+    return query.where(Content.id.in_(scores)), rank
+
+
+def _search_fields_changed(target) -> bool:
+    state = inspect(target)
+    return not state.persistent or any(state.attrs[field].history.has_changes() for field in INDEXED_FIELDS)
+
+
+@event.listens_for(Content, "before_insert")
+@event.listens_for(Content, "before_update")
+def _update_search_columns(mapper, connection, target):
+    if not _search_fields_changed(target):
+        return
+
+    target.search_document = build_document(target.title, target.description, target.tags, target.category)
+    if connection.dialect.name == "postgresql":
+        target.search_vector = _search_vector(
+            target.title or "", _keywords(target.tags, target.category), target.description or ""
+        )
+
+
+def _stage_index_change(connection, target, document):
+    # Applied to the fallback index on commit, so rolled-back writes never reach it
+    session = object_session(target)
+    if session is not None and connection.dialect.name != "postgresql":
+        session.info.setdefault("search_index_changes", {})[target.id] = document
+
+
+@event.listens_for(Content, "after_insert")
+@event.listens_for(Content, "after_update")
+def _update_fallback_index(mapper, connection, target):
+    if _search_fields_changed(target):
+        _stage_index_change(connection, target, target.search_document or "")
+
+
+@event.listens_for(Content, "after_delete")
+def _remove_from_fallback_index(mapper, connection, target):
+    _stage_index_change(connection, target, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_index_changes(session):
+    changes = session.info.pop("search_index_changes", None)
+    if changes and _fallback_index is not None:
+        for content_id, document in changes.items():
+            if document is None:
+                _fallback_index.remove(content_id)
+            else:
+                _fallback_index.add(content_id, document)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_index_changes(session):
+    session.info.pop("search_index_changes", None)
+
+
+def backfill_search_columns(db: Session, batch_size: int = 1000) -> int:
+    """Fill the search columns of content that has none, such as rows created before they existed.
+
+    Returns the number of rows updated.
+    """
+    dialect_name = db.bind.dialect.name
+    stmt = update(Content.__table__).where(Content.__table__.c.id == bindparam("b_id"))
+    if dialect_name == "postgresql":
+        stmt = stmt.values(search_vector=BULK_SEARCH_VECTOR)
+
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(Content.id, Content.title, Content.description, Content.tags, Content.category)
+            .where(Content.search_document.is_(None), Content.id > last_id)
+            .order_by(Content.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.execute(stmt, [
+            {"b_id": row.id, **bulk_search_params(row.title, row.description, row.tags, row.category, dialect_name)}
+            for row in rows
+        ])
+        db.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+
+    # A fallback index loaded in this process before the backfill lacks these rows
+    reset_fallback_index()
+    return updated
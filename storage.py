@@ -0,0 +1,181 @@
+"""Content-addressed blob storage for uploaded files.
+
+Every file is stored once per SHA-256 digest under ``sha256/ab/cd/<digest>``,
+and ``Content.file_path`` holds that key. ``StorageBlob`` counts the upload
+sessions and content referring to each blob, so identical files uploaded by
+different creators share one copy, and a blob is removed by
+``collect_garbage`` only once nothing refers to it.
+
+``STORAGE_BACKEND`` selects the driver: ``local`` (default) keeps blobs under
+``STORAGE_ROOT``; ``s3`` keeps them in ``S3_BUCKET`` on any S3-compatible
+service (set ``S3_ENDPOINT_URL`` to use MinIO or another local stand-in) and
+requires boto3.
+"""
+import logging
+import os
+
+import anyio
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import dialect_insert
+from models import StorageBlob
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.getenv("STORAGE_ROOT", os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "blobs"))
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+
+def blob_key(digest: str) -> str:
+    return f"sha256/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def put(self, source_path: str, key: str, overwrite: bool = False):
+        """Move ``source_path`` into the store, or drop it if the blob is already there."""
+        if not overwrite and self.exists(key):
+            os.remove(source_path)
+            return
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        os.replace(source_path, self.path(key))
+
+    def open(self, key: str):
+        return open(self.path(key), "rb")
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3Storage:
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as exc:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3") from exc
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self._client_error = ClientError
+
+    def _object(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+            return True
+        except self._client_error as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, source_path: str, key: str, overwrite: bool = False):
+        """Upload ``source_path`` (multipart for large files) unless the blob is already there."""
+        if overwrite or not self.exists(key):
+            self.client.upload_file(source_path, self.bucket, self._object(key))
+        os.remove(source_path)
+
+    def open(self, key: str):
+        """Streaming, file-like body of the object."""
+        return self.client.get_object(Bucket=self.bucket, Key=self._object(key))["Body"]
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+
+    def url(self, key: str, expires_in: int = 3600) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object(key)}, ExpiresIn=expires_in
+        )
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage(STORAGE_ROOT)
+        elif STORAGE_BACKEND == "s3":
+            _storage = S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL)
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
+
+
+async def store_file(db: AsyncSession, source_path: str, digest: str, size: int) -> str:
+    """Store ``source_path`` as the blob for ``digest`` and take a reference to it.
+
+    The reference is taken before the file is moved, so the row lock keeps
+    ``collect_garbage`` from deleting the blob until the caller commits.
+    """
+    insert = dialect_insert(db.bind.dialect.name)
+    stmt = insert(StorageBlob).values(sha256=digest, size=size, ref_count=1)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["sha256"], set_={"ref_count": StorageBlob.ref_count + 1}
+    ))
+    key = blob_key(digest)
+    await anyio.to_thread.run_sync(get_storage().put, source_path, key)
+    return key
+
+
+def release(db: Session, digest: str):
+    db.execute(
+        update(StorageBlob).where(StorageBlob.sha256 == digest).values(ref_count=StorageBlob.ref_count - 1)
+    )
+
+
+def collect_garbage(db: Session) -> int:
+    """Delete blobs nothing refers to any more; returns how many were removed."""
+    removed = 0
+    for digest in db.scalars(select(StorageBlob.sha256).where(StorageBlob.ref_count <= 0)).all():
+        # Re-check under the row lock: the blob may have been referenced again since
+        blob = db.scalar(
+            select(StorageBlob).where(StorageBlob.sha256 == digest, StorageBlob.ref_count <= 0)
+            .with_for_update(skip_locked=True)
+        )
+        if blob is None:
+            db.rollback()
+            continue
+        get_storage().delete(blob_key(digest))
+        db.delete(blob)
+        db.commit()
+        removed += 1
+    return removed
+
+
+async def usage(db: AsyncSession) -> dict:
+    """Bytes referenced versus bytes actually stored."""
+    logical, physical, blobs = (await db.execute(
+        select(
+            func.coalesce(func.sum(StorageBlob.size * StorageBlob.ref_count), 0),
+            func.coalesce(func.sum(StorageBlob.size), 0),
+            func.count(StorageBlob.sha256),
+        ).where(StorageBlob.ref_count > 0)
+    )).one()
+    return {
+        "blobs": blobs,
+        "referenced_bytes": logical,
+        "stored_bytes": physical,
+        "saved_bytes": logical - physical,
+    }
@@ -1,6 +1,31 @@
-from celery import Celery
-from sqlalchemy.orm import Session
+from celery import Celery, group
+from celery.schedules import crontab
+from celery.signals import task_postrun, task_prerun
+from datetime import datetime, timezone
+from functools import partial
+from sqlalchemy import or_, select
+from sqlalchemy.exc import SQLAlchemyError
+import anyio
+import logging
 import os
+import time
+
+from database import SessionLocal
+from models import Content
+import chunked_uploads
+import metrics
+import pipeline_analysis
+import platform_metrics
+import processing
+import ratings
+import reports
+import response_cache  # noqa: F401  bumps the catalogue version when worker commits change content
+import rollups
+import search
+import storage
+import trending
+
+logger = logging.getLogger(__name__)
 
 celery_app = Celery(
     "bioplatform",
@@ -8,27 +33,234 @@ celery_app = Celery(
     backend=os.getenv("REDIS_URL", "redis://localhost:6379")
 )
 
+# Fail fast instead of retrying for ~20s when Redis is down, so request handlers
+# that enqueue work are not held up (nothing here waits on task results)
+celery_app.conf.result_backend_transport_options = {"retry_policy": {"max_retries": 0}}
+
+# Reports are long and run on their own workers so they never hold up upload processing
+celery_app.conf.task_routes = {
+    "tasks.generate_usage_report": {"queue": "reports"},
+    "tasks.generate_usage_reports": {"queue": "reports"},
+}
+
+celery_app.conf.beat_schedule = {
+    "refresh-trending": {
+        "task": "tasks.refresh_trending_scores",
+        "schedule": float(os.getenv("TRENDING_REFRESH_SECONDS", "300")),
+    },
+    "refresh-creator-rollups": {
+        "task": "tasks.refresh_creator_rollups",
+        "schedule": float(os.getenv("CREATOR_ROLLUP_REFRESH_SECONDS", "300")),
+    },
+    "reconcile-platform-counters": {
+        "task": "tasks.reconcile_platform_counters",
+        "schedule": float(os.getenv("PLATFORM_COUNTER_REFRESH_SECONDS", "60")),
+    },
+    "check-platform-counter-drift": {
+        "task": "tasks.check_platform_counter_drift",
+        "schedule": float(os.getenv("PLATFORM_DRIFT_CHECK_SECONDS", "86400")),
+    },
+    "reconcile-ratings": {
+        "task": "tasks.reconcile_ratings",
+        "schedule": float(os.getenv("RATING_RECONCILE_SECONDS", "86400")),
+    },
+    "expire-uploads": {
+        "task": "tasks.expire_uploads",
+        "schedule": 3600.0,
+    },
+    "collect-storage-garbage": {
+        "task": "tasks.collect_storage_garbage",
+        "schedule": 3600.0,
+    },
+    "requeue-content-processing": {
+        "task": "tasks.requeue_content_processing",
+        "schedule": 600.0,
+    },
+    "generate-monthly-usage-reports": {
+        "task": "tasks.generate_usage_reports",
+        "schedule": crontab(day_of_month="1", hour="3", minute="0"),
+    },
+}
+
+# Task run times for /metrics (see metrics.py), keyed by task id while a task runs
+_task_started_at = {}
+
+@task_prerun.connect
+def _start_task_timer(task_id=None, **kwargs):
+    _task_started_at[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started_at = _task_started_at.pop(task_id, None)
+    if started_at is not None and metrics.METRICS_ENABLED:
+        metrics.record_task(task.name, state or "UNKNOWN", time.perf_counter() - started_at)
+
+@celery_app.task(
+    bind=True,
+    acks_late=True,
+    autoretry_for=(OSError, SQLAlchemyError),
+    retry_backoff=True,
+    max_retries=5,
+)
+def process_tool_upload(self, content_id: int):
+    """Validate, analyze and publish an uploaded content file"""
+    db = SessionLocal()
+    try:
+        status = processing.process_content(db, content_id)
+        content = db.get(Content, content_id)
+        if status == "ready" and (content.file_metadata or {}).get("format") in pipeline_analysis.WORKFLOW_FORMATS:
+            analyze_pipeline.delay(content_id)
+        return status
+    finally:
+        db.close()
+
+@celery_app.task(autoretry_for=(OSError, SQLAlchemyError), retry_backoff=True, max_retries=3)
+def analyze_pipeline(pipeline_id: int, force: bool = False):
+    """Estimate the resources, runtime and price of one run of a workflow"""
+    db = SessionLocal()
+    try:
+        return pipeline_analysis.analyze_content(db, pipeline_id, force=force)
+    except pipeline_analysis.AnalysisError as exc:
+        logger.warning("Could not analyze pipeline %s: %s", pipeline_id, exc)
+        return None
+    finally:
+        db.close()
+
+@celery_app.task(acks_late=True, autoretry_for=(OSError, SQLAlchemyError), retry_backoff=True, max_retries=3)
+def generate_usage_report(creator_id: int, period: str):
+    """Generate usage and earnings report for creator"""
+    db = SessionLocal()
+    try:
+        return reports.generate_report(db, creator_id, period)
+    except reports.ReportError as exc:
+        logger.warning("Could not generate report %s for creator %s: %s", period, creator_id, exc)
+        return None
+    finally:
+        db.close()
+
 @celery_app.task
-def process_tool_upload(content_id: int, file_path: str):
-    """Process uploaded bioinformatics tool"""
-    # Validate file format
-    # Extract metadata
-    # Run security scans
-    # Update content status
-    pass
+def generate_usage_reports(period: str = None):
+    """Queue a usage report for every creator with content, one task each"""
+    period = period or reports.previous_month()
+    db = SessionLocal()
+    try:
+        creator_ids = db.scalars(select(Content.creator_id).distinct()).all()
+    finally:
+        db.close()
+    group(generate_usage_report.s(creator_id, period) for creator_id in creator_ids).apply_async()
+    return len(creator_ids)
 
 @celery_app.task
-def analyze_pipeline(pipeline_id: int):
-    """Analyze pipeline complexity and estimate costs"""
-    # Parse pipeline definition
-    # Estimate resource requirements
-    # Calculate pricing suggestions
-    pass
+def refresh_trending_scores():
+    """Fold new usage into hourly buckets and rebuild the trending windows"""
+    db = SessionLocal()
+    try:
+        return trending.refresh_trending(db)
+    finally:
+        db.close()
 
 @celery_app.task
-def generate_usage_report(creator_id: int, period: str):
-    """Generate usage and earnings report for creator"""
-    # Aggregate usage statistics
-    # Calculate earnings
-    # Generate PDF report
-    pass
+def refresh_creator_rollups():
+    """Fold new usage and settled transactions into the daily creator rollups"""
+    db = SessionLocal()
+    try:
+        return {
+            "usage": rollups.fold_daily_usage(db),
+            "transactions": rollups.fold_daily_transactions(db),
+        }
+    finally:
+        db.close()
+
+@celery_app.task
+def reconcile_platform_counters():
+    """Refresh the platform counters behind the admin analytics page"""
+    db = SessionLocal()
+    try:
+        return platform_metrics.reconcile_counters(db)
+    finally:
+        db.close()
+
+@celery_app.task
+def check_platform_counter_drift():
+    """Compare platform counters with full aggregates and correct any drift"""
+    db = SessionLocal()
+    try:
+        return platform_metrics.check_drift(db, correct=True)
+    finally:
+        db.close()
+
+@celery_app.task
+def reconcile_ratings():
+    """Recompute stored ratings from reviews and correct any drift"""
+    db = SessionLocal()
+    try:
+        return ratings.reconcile_ratings(db)
+    finally:
+        db.close()
+
+@celery_app.task
+def expire_uploads():
+    """Remove expired upload sessions and their staged files"""
+    db = SessionLocal()
+    try:
+        return chunked_uploads.expire_uploads(db)
+    finally:
+        db.close()
+
+@celery_app.task
+def collect_storage_garbage():
+    """Delete stored blobs that no upload or content refers to any more"""
+    db = SessionLocal()
+    try:
+        return storage.collect_garbage(db)
+    finally:
+        db.close()
+
+@celery_app.task
+def requeue_content_processing():
+    """Queue processing for content that was never queued or whose processing stalled"""
+    db = SessionLocal()
+    try:
+        stalled_before = datetime.now(timezone.utc) - processing.PROCESSING_STALLED_AFTER
+        content_ids = db.scalars(
+            select(Content.id).where(or_(
+                Content.processing_status == "pending",
+                (Content.processing_status == "processing") & (Content.updated_at < stalled_before),
+            ))
+        ).all()
+        for content_id in content_ids:
+            process_tool_upload.delay(content_id)
+        return len(content_ids)
+    finally:
+        db.close()
+
+@celery_app.task
+def backfill_search_columns():
+    """One-off: fill the search columns of content created before search indexing existed"""
+    db = SessionLocal()
+    try:
+        return search.backfill_search_columns(db)
+    finally:
+        db.close()
+
+async def enqueue_processing(content_id: int):
+    """Queue processing for new content from a request handler without blocking the event loop"""
+    try:
+        await anyio.to_thread.run_sync(partial(process_tool_upload.apply_async, (content_id,), retry=False))
+    except Exception as exc:
+        # Still pending; requeue_content_processing picks it up
+        logger.warning("Could not queue processing for content %s: %s", content_id, exc)
+
+async def enqueue_analysis(pipeline_id: int):
+    """Queue a pipeline analysis from a request handler without blocking the event loop"""
+    try:
+        await anyio.to_thread.run_sync(partial(analyze_pipeline.apply_async, (pipeline_id,), retry=False))
+    except Exception as exc:
+        logger.warning("Could not queue analysis for pipeline %s: %s", pipeline_id, exc)
+
+async def enqueue_report(creator_id: int, period: str):
+    """Queue a report from a request handler without blocking the event loop"""
+    try:
+        await anyio.to_thread.run_sync(partial(generate_usage_report.apply_async, (creator_id, period), retry=False))
+    except Exception as exc:
+        logger.warning("Could not queue report %s for creator %s: %s", period, creator_id, exc)
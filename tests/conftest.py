@@ -0,0 +1,118 @@
+"""Test setup: a migrated SQLite database, emptied between tests, and no Redis.
+
+The app modules read their settings at import time, so the environment is set
+here before any of them is imported.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp(prefix="marketplace-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'test.sqlite')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmpdir, "uploads")
+os.environ["METRICS_ENABLED"] = "false"
+os.environ["USAGE_INGEST_MODE"] = "sync"
+for name in ("REDIS_URL", "CACHE_REDIS_URL"):
+    os.environ.pop(name, None)
+
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+import cache  # noqa: E402
+import search  # noqa: E402
+from database import Base, SessionLocal, async_engine, engine  # noqa: E402
+from models import Content, ContentType, PricingModel, User, UserRole  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def migrated_database():
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    command.upgrade(config, "head")
+    yield
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(delete(table))
+    for tiered in cache.caches.values():
+        tiered.local.clear()
+    search.reset_fallback_index()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine on a fresh event loop; pooled async connections are closed afterwards."""
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    # The app's lifespan closes the async engine's connections on exit
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(db):
+    counter = iter(range(1, 1_000_000))
+
+    def make_user(role=UserRole.USER, **fields):
+        n = next(counter)
+        user = User(
+            email=f"user{n}@example.com", username=f"user{n}", hashed_password="!", role=role, **fields
+        )
+        db.add(user)
+        db.commit()
+        return user
+    return make_user
+
+
+@pytest.fixture
+def make_content(db, make_user):
+    creators = []
+
+    def make_content(title="Variant caller", **fields):
+        if "creator_id" not in fields:
+            if not creators:
+                creators.append(make_user(role=UserRole.CREATOR))
+            fields["creator_id"] = creators[0].id
+        fields.setdefault("content_type", ContentType.TOOL)
+        fields.setdefault("pricing_model", PricingModel.FREE)
+        fields.setdefault("is_published", True)
+        content = Content(title=title, **fields)
+        db.add(content)
+        db.commit()
+        return content
+    return make_content
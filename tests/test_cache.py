@@ -0,0 +1,53 @@
+import fakeredis
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(cache, "_redis", client)
+    return client
+
+
+def make_cache():
+    return cache.TieredCache("test", dumps=str.encode, loads=bytes.decode, ttl=60, redis_ttl=300)
+
+
+def test_stale_load_is_not_written_back_after_delete_elsewhere(redis, run):
+    reader, writer = make_cache(), make_cache()  # two API processes sharing Redis
+
+    async def scenario():
+        generation = await reader.generation(1)  # reader misses and starts loading the old value
+        await writer.set(1, "old")
+        await writer.delete(1)  # the value changes and is invalidated meanwhile
+        await reader.set(1, "old", generation=generation)
+        return await redis.get("test:1")
+
+    assert run(scenario()) is None
+    assert reader.local.get(1) is None
+
+
+def test_stale_load_is_not_written_back_after_local_delete(run):
+    principals = make_cache()
+
+    async def scenario():
+        generation = await principals.generation(1)
+        await principals.delete(1)
+        await principals.set(1, "old", generation=generation)
+        return await principals.get(1)
+
+    assert run(scenario()) is None
+
+
+def test_load_after_delete_is_cached(redis, run):
+    reader, writer = make_cache(), make_cache()
+
+    async def scenario():
+        await writer.delete(1)
+        generation = await reader.generation(1)
+        await reader.set(1, "new", generation=generation)
+        return await redis.get("test:1"), await writer.get(1)
+
+    assert run(scenario()) == (b"new", "new")
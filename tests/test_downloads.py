@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+import downloads
+import storage
+
+
+@pytest.fixture
+def accel(monkeypatch, tmp_path):
+    monkeypatch.setattr(downloads, "DOWNLOAD_ACCEL_REDIRECT", "/protected")
+    monkeypatch.setattr(downloads, "download_counter", downloads.DownloadCounter())
+    monkeypatch.setattr(storage, "_storage", storage.LocalStorage(str(tmp_path)))
+
+
+def serve(file_name, run):
+    content = SimpleNamespace(id=1, file_path="sha256/ab/abcdef", file_name=file_name, file_hash="abcdef")
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    return run(downloads.serve(request, content))
+
+
+@pytest.mark.parametrize("file_name, header", [
+    ("reads.fastq", 'attachment; filename="reads.fastq"'),
+    ('say "hi".txt', "attachment; filename*=utf-8''say%20%22hi%22.txt"),
+    ("données €.csv", "attachment; filename*=utf-8''donn%C3%A9es%20%E2%82%AC.csv"),
+])
+def test_accel_redirect_escapes_the_filename(accel, file_name, header, run):
+    response = serve(file_name, run)
+    assert response.headers["X-Accel-Redirect"] == "/protected/sha256/ab/abcdef"
+    assert response.headers["Content-Disposition"] == header
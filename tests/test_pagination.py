@@ -0,0 +1,32 @@
+import pytest
+
+from pagination import NEXT_CURSOR_HEADER, encode_cursor
+
+
+def test_cursor_pages_through_listing(client, make_content):
+    ids = [make_content(title=f"Tool {i}").id for i in range(5)]
+
+    first = client.get("/api/tools/", params={"limit": 3})
+    assert [item["id"] for item in first.json()] == ids[:-4:-1]
+    second = client.get("/api/tools/", params={"limit": 3, "cursor": first.headers[NEXT_CURSOR_HEADER]})
+    assert [item["id"] for item in second.json()] == ids[1::-1]
+    assert NEXT_CURSOR_HEADER not in second.headers
+
+
+@pytest.mark.parametrize("params, values", [
+    ({}, ["7"]),
+    ({}, [True]),
+    ({}, [1.5]),
+    ({}, [2 ** 80]),
+    ({}, [{"id": 1}]),
+    ({}, [1, 2]),
+    ({"sort": "rating"}, ["high", 3]),
+])
+def test_forged_cursor_is_rejected(client, make_content, params, values):
+    make_content()
+    response = client.get("/api/tools/", params={**params, "cursor": encode_cursor(values)})
+    assert response.status_code == 400
+
+
+def test_garbled_cursor_is_rejected(client):
+    assert client.get("/api/tools/", params={"cursor": "not base64!"}).status_code == 400
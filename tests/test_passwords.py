@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import passwords
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = passwords.HashingStats()
+    monkeypatch.setattr(passwords, "stats", stats)
+    return stats
+
+
+def test_cancelled_caller_keeps_the_slot_until_the_work_finishes(stats, monkeypatch, run):
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_WORKERS", 1)
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_MAX_QUEUE", 0)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait(5)
+        return "hash"
+
+    async def scenario():
+        login = asyncio.create_task(passwords._run(slow_hash))
+        await asyncio.to_thread(started.wait, 5)
+        login.cancel()  # the client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await login
+        assert stats.in_flight == 1  # bcrypt is still running in its thread
+        with pytest.raises(HTTPException) as rejected:
+            await passwords._run(slow_hash)
+        release.set()
+        return rejected.value.status_code
+
+    assert run(scenario()) == 503
+    for _ in range(100):
+        if not stats.in_flight:
+            break
+        threading.Event().wait(0.01)
+    assert (stats.in_flight, stats.completed, stats.rejected) == (0, 1, 1)
+
+
+def test_errors_are_not_counted_as_completed(stats, run):
+    def broken():
+        raise ValueError("malformed hash")
+
+    with pytest.raises(ValueError):
+        run(passwords._run(broken))
+    assert (stats.in_flight, stats.completed, stats.failed) == (0, 0, 1)
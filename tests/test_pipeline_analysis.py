@@ -0,0 +1,162 @@
+import json
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import select
+
+import pipeline_analysis
+from models import PipelineAnalysis
+from pipeline_analysis import AnalysisError
+
+NEXTFLOW = """
+process align {
+    cpus 4
+    memory '8 GB'
+    time '2h'
+}
+process call_variants {
+    cpus 2
+    time '1h'
+}
+process qc {
+    cpus 1
+    time '30m'
+}
+workflow {
+    aligned = align(reads)
+    call_variants(aligned)
+    qc(reads)
+}
+"""
+
+
+def analyze(text, file_format, requirements=None):
+    return pipeline_analysis.analyze_workflow(text, file_format, requirements or {}, {})
+
+
+def test_schedule_follows_the_critical_path():
+    steps, edges = pipeline_analysis.parse_workflow(NEXTFLOW, "nextflow")
+    assert edges == {("align", "call_variants")}
+
+    analysis = analyze(NEXTFLOW, "nextflow")
+
+    assert analysis["critical_path"] == ["align", "call_variants"]
+    assert analysis["runtime_seconds"] == 3 * 3600
+    assert analysis["peak_parallelism"] == 2
+    assert analysis["peak_cpus"] == 5
+
+
+def test_command_line_tool_is_a_single_step():
+    tool = {
+        "cwlVersion": "v1.2",
+        "class": "CommandLineTool",
+        "id": "#bwa_mem",
+        "baseCommand": ["bwa", "mem"],
+        "requirements": [{"class": "ResourceRequirement", "coresMin": 8, "ramMin": 16384}],
+    }
+    yaml_tool = "cwlVersion: v1.2\nclass: CommandLineTool\nid: bwa_mem\nrequirements:\n  ResourceRequirement:\n    coresMin: 8\n    ramMin: 16384\n"
+
+    for text in (json.dumps(tool), yaml_tool):
+        analysis = analyze(text, "cwl")
+        assert analysis["step_count"] == 1
+        assert analysis["critical_path"] == ["bwa_mem"]
+        assert analysis["peak_cpus"] == 8
+        assert analysis["peak_memory_gb"] == 16
+
+
+@pytest.mark.parametrize("text, file_format", [
+    ('{"class": "Workflow", "steps": [', "cwl"),
+    ('{"class": "Workflow", "steps": []}', "cwl"),
+    ("cwlVersion: v1.2\nclass: Workflow\ninputs: []\n", "cwl"),
+    ("params.reads = 'data/*.fq'\n", "nextflow"),
+    (json.dumps({"class": "Workflow", "steps": [
+        {"id": "align", "requirements": [{"class": "ResourceRequirement", "coresMin": "many"}]},
+    ]}), "cwl"),
+    ("a", "snakemake"),
+])
+def test_unanalyzable_workflows_raise_analysis_error(text, file_format):
+    with pytest.raises(AnalysisError):
+        analyze(text, file_format)
+
+
+def test_bad_requirements_raise_analysis_error():
+    with pytest.raises(AnalysisError):
+        analyze(NEXTFLOW, "nextflow", {"steps": {"qc": {"runtime_minutes": "soon"}}})
+
+
+@pytest.fixture
+def workflow(tmp_path, make_content, monkeypatch):
+    import tasks
+
+    enqueued = []
+
+    async def enqueue_analysis(pipeline_id):
+        enqueued.append(pipeline_id)
+    monkeypatch.setattr(tasks, "enqueue_analysis", enqueue_analysis)
+
+    def workflow(text=NEXTFLOW):
+        path = tmp_path / "main.nf"
+        path.write_text(text)
+        content = make_content(
+            file_path=str(path), file_hash="f" * 64, file_metadata={"format": "nextflow"}, processing_status="ready"
+        )
+        return content.id, enqueued
+    return workflow
+
+
+def test_analysis_is_enqueued_once_while_pending(client, workflow, monkeypatch):
+    import tasks
+
+    pipeline_id, enqueued = workflow()
+    url = f"/api/pipelines/{pipeline_id}/analysis"
+
+    for _ in range(3):
+        response = client.get(url)
+        assert response.status_code == 202
+        assert response.json() == {"status": "pending"}
+    assert enqueued == [pipeline_id]
+
+    # A worker that never reported back is asked again after the pending window
+    monkeypatch.setattr(pipeline_analysis, "PIPELINE_ANALYSIS_PENDING", timedelta(0))
+    assert client.get(url).status_code == 202
+    assert enqueued == [pipeline_id] * 2
+
+    tasks.analyze_pipeline(pipeline_id)
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["critical_path"] == ["align", "call_variants"]
+    assert len(enqueued) == 2
+
+
+def test_stale_analysis_is_served_and_refreshed_once(client, workflow, monkeypatch):
+    import tasks
+
+    pipeline_id, enqueued = workflow()
+    tasks.analyze_pipeline(pipeline_id)
+    monkeypatch.setattr(pipeline_analysis, "PIPELINE_ANALYSIS_TTL", timedelta(0))
+
+    for _ in range(3):
+        response = client.get(f"/api/pipelines/{pipeline_id}/analysis")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+    assert enqueued == [pipeline_id]
+
+
+def test_failed_analysis_is_recorded_and_not_retried(client, workflow, db):
+    import tasks
+
+    pipeline_id, enqueued = workflow("params.reads = 'data/*.fq'\n")
+    url = f"/api/pipelines/{pipeline_id}/analysis"
+    assert client.get(url).status_code == 202
+
+    assert tasks.analyze_pipeline(pipeline_id) is None
+
+    for _ in range(3):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json()["status"] == "failed"
+        assert "no processes" in response.json()["error"]
+    assert enqueued == [pipeline_id]
+    stored = db.scalars(select(PipelineAnalysis)).one()
+    assert (stored.status, stored.analysis, stored.requested_at) == ("failed", None, None)
@@ -0,0 +1,63 @@
+import gzip
+import io
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+import processing
+from models import Content
+
+FASTA = b">chr1\nACGTACGT\n>chr2\nGGCC\n"
+
+
+@pytest.mark.parametrize("data", [
+    gzip.compress(FASTA)[:20],  # truncated
+    gzip.compress(FASTA)[:10] + b"\xff" * 20,  # corrupt deflate data
+])
+def test_malformed_gzip_is_a_processing_error(data):
+    with pytest.raises(processing.ProcessingError):
+        processing.analyze_stream(io.BytesIO(data), "reads.fa.gz")
+
+
+@pytest.fixture
+def upload(db, make_content, tmp_path):
+    def upload(data, processing_status="pending"):
+        path = tmp_path / "reads.fa.gz"
+        path.write_bytes(data)
+        return make_content(
+            file_path=str(path), file_name=path.name, processing_status=processing_status, is_published=False
+        )
+    return upload
+
+
+def test_corrupt_file_is_marked_failed(db, upload):
+    content = upload(gzip.compress(FASTA)[:10] + b"\xff" * 20)
+    assert processing.process_content(db, content.id) == "failed"
+    db.refresh(content)
+    assert content.processing_status == "failed"
+
+
+def test_content_being_processed_is_not_claimed_again(db, upload):
+    content = upload(gzip.compress(FASTA), processing_status="processing")
+    db.execute(update(Content).values(updated_at=datetime.now(timezone.utc)))
+    db.commit()
+    assert processing.process_content(db, content.id) == "processing"
+
+    stalled = datetime.now(timezone.utc) - processing.PROCESSING_STALLED_AFTER - timedelta(minutes=1)
+    db.execute(update(Content).values(updated_at=stalled))
+    db.commit()
+    assert processing.process_content(db, content.id) == "ready"
+
+
+def test_transient_error_releases_the_claim(db, upload, monkeypatch):
+    content = upload(gzip.compress(FASTA))
+
+    def unreachable(*args, **kwargs):
+        raise OSError("storage unreachable")
+    monkeypatch.setattr(processing, "analyze_stream", unreachable)
+
+    with pytest.raises(OSError):
+        processing.process_content(db, content.id)
+    db.refresh(content)
+    assert content.processing_status == "pending"
@@ -0,0 +1,82 @@
+"""SQL statements per catalogue request must not grow with the page size (no N+1 queries)."""
+import pytest
+from sqlalchemy import event
+
+from database import async_engine
+from models import ContentType, CreatorProfile, Review, TrendingScore, UserRole
+
+PAGE = 12
+
+# (method, path, params or JSON body, most statements allowed per request)
+ENDPOINTS = [
+    ("GET", "/api/tools/", {"limit": PAGE}, 1),
+    ("GET", "/api/tools/", {"limit": PAGE, "sort": "rating"}, 1),
+    ("GET", "/api/pipelines/", {"limit": PAGE}, 1),
+    ("GET", "/api/data/", {"limit": PAGE}, 1),
+    ("GET", "/api/tools/{tool}", None, 1),
+    # The pipeline and dataset routes list and look up rows typed as tools
+    ("GET", "/api/pipelines/{tool}", None, 1),
+    ("GET", "/api/data/{tool}", None, 1),
+    ("GET", "/api/marketplace/featured", None, 1),
+    ("GET", "/api/marketplace/trending", {"window": "7d"}, 1),
+    ("GET", "/api/marketplace/search", {"q": "caller", "limit": PAGE}, 2),
+    ("GET", "/api/marketplace/search", {"q": "caller", "limit": PAGE, "include_facets": True}, 3),
+    ("POST", "/api/marketplace/content/batch", "ids", 1),
+    ("GET", "/api/marketplace/content/{tool}/reviews", {"limit": PAGE}, 1),
+    ("GET", "/api/creators/", {"limit": PAGE}, 1),
+]
+
+
+@pytest.fixture
+def catalogue(db, make_user, make_content):
+    """Enough of every kind of content, from several creators, to fill a page twice over."""
+    creators = [make_user(role=UserRole.CREATOR) for _ in range(PAGE)]
+    reviewers = [make_user() for _ in range(PAGE * 2)]
+    ids = {content_type: [] for content_type in ContentType}
+    for i in range(PAGE * 2):
+        for content_type in ContentType:
+            content = make_content(
+                title=f"Variant caller {i}",
+                content_type=content_type,
+                creator_id=creators[i % len(creators)].id,
+                tags=["gatk", f"tag{i}"],
+                category="genomics",
+                is_featured=i < 10,
+            )
+            ids[content_type].append(content.id)
+    tool = ids[ContentType.TOOL][0]
+    db.add_all(Review(content_id=tool, user_id=reviewer.id, rating=4) for reviewer in reviewers)
+    db.add_all(
+        TrendingScore(window="7d", content_id=content_id, content_type=ContentType.TOOL, usage_count=1, score=rank)
+        for rank, content_id in enumerate(ids[ContentType.TOOL])
+    )
+    db.add_all(CreatorProfile(user_id=creator.id, bio="Genomics tools", research_areas=["genomics"]) for creator in creators)
+    db.commit()
+    return {"tool": tool, "ids": ids[ContentType.TOOL] + ids[ContentType.DATASET]}
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+
+
+@pytest.mark.parametrize("method, path, params, allowed", ENDPOINTS)
+def test_catalogue_statements_per_request(client, catalogue, statements, method, path, params, allowed):
+    url = path.format(**catalogue)
+    if params == "ids":
+        response = client.post(url, json={"ids": catalogue["ids"]})
+    else:
+        response = client.request(method, url, params=params)
+    assert response.status_code == 200, response.text
+
+    body = response.json()
+    items = body.get("items", [body]) if isinstance(body, dict) else body
+    assert items
+    assert len(statements) <= allowed, "\n\n".join(statements)
@@ -0,0 +1,158 @@
+"""The API's hot queries must be served by the indexes meant for them.
+
+Every endpoint in ``ENDPOINTS`` is called in-process and each SELECT it sends
+is EXPLAINed with the same parameters on the same connection. On PostgreSQL
+sequential scans are disabled for the EXPLAIN, so a ``Seq Scan`` left in a
+plan means no index can serve the query; on SQLite a ``SCAN`` of a table
+without an index means the same. Point the suite at a PostgreSQL
+``DATABASE_URL`` to check its plans; other backends are skipped.
+"""
+import json
+import re
+
+import pytest
+from sqlalchemy import event
+
+from database import async_engine
+from models import UserRole
+from routes.auth import create_access_token
+
+pytestmark = pytest.mark.skipif(
+    async_engine.dialect.name not in ("sqlite", "postgresql"),
+    reason="query plans are only checked on SQLite and PostgreSQL",
+)
+
+# Tables large enough in production that a full scan is a bug
+CHECKED_TABLES = {
+    "content", "content_tags", "usage_records", "transactions", "reviews", "trending_scores",
+    "content_daily_rollups", "creator_daily_rollups", "content_usage_hourly", "creator_reports",
+}
+
+# (method, path, request options, indexes the plans must use); paths may use {content_id}.
+# An empty set checks only for full scans, for lookups by primary key or unique constraint.
+ENDPOINTS = [
+    ("GET", "/api/tools/", {}, {"ix_content_listing"}),
+    ("GET", "/api/tools/", {"params": {"category": "genomics"}}, {"ix_content_published_category"}),
+    ("GET", "/api/tools/", {"params": {"sort": "rating"}}, {"ix_content_published_type_rating"}),
+    ("GET", "/api/tools/", {"params": {"sort": "rating", "min_rating": 3.5}}, {"ix_content_published_type_rating"}),
+    ("GET", "/api/pipelines/", {}, {"ix_content_listing"}),
+    ("GET", "/api/data/", {"params": {"category": "genomics"}}, {"ix_content_published_category"}),
+    ("GET", "/api/tools/{content_id}", {}, set()),
+    ("GET", "/api/marketplace/featured", {}, {"ix_content_featured"}),
+    # Nothing has trended yet, so these also read the most used content
+    ("GET", "/api/marketplace/trending", {}, {"ix_trending_scores_window_score", "ix_content_published_usage"}),
+    ("GET", "/api/marketplace/trending", {"params": {"content_type": "tool"}},
+     {"ix_trending_scores_window_type_score", "ix_content_published_type_usage"}),
+    ("GET", "/api/marketplace/search", {"params": {"q": "aligner"}}, set()),
+    ("GET", "/api/marketplace/search", {"params": {"q": "aligner", "category": "genomics"}}, set()),
+    ("GET", "/api/marketplace/search", {"params": {"q": "aligner", "tag": ["aligner"], "include_facets": True}}, set()),
+    ("GET", "/api/marketplace/content/{content_id}/reviews", {}, {"ix_reviews_content_id"}),
+    ("POST", "/api/marketplace/content/batch", {"json": {"ids": ["{content_id}", 1, 2]}}, set()),
+    ("GET", "/api/analytics/creator/dashboard", {},
+     {"ix_content_creator", "ix_transactions_creator_created", "ix_usage_records_content_created"}),
+    ("GET", "/api/creators/reports", {}, set()),
+]
+
+# Statements that read a whole table on purpose: the SQLite search fallback
+# builds its in-memory index once per process (see search.py)
+EXPECTED_SCANS = (
+    "SELECT content.id, content.search_document \nFROM content",
+)
+
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?! USING)")
+_SQLITE_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+
+
+class PlanRecorder:
+    def __init__(self, dialect_name: str):
+        self.dialect_name = dialect_name
+        self.plans = []
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith("SELECT"):
+            return
+        if self.dialect_name == "postgresql":
+            cursor.execute("SET enable_seqscan = off")
+            try:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plan = cursor.fetchall()[0][0]
+            finally:
+                cursor.execute("RESET enable_seqscan")
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+        else:
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.plans.append((statement, plan))
+
+
+def _postgresql_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _postgresql_nodes(child)
+
+
+def analyze(dialect_name: str, plan):
+    """Return (full scans of checked tables, indexes used) for one query plan."""
+    scans, indexes = [], set()
+    if dialect_name == "postgresql":
+        for node in _postgresql_nodes(plan[0]["Plan"]):
+            if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in CHECKED_TABLES:
+                scans.append(node["Relation Name"])
+            if "Index Name" in node:
+                indexes.add(node["Index Name"])
+    else:
+        for detail in plan:
+            match = _SQLITE_SCAN.match(detail)
+            if match and match.group(1) in CHECKED_TABLES:
+                scans.append(match.group(1))
+            indexes.update(_SQLITE_INDEX.findall(detail))
+    return scans, indexes
+
+
+def _fill(value, content_id):
+    if isinstance(value, str):
+        return int(content_id) if value == "{content_id}" else value.replace("{content_id}", str(content_id))
+    if isinstance(value, list):
+        return [_fill(item, content_id) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, content_id) for key, item in value.items()}
+    return value
+
+
+@pytest.fixture
+def creator(client, make_user):
+    user = make_user(role=UserRole.CREATOR)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+    tool = client.post("/api/tools/", json={
+        "title": "Query plan aligner", "content_type": "tool", "category": "genomics", "tags": ["aligner"],
+    }, headers=headers)
+    assert tool.status_code == 200, tool.text
+    return headers, tool.json()["id"]
+
+
+@pytest.fixture
+def recorder():
+    recorder = PlanRecorder(async_engine.dialect.name)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", recorder.before_cursor_execute)
+    yield recorder
+    event.remove(async_engine.sync_engine, "before_cursor_execute", recorder.before_cursor_execute)
+
+
+@pytest.mark.parametrize("method, path, options, expected", ENDPOINTS)
+def test_queries_use_their_indexes(client, creator, recorder, method, path, options, expected):
+    headers, content_id = creator
+    recorder.plans.clear()
+    response = client.request(method, _fill(path, content_id), headers=headers, **_fill(options, content_id))
+    assert response.status_code == 200, response.text
+
+    used = set()
+    checked = [
+        (statement, plan) for statement, plan in recorder.plans
+        if any(f" {table}" in statement for table in CHECKED_TABLES) and statement.strip() not in EXPECTED_SCANS
+    ]
+    assert checked
+    for statement, plan in checked:
+        scans, indexes = analyze(recorder.dialect_name, plan)
+        assert not scans, f"full scan on {', '.join(scans)}:\n{statement}\n{plan}"
+        used |= indexes
+    assert expected <= used, f"planner used {sorted(used)}"
@@ -0,0 +1,116 @@
+import asyncio
+import gzip
+import os
+import subprocess
+import sys
+import textwrap
+
+import fakeredis
+import pytest
+from sqlalchemy import insert
+
+import ratings
+import response_cache
+import usage_ingest
+from database import AsyncSessionLocal
+from models import Content, Review
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def version(monkeypatch):
+    version = response_cache.CatalogueVersion()
+    monkeypatch.setattr(response_cache, "catalogue_version", version)
+    return version
+
+
+def test_async_commit_publishes_version_without_the_sync_client(version, make_content, monkeypatch, run):
+    content = make_content()
+    version.value = 0
+    redis = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(response_cache, "CACHE_REDIS_URL", "redis://cache")
+    monkeypatch.setattr(response_cache, "get_redis", lambda: redis)
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            (await db.get(Content, content.id)).title = "Renamed"
+            await db.commit()
+        assert version.value == 1  # bumped locally at once
+        await asyncio.gather(*version._publishing)
+        return await redis.get(response_cache.CATALOGUE_VERSION_KEY)
+
+    assert run(scenario()) == b"1"
+    assert version._sync_redis is None
+
+
+def test_rating_listing_is_not_served_stale_after_reconcile(client, db, make_content, make_user):
+    low, high = make_content(title="Low"), make_content(title="High")
+    first = client.get("/api/tools/", params={"sort": "rating"})
+    assert first.headers["X-Cache"] == "MISS"
+
+    reviewer = make_user()
+    db.execute(insert(Review), [
+        {"content_id": high.id, "user_id": reviewer.id, "rating": 5},
+        {"content_id": low.id, "user_id": reviewer.id, "rating": 1},
+    ])
+    db.commit()
+    ratings.reconcile_ratings(db)
+
+    second = client.get("/api/tools/", params={"sort": "rating"})
+    assert second.headers["X-Cache"] == "MISS"
+    assert [item["id"] for item in second.json()] == [high.id, low.id]
+
+
+def test_counter_updates_bump_at_most_once_per_ttl(version, make_content, make_user, run):
+    content, user = make_content(), make_user()
+    version.value, version._bumped_at = 0, 0.0
+    event_ids = iter(range(10))
+
+    async def use():
+        async with AsyncSessionLocal() as db:
+            await usage_ingest.write_usage_events(db, [{
+                "event_id": f"event-{next(event_ids)}",
+                "user_id": user.id, "content_id": content.id, "usage_type": "execution", "cost": 0.0,
+                "meta_data": {}, "created_at": usage_ingest.datetime.now(usage_ingest.timezone.utc),
+            }])
+
+    run(use())
+    assert version.value == 1
+    run(use())
+    assert version.value == 1  # within the TTL: deferred
+
+    version._bumped_at -= response_cache.RESPONSE_CACHE_TTL
+    assert run(version.current()) == 2
+    assert run(version.current()) == 2
+
+
+WORKER = textwrap.dedent("""
+    import sys
+
+    import fakeredis
+    import redis
+
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = lambda *args, **kwargs: fakeredis.FakeRedis(server=server)
+
+    import tasks
+
+    assert "main" not in sys.modules
+    assert tasks.process_tool_upload(int(sys.argv[1])) == "ready"
+    print(int(fakeredis.FakeRedis(server=server).get("catalogue:version") or 0))
+""")
+
+
+def test_worker_commits_bump_the_catalogue_version(make_content, tmp_path):
+    """A Celery worker imports tasks, not the app, and must still publish catalogue changes."""
+    path = tmp_path / "reads.fa.gz"
+    path.write_bytes(gzip.compress(b">chr1\nACGT\n"))
+    content = make_content(file_path=str(path), file_name=path.name, processing_status="pending", is_published=False)
+
+    worker = subprocess.run(
+        [sys.executable, "-c", WORKER, str(content.id)], capture_output=True, text=True, timeout=60,
+        env={**os.environ, "CACHE_REDIS_URL": "redis://cache"}, cwd=ROOT,
+    )
+    assert worker.returncode == 0, worker.stderr
+    assert int(worker.stdout.split()[-1]) >= 1
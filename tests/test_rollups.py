@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select, update
+
+import rollups
+from models import ContentDailyRollup, CreatorDailyRollup, RollupCheckpoint, Transaction, UsageRecord, UserRole
+from routes.auth import create_access_token
+
+
+def usage(db, content, *ids):
+    now = datetime.now(timezone.utc)
+    db.execute(insert(UsageRecord), [
+        {"id": usage_id, "content_id": content.id, "usage_type": "execution", "cost": 1.0, "created_at": now}
+        for usage_id in ids
+    ])
+    db.commit()
+
+
+def settle(db):
+    """Pretend ROLLUP_SETTLE_SECONDS passed since the last observation."""
+    db.execute(
+        update(RollupCheckpoint).where(RollupCheckpoint.name.endswith(":observed"))
+        .values(updated_at=datetime.now(timezone.utc) - timedelta(seconds=rollups.ROLLUP_SETTLE_SECONDS + 1))
+    )
+    db.commit()
+
+
+def folded_usage(db):
+    return db.scalar(select(func.coalesce(func.sum(ContentDailyRollup.usage_count), 0)))
+
+
+def test_usage_committed_after_a_higher_id_is_still_folded(db, make_content):
+    content = make_content()
+    usage(db, content, 1, 3)  # id 2 belongs to a transaction that has not committed yet
+
+    assert rollups.fold_daily_usage(db) == 0  # ids 1-3 only observed
+    usage(db, content, 2)
+    settle(db)
+    assert rollups.fold_daily_usage(db) == 3
+    assert folded_usage(db) == 3
+
+
+def test_nothing_is_folded_until_the_observation_settles(db, make_content):
+    content = make_content()
+    usage(db, content, 1)
+    rollups.fold_daily_usage(db)
+    settle(db)
+    usage(db, content, 2)
+
+    assert rollups.fold_daily_usage(db) == 1  # up to what the first run saw
+    assert rollups.fold_daily_usage(db) == 0  # id 2 was seen too recently
+    settle(db)
+    assert rollups.fold_daily_usage(db) == 1
+    assert folded_usage(db) == 2
+
+
+def test_without_settling_everything_visible_is_folded(db, make_content, monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_SETTLE_SECONDS", 0)
+    usage(db, make_content(), 1, 2)
+    assert rollups.fold_daily_usage(db) == 2
+
+
+def transaction(db, creator, id, status, created_at=None):
+    db.execute(insert(Transaction), [{
+        "id": id, "creator_id": creator.id, "amount": 10.0, "creator_earnings": 8.0, "status": status,
+        "created_at": created_at or datetime.now(timezone.utc),
+    }])
+    db.commit()
+
+
+def test_stuck_pending_transaction_does_not_freeze_the_rollup(db, make_user, monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_SETTLE_SECONDS", 0)
+    creator = make_user()
+    stuck = datetime.now(timezone.utc) - timedelta(seconds=rollups.ROLLUP_PENDING_WAIT_SECONDS + 60)
+    transaction(db, creator, 1, "pending", created_at=stuck)  # an abandoned checkout
+    transaction(db, creator, 2, "completed")
+    transaction(db, creator, 3, "pending")  # still within the wait: holds the checkpoint
+
+    assert rollups.fold_daily_transactions(db) == 1
+    assert db.get(RollupCheckpoint, "daily_transactions").last_id == 2
+    assert db.scalar(select(func.sum(CreatorDailyRollup.transaction_count))) == 1
+
+    db.execute(update(Transaction).values(status="completed"))
+    db.commit()
+    assert rollups.fold_daily_transactions(db) == 2  # the deferred row and id 3
+    assert rollups.fold_daily_transactions(db) == 0
+    assert db.scalar(select(func.sum(CreatorDailyRollup.transaction_count))) == 3
+
+
+def test_dashboard_counts_transactions_not_folded_yet(client, db, make_user, monkeypatch):
+    monkeypatch.setattr(rollups, "ROLLUP_SETTLE_SECONDS", 0)
+    creator = make_user(role=UserRole.CREATOR)
+    stuck = datetime.now(timezone.utc) - timedelta(seconds=rollups.ROLLUP_PENDING_WAIT_SECONDS + 60)
+    transaction(db, creator, 1, "pending", created_at=stuck)
+    transaction(db, creator, 2, "completed")
+    rollups.fold_daily_transactions(db)
+    transaction(db, creator, 3, "completed")
+    db.execute(update(Transaction).where(Transaction.id == 1).values(status="completed"))
+    db.commit()
+
+    token = create_access_token({"sub": str(creator.id)})
+    dashboard = client.get("/api/analytics/creator/dashboard", headers={"Authorization": f"Bearer {token}"}).json()
+    assert (dashboard["transaction_count"], dashboard["transaction_earnings"]) == (3, 24.0)
@@ -0,0 +1,63 @@
+import asyncio
+
+from sqlalchemy import update
+
+import search
+from database import AsyncSessionLocal
+from models import Content
+
+
+def test_fallback_index_only_sees_committed_writes(db, make_content):
+    search._fallback_index = search.InvertedIndex()
+    kept = make_content(title="Methylation caller")
+
+    db.add(Content(title="Methylation aligner", creator_id=kept.creator_id, content_type=kept.content_type))
+    db.flush()
+    db.rollback()
+    assert [doc_id for doc_id, _ in search._fallback_index.search("methylation")] == [kept.id]
+
+    db.delete(kept)
+    db.flush()
+    db.rollback()
+    assert [doc_id for doc_id, _ in search._fallback_index.search("methylation")] == [kept.id]
+
+    db.delete(db.get(Content, kept.id))
+    db.commit()
+    assert search._fallback_index.search("methylation") == []
+
+
+def test_backfill_fills_missing_search_columns(db, make_content):
+    content = make_content(title="Peak caller", description="ChIP-seq peaks", tags=["macs"], category="epigenomics")
+    other = make_content(title="Read trimmer")
+    db.execute(update(Content).values(search_document=None))
+    db.commit()
+
+    assert search.backfill_search_columns(db, batch_size=1) == 2
+    db.expire_all()
+    assert db.get(Content, content.id).search_document == search.build_document(
+        "Peak caller", "ChIP-seq peaks", ["macs"], "epigenomics"
+    )
+    assert db.get(Content, other.id).search_document == "read trimmer"
+    assert search.backfill_search_columns(db) == 0
+
+
+def test_fallback_index_is_built_once(make_content, monkeypatch, run):
+    make_content(title="Genome assembler")
+    builds = []
+
+    class CountingIndex(search.InvertedIndex):
+        def __init__(self):
+            builds.append(self)
+            super().__init__()
+
+    monkeypatch.setattr(search, "InvertedIndex", CountingIndex)
+
+    async def first_searches():
+        async def load():
+            async with AsyncSessionLocal() as db:
+                return await search._get_fallback_index(db)
+        return await asyncio.gather(*(load() for _ in range(5)))
+
+    indexes = run(first_searches())
+    assert len(builds) == 1
+    assert all(index is builds[0] for index in indexes)
@@ -0,0 +1,30 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+import storage
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="blobs")
+        yield storage.S3Storage("blobs", prefix="content/")
+
+
+def test_s3_put_exists_open_delete(s3, tmp_path):
+    source = tmp_path / "upload"
+    source.write_bytes(b"ACGT" * 1024)
+
+    assert not s3.exists("ab/abcdef")
+    s3.put(str(source), "ab/abcdef")
+    assert not source.exists()  # moved into the store, like LocalStorage
+    assert s3.exists("ab/abcdef")
+    assert s3.open("ab/abcdef").read() == b"ACGT" * 1024
+    assert boto3.client("s3").head_object(Bucket="blobs", Key="content/ab/abcdef")["ContentLength"] == 4096
+
+    s3.delete("ab/abcdef")
+    assert not s3.exists("ab/abcdef")
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import inspect
+
+import pytest
+from sqlalchemy import select
+from starlette.requests import Request
+
+import chunked_uploads
+import storage
+from database import AsyncSessionLocal, async_engine
+from models import StorageBlob
+from routes.auth import create_access_token
+
+CHUNK = chunked_uploads.UPLOAD_MIN_CHUNK_SIZE
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user()
+
+
+@pytest.fixture
+def auth(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+
+def part_request(body: bytes, on_receive=None, content_length=None) -> Request:
+    """A request streaming ``body`` in a few messages; ``on_receive`` runs (or is awaited) before each one."""
+    messages = [body[i:i + len(body) // 4 + 1] for i in range(0, len(body), len(body) // 4 + 1)]
+    headers = [(b"content-length", str(len(body) if content_length is None else content_length).encode())]
+
+    async def receive():
+        if on_receive and inspect.isawaitable(result := on_receive()):
+            await result
+        data = messages.pop(0)
+        return {"type": "http.request", "body": data, "more_body": bool(messages)}
+
+    return Request({"type": "http", "method": "PUT", "path": "/", "headers": headers}, receive)
+
+
+def test_no_connection_is_held_while_a_part_streams(user, run):
+    body = b"x" * CHUNK
+    checked_out = []
+
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            upload = await chunked_uploads.create_upload(db, user.id, "reads.fastq", CHUNK * 2, CHUNK)
+            upload = await chunked_uploads.get_upload(db, upload.id, user.id)
+            request = part_request(body, on_receive=lambda: checked_out.append(async_engine.pool.checkedout()))
+            await chunked_uploads.write_part(db, upload, 0, request, hashlib.sha256(body).hexdigest())
+        async with AsyncSessionLocal() as db:
+            return chunked_uploads.describe(await chunked_uploads.get_upload(db, upload.id, user.id))
+
+    assert run(scenario())["received_parts"] == [0]
+    assert checked_out and not any(checked_out)
+
+
+@pytest.mark.parametrize("content_length", ["abc", "-1", "1e6", " 10"])
+def test_malformed_content_length_is_rejected(client, auth, content_length):
+    upload = client.post(
+        "/api/uploads/", json={"filename": "reads.fastq", "size": CHUNK, "chunk_size": CHUNK}, headers=auth
+    ).json()
+    response = client.put(
+        f"/api/uploads/{upload['id']}/parts/0",
+        content=b"x" * CHUNK,
+        headers={**auth, "Content-Length": content_length, "X-Chunk-SHA256": "0" * 64},
+    )
+    assert response.status_code == 400
+
+
+async def send(user_id, upload_id, part_number, body, on_receive=None):
+    async with AsyncSessionLocal() as db:
+        upload = await chunked_uploads.get_upload(db, upload_id, user_id)
+        request = part_request(body, on_receive=on_receive)
+        await chunked_uploads.write_part(db, upload, part_number, request, hashlib.sha256(body).hexdigest())
+
+
+async def complete(user_id, upload_id):
+    async with AsyncSessionLocal() as db:
+        upload = await chunked_uploads.get_upload(db, upload_id, user_id)
+        return (await chunked_uploads.complete_upload(db, upload)).sha256
+
+
+@pytest.fixture
+def upload(user, run, tmp_path, monkeypatch):
+    monkeypatch.setattr(chunked_uploads, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(storage, "_storage", storage.LocalStorage(str(tmp_path / "blobs")))
+
+    async def create():
+        async with AsyncSessionLocal() as db:
+            return (await chunked_uploads.create_upload(db, user.id, "reads.fastq", CHUNK * 2, CHUNK)).id
+
+    return run(create())
+
+
+def test_part_resent_on_another_process_is_hashed_again(user, upload, run):
+    first, second, resent = b"a" * CHUNK, b"b" * CHUNK, b"c" * CHUNK
+
+    async def scenario():
+        await send(user.id, upload, 0, first)
+        await send(user.id, upload, 1, second)
+        # Another process receives part 0 again; this process's running hash knows nothing of it
+        state = chunked_uploads._file_hashes.get(upload)
+        chunked_uploads._file_hashes.delete(upload)
+        await send(user.id, upload, 0, resent)
+        chunked_uploads._file_hashes.set(upload, state)
+        return await complete(user.id, upload)
+
+    assert run(scenario()) == hashlib.sha256(resent + second).hexdigest()
+
+
+def test_hash_state_changed_while_a_part_streams_is_not_overwritten(user, upload, run):
+    body = b"a" * CHUNK
+
+    def replaced():
+        chunked_uploads._file_hashes.set(upload, (hashlib.sha256(b"other"), 1, ("other",)))
+
+    run(send(user.id, upload, 0, body, on_receive=replaced))
+    assert chunked_uploads._file_hashes.get(upload)[2] == ("other",)
+
+
+def test_same_part_cannot_stream_twice_at_once(user, upload, run):
+    body = b"a" * CHUNK
+
+    async def scenario():
+        streaming, resent = asyncio.Event(), asyncio.Event()
+
+        async def hold():
+            streaming.set()
+            await resent.wait()
+
+        first = asyncio.create_task(send(user.id, upload, 0, body, on_receive=hold))
+        await streaming.wait()
+        try:
+            await send(user.id, upload, 0, body)
+        except chunked_uploads.HTTPException as exc:
+            return exc.status_code
+        finally:
+            resent.set()
+            await first
+
+    assert run(scenario()) == 409
+
+
+def test_concurrency_cap_holds_while_parts_start(user, upload, monkeypatch, run):
+    monkeypatch.setattr(chunked_uploads, "UPLOAD_MAX_CONCURRENT_PARTS", 1)
+    body = b"a" * CHUNK
+
+    async def scenario():
+        async with AsyncSessionLocal() as first_db, AsyncSessionLocal() as second_db:
+            parts = [
+                chunked_uploads.write_part(
+                    db, await chunked_uploads.get_upload(db, upload, user.id), n, part_request(body),
+                    hashlib.sha256(body).hexdigest(),
+                )
+                for n, db in enumerate((first_db, second_db))
+            ]
+            return await asyncio.gather(*parts, return_exceptions=True)
+
+    first, second = run(scenario())
+    assert first is None
+    assert second.status_code == 503
+    assert chunked_uploads._active_parts == 0
+
+
+def test_concurrent_completes_store_the_blob_once(user, upload, db, run):
+    body = b"a" * CHUNK
+
+    async def scenario():
+        await send(user.id, upload, 0, body)
+        await send(user.id, upload, 1, body)
+        return await asyncio.gather(complete(user.id, upload), complete(user.id, upload), return_exceptions=True)
+
+    results = run(scenario())
+    assert sorted(map(type, results), key=str) == sorted([str, chunked_uploads.HTTPException], key=str)
+    assert db.scalar(select(StorageBlob.ref_count)) == 1
+
+
+def test_completed_upload_is_attached_once(user, upload, run):
+    body = b"a" * CHUNK
+
+    async def attach():
+        async with AsyncSessionLocal() as db:
+            await chunked_uploads.attach_upload(db, upload, user.id)
+            await db.commit()
+
+    async def scenario():
+        await send(user.id, upload, 0, body)
+        await send(user.id, upload, 1, body)
+        await complete(user.id, upload)
+        return await asyncio.gather(attach(), attach(), return_exceptions=True)
+
+    results = run(scenario())
+    assert results.count(None) == 1
+    assert [exc.status_code for exc in results if exc is not None] == [409]
@@ -0,0 +1,144 @@
+import fakeredis
+import pytest
+from sqlalchemy import func, select
+
+import usage_ingest
+from database import AsyncSessionLocal
+from models import Content, UsageRecord
+from usage_ingest import UsageIngestor
+
+
+@pytest.fixture
+def content(make_content, make_user):
+    return make_content(), make_user()
+
+
+def stored(db, content_id):
+    db.expire_all()
+    records = db.scalar(select(func.count(UsageRecord.id)).where(UsageRecord.content_id == content_id))
+    return records, db.get(Content, content_id).usage_count
+
+
+async def record(ingestor, user, content, n=1, **meta_data):
+    async with AsyncSessionLocal() as db:
+        for _ in range(n):
+            await ingestor.record(db, user.id, content.id, "execution", 0.0, meta_data)
+
+
+def test_memory_mode_writes_buffered_events_on_stop(db, content, run):
+    content, user = content
+    ingestor = UsageIngestor("memory")
+
+    async def scenario():
+        await ingestor.start()
+        await record(ingestor, user, content, n=3)
+        assert ingestor.pending == 3
+        await ingestor.stop()
+
+    run(scenario())
+    assert stored(db, content.id) == (3, 3)
+
+
+def test_redelivered_events_are_stored_and_counted_once(db, content, run):
+    content, user = content
+    ingestor = UsageIngestor("memory")
+
+    async def scenario():
+        await record(ingestor, user, content, n=2)
+        events = list(ingestor._buffer)
+        for _ in range(2):
+            async with AsyncSessionLocal() as session:
+                await usage_ingest.write_usage_events(session, events)
+
+    run(scenario())
+    assert stored(db, content.id) == (2, 2)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(UsageIngestor, "_get_redis", lambda self: client)
+    return client
+
+
+def test_stream_events_survive_a_consumer_that_dies_before_committing(db, content, redis, monkeypatch, run):
+    content, user = content
+    crashed, survivor = UsageIngestor("redis"), UsageIngestor("redis")
+    crashed._consumer, survivor._consumer = "crashed", "survivor"
+    monkeypatch.setattr(usage_ingest, "USAGE_CLAIM_IDLE_MS", 0)
+
+    async def scenario():
+        await redis.xgroup_create(usage_ingest.USAGE_STREAM_KEY, usage_ingest.USAGE_STREAM_GROUP, id="0", mkstream=True)
+        await record(crashed, user, content, n=3)
+
+        async def crash(db, events):
+            raise OSError("killed")
+        write_usage_events = usage_ingest.write_usage_events
+        usage_ingest.write_usage_events = crash
+        try:
+            with pytest.raises(OSError):
+                await crashed.flush()
+        finally:
+            usage_ingest.write_usage_events = write_usage_events
+
+        assert await survivor.flush() == 3
+        return await redis.xlen(usage_ingest.USAGE_STREAM_KEY)
+
+    assert run(scenario()) == 0
+    assert stored(db, content.id) == (3, 3)
+
+
+def test_poison_event_is_dead_lettered_after_max_attempts(db, content, monkeypatch, run):
+    content, user = content
+    ingestor = UsageIngestor("memory")
+    monkeypatch.setattr(usage_ingest, "USAGE_MAX_ATTEMPTS", 3)
+
+    async def scenario():
+        await record(ingestor, user, content, n=2)
+        await record(ingestor, user, content, unstorable={1, 2})  # a set is not JSON
+        await record(ingestor, user, content, n=2)
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await ingestor.flush()
+        assert ingestor.pending == 5
+        return await ingestor.flush()
+
+    assert run(scenario()) == 5
+    assert ingestor.pending == 0
+    assert [event["meta_data"] for event in ingestor.dead_letters] == [{"unstorable": {1, 2}}]
+    assert stored(db, content.id) == (4, 4)
+
+
+def test_stream_poison_event_goes_to_dead_letter_list(db, content, redis, monkeypatch, run):
+    content, user = content
+    ingestor = UsageIngestor("redis")
+    monkeypatch.setattr(usage_ingest, "USAGE_MAX_ATTEMPTS", 1)
+
+    async def scenario():
+        await redis.xgroup_create(usage_ingest.USAGE_STREAM_KEY, usage_ingest.USAGE_STREAM_GROUP, id="0", mkstream=True)
+        await record(ingestor, user, content)
+        await redis.xadd(usage_ingest.USAGE_STREAM_KEY, {"event": usage_ingest._encode({
+            "event_id": "poison", "user_id": user.id, "content_id": content.id, "usage_type": "execution",
+            "cost": "not a number", "meta_data": {}, "created_at": usage_ingest.datetime.now(usage_ingest.timezone.utc),
+        })})
+        assert await ingestor.flush() == 2
+        return await redis.lrange(usage_ingest.USAGE_DEAD_LETTER_KEY, 0, -1), await redis.xlen(usage_ingest.USAGE_STREAM_KEY)
+
+    dead, left = run(scenario())
+    assert [usage_ingest._decode(raw)["event_id"] for raw in dead] == ["poison"]
+    assert left == 0
+    assert stored(db, content.id)[0] == 1
+
+
+def test_full_buffer_does_not_fail_the_request_when_the_flush_fails(content, monkeypatch, run):
+    content, user = content
+    ingestor = UsageIngestor("memory")
+    monkeypatch.setattr(usage_ingest, "USAGE_MAX_BUFFER", 2)
+
+    async def unreachable(db, events):
+        raise OSError("database unreachable")
+    monkeypatch.setattr(usage_ingest, "write_usage_events", unreachable)
+
+    run(record(ingestor, user, content, n=3))
+    assert ingestor.pending == 3
+    assert not ingestor.dead_letters
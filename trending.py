@@ -0,0 +1,78 @@
+"""Windowed trending scores.
+
+``refresh_trending`` folds new usage into hourly buckets (see rollups.py), then
+rebuilds ``trending_scores`` for each window from those buckets, keeping the
+top ``TRENDING_MAX_PER_TYPE`` published items per content type. ``/trending``
+then serves a window with a single indexed read.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import Content, ContentUsageHourly, TrendingScore
+from rollups import fold_usage_hourly
+
+TRENDING_WINDOWS = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+}
+DEFAULT_TRENDING_WINDOW = "30d"
+TRENDING_MAX_PER_TYPE = int(os.getenv("TRENDING_MAX_PER_TYPE", "500"))
+
+
+def _window_scores(db: Session, since: datetime):
+    return db.execute(
+        select(ContentUsageHourly.content_id, Content.content_type, func.sum(ContentUsageHourly.usage_count))
+        .join(Content, Content.id == ContentUsageHourly.content_id)
+        .where(ContentUsageHourly.hour >= since, Content.is_published == True)
+        .group_by(ContentUsageHourly.content_id, Content.content_type)
+    ).all()
+
+
+def refresh_trending(db: Session, now: datetime = None) -> dict:
+    """Bring hourly buckets up to date and rebuild every trending window.
+
+    Returns the number of scored items per window.
+    """
+    now = now or datetime.now(timezone.utc)
+    fold_usage_hourly(db)
+
+    # Buckets older than the longest window can no longer contribute
+    oldest = now - max(TRENDING_WINDOWS.values()) - timedelta(hours=1)
+    db.execute(delete(ContentUsageHourly).where(ContentUsageHourly.hour < oldest))
+
+    scored = {}
+    for window, length in TRENDING_WINDOWS.items():
+        by_type = defaultdict(list)
+        for content_id, content_type, usage_count in _window_scores(db, now - length):
+            by_type[content_type].append((content_id, usage_count))
+
+        rows = []
+        for content_type, items in by_type.items():
+            items.sort(key=lambda item: (-item[1], -item[0]))
+            rows.extend(
+                {
+                    "window": window,
+                    "content_id": content_id,
+                    "content_type": content_type,
+                    "usage_count": usage_count,
+                    "score": float(usage_count),
+                    "updated_at": now,
+                }
+                for content_id, usage_count in items[:TRENDING_MAX_PER_TYPE]
+            )
+
+        # Swap the window in one transaction; readers keep seeing the old scores until commit
+        db.execute(delete(TrendingScore).where(TrendingScore.window == window))
+        if rows:
+            db.execute(insert(TrendingScore), rows)
+        scored[window] = len(rows)
+
+    # Core writes are invisible to the response cache's mapper events
+    db.info["catalogue_changed"] = True
+    db.commit()
+    return scored
@@ -0,0 +1,301 @@
+"""Usage event ingestion for ``POST /api/marketplace/use/{content_id}``.
+
+``USAGE_INGEST_MODE`` selects how events reach the database:
+
+``sync`` (default)
+    Each call inserts its ``UsageRecord`` and bumps ``Content.usage_count`` with
+    an atomic ``usage_count = usage_count + 1`` before responding. Nothing is
+    acknowledged that is not committed.
+
+``memory``
+    Events are appended to an in-process buffer and written every
+    ``USAGE_FLUSH_INTERVAL`` seconds, or as soon as ``USAGE_FLUSH_BATCH`` events
+    are waiting, as one multi-row INSERT plus one ``usage_count + n`` UPDATE per
+    content. Buffered events are flushed on graceful shutdown but are lost if
+    the process crashes, so at most one flush interval of usage is at risk.
+    When the buffer holds ``USAGE_MAX_BUFFER`` events, callers flush inline
+    (backpressure) instead of growing it further; if that flush fails too the
+    event stays buffered and the call still succeeds.
+
+``redis``
+    Events are appended to a Redis stream and consumed through a consumer
+    group, so they survive API restarts and crashes. Entries are acknowledged
+    only after the batch commits; entries left pending by a dead consumer are
+    reclaimed after ``USAGE_CLAIM_IDLE_MS``. Delivery is therefore
+    at-least-once, and every event carries a unique ``event_id`` inserted with
+    ON CONFLICT DO NOTHING so that redelivered events are neither stored nor
+    counted twice. If Redis is unavailable when an event is recorded, it is
+    written synchronously instead.
+
+In both buffered modes a batch that keeps failing (not because the database
+is unreachable, but because of an event it cannot store) is written event by
+event after ``USAGE_MAX_ATTEMPTS`` attempts. Events that still fail are logged
+and set aside as dead letters, in ``UsageIngestor.dead_letters`` or the Redis
+list ``USAGE_DEAD_LETTER_KEY``, so that one bad event cannot hold up the rest.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal, dialect_insert
+from models import Content, UsageRecord
+
+logger = logging.getLogger(__name__)
+
+USAGE_INGEST_MODE = os.getenv("USAGE_INGEST_MODE", "sync")
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "1.0"))
+USAGE_FLUSH_BATCH = int(os.getenv("USAGE_FLUSH_BATCH", "500"))
+USAGE_MAX_BUFFER = int(os.getenv("USAGE_MAX_BUFFER", "10000"))
+USAGE_STREAM_KEY = os.getenv("USAGE_STREAM_KEY", "usage:events")
+USAGE_STREAM_GROUP = os.getenv("USAGE_STREAM_GROUP", "usage-ingest")
+USAGE_CLAIM_IDLE_MS = int(os.getenv("USAGE_CLAIM_IDLE_MS", "60000"))
+USAGE_MAX_ATTEMPTS = int(os.getenv("USAGE_MAX_ATTEMPTS", "5"))
+USAGE_DEAD_LETTER_KEY = os.getenv("USAGE_DEAD_LETTER_KEY", "usage:dead")
+USAGE_REDIS_TIMEOUT = float(os.getenv("USAGE_REDIS_TIMEOUT", "1.0"))
+
+# The database or the network is down: retry, never dead-letter
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, OSError)
+
+content_table = Content.__table__
+
+_increment_usage = (
+    update(content_table)
+    .where(content_table.c.id == bindparam("b_content_id"))
+    .values(usage_count=content_table.c.usage_count + bindparam("b_count"))
+)
+
+
+async def write_usage_events(db: AsyncSession, events):
+    """Store a batch of usage events and bump usage counts for what was actually inserted."""
+    if not events:
+        return
+
+    # Events already stored (redelivered from the stream) are skipped, not counted again
+    insert = dialect_insert(db.bind.dialect.name)
+    stmt = insert(UsageRecord).on_conflict_do_nothing(index_elements=["event_id"]).returning(UsageRecord.content_id)
+    inserted = (await db.execute(stmt, events)).scalars().all()
+
+    counts = Counter(inserted)
+    if counts:
+        await db.execute(
+            _increment_usage,
+            [{"b_content_id": content_id, "b_count": n} for content_id, n in counts.items()],
+        )
+        db.info["catalogue_counters_changed"] = True  # see response_cache.py
+    await db.commit()
+
+
+def _encode(event: dict) -> bytes:
+    return json.dumps({**event, "created_at": event["created_at"].isoformat()}).encode()
+
+
+def _decode(raw: bytes) -> dict:
+    event = json.loads(raw)
+    event["created_at"] = datetime.fromisoformat(event["created_at"])
+    return event
+
+
+class UsageIngestor:
+    def __init__(self, mode: str = USAGE_INGEST_MODE):
+        if mode not in ("sync", "memory", "redis"):
+            raise ValueError(f"Unknown USAGE_INGEST_MODE: {mode}")
+        self.mode = mode
+        self._buffer = []
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._redis = None
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._attempts = Counter()  # event_id -> failed writes so far
+        self.dead_letters = deque(maxlen=USAGE_MAX_BUFFER)  # memory mode
+        self.flushed = 0
+        self.flush_failures = 0
+        self.dead_lettered = 0
+
+    async def record(self, db: AsyncSession, user_id: int, content_id: int, usage_type: str, cost: float, meta_data: dict):
+        event = {
+            "event_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "content_id": content_id,
+            "usage_type": usage_type,
+            "cost": cost,
+            "meta_data": meta_data,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+        if self.mode == "memory":
+            self._buffer.append(event)
+            if len(self._buffer) >= USAGE_MAX_BUFFER:
+                try:
+                    await self.flush()
+                except Exception:
+                    # Still buffered; the flush loop keeps retrying
+                    logger.exception("Inline usage flush failed; %d events buffered", self.pending)
+            elif len(self._buffer) >= USAGE_FLUSH_BATCH:
+                self._wake.set()
+            return
+
+        if self.mode == "redis":
+            try:
+                await self._get_redis().xadd(USAGE_STREAM_KEY, {"event": _encode(event)})
+                return
+            except RedisError as exc:
+                logger.warning("Usage stream unavailable, writing synchronously: %s", exc)
+
+        await write_usage_events(db, [event])
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def _get_redis(self):
+        if self._redis is None:
+            self._redis = aioredis.Redis.from_url(
+                os.getenv("REDIS_URL", "redis://localhost:6379"),
+                socket_timeout=USAGE_REDIS_TIMEOUT,
+                socket_connect_timeout=USAGE_REDIS_TIMEOUT,
+            )
+        return self._redis
+
+    async def start(self):
+        if self.mode == "sync" or self._task is not None:
+            return
+        if self.mode == "redis":
+            try:
+                await self._get_redis().xgroup_create(USAGE_STREAM_KEY, USAGE_STREAM_GROUP, id="0", mkstream=True)
+            except ResponseError as exc:
+                if "BUSYGROUP" not in str(exc):
+                    raise
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Drain whatever is still buffered before the process exits
+        try:
+            while await self.flush():
+                pass
+        except Exception:
+            logger.exception("Usage flush failed on shutdown; %d buffered events were not written", self.pending)
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=USAGE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while await self.flush() >= USAGE_FLUSH_BATCH:
+                    pass
+            except Exception:
+                # Keep the loop alive; the events stay buffered or pending in Redis
+                logger.exception("Usage flush failed")
+
+    async def flush(self) -> int:
+        """Write one batch; returns the number of events written."""
+        async with self._flush_lock:
+            if self.mode == "memory":
+                return await self._flush_memory()
+            if self.mode == "redis":
+                return await self._flush_stream()
+            return 0
+
+    async def _flush_memory(self) -> int:
+        batch, self._buffer = self._buffer[:USAGE_FLUSH_BATCH], self._buffer[USAGE_FLUSH_BATCH:]
+        if not batch:
+            return 0
+        try:
+            dead = await self._write_batch(batch)
+        except Exception:
+            # Put the batch back at the front so ordering is kept and nothing is dropped
+            self._buffer[:0] = batch
+            raise
+        self.dead_letters.extend(dead)
+        return len(batch)
+
+    async def _flush_stream(self) -> int:
+        client = self._get_redis()
+        # Take over entries a crashed consumer read but never acknowledged
+        _, entries, _ = await client.xautoclaim(
+            USAGE_STREAM_KEY, USAGE_STREAM_GROUP, self._consumer,
+            min_idle_time=USAGE_CLAIM_IDLE_MS, count=USAGE_FLUSH_BATCH,
+        )
+        if not entries:
+            response = await client.xreadgroup(
+                USAGE_STREAM_GROUP, self._consumer, {USAGE_STREAM_KEY: ">"}, count=USAGE_FLUSH_BATCH
+            )
+            entries = response[0][1] if response else []
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        if not entries:
+            return 0
+
+        events = [_decode(fields[b"event"]) for _, fields in entries]
+        dead = await self._write_batch(events)
+        if dead:
+            await client.rpush(USAGE_DEAD_LETTER_KEY, *(_encode(event) for event in dead))
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        await client.xack(USAGE_STREAM_KEY, USAGE_STREAM_GROUP, *entry_ids)
+        await client.xdel(USAGE_STREAM_KEY, *entry_ids)
+        return len(entries)
+
+    async def _write_batch(self, events) -> list:
+        """Write a batch; returns the events given up on. Raises if the batch should be retried."""
+        try:
+            async with AsyncSessionLocal() as db:
+                await write_usage_events(db, events)
+        except Exception as exc:
+            self.flush_failures += 1
+            if isinstance(exc, TRANSIENT_ERRORS):
+                raise
+            self._attempts.update(event["event_id"] for event in events)
+            if max(self._attempts[event["event_id"]] for event in events) < USAGE_MAX_ATTEMPTS:
+                raise
+            logger.warning("Usage batch of %d events failed %d times; writing them one by one", len(events), USAGE_MAX_ATTEMPTS)
+            return await self._write_each(events)
+        for event in events:
+            self._attempts.pop(event["event_id"], None)
+        self.flushed += len(events)
+        return []
+
+    async def _write_each(self, events) -> list:
+        dead = []
+        for event in events:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await write_usage_events(db, [event])
+            except TRANSIENT_ERRORS:
+                # Events written so far are skipped on retry (event_id is unique)
+                raise
+            except Exception as exc:
+                logger.error("Dead-lettering usage event %s: %s", event, exc)
+                dead.append(event)
+            else:
+                self.flushed += 1
+            self._attempts.pop(event["event_id"], None)
+        self.dead_lettered += len(dead)
+        return dead
+
+
+ingestor = UsageIngestor()